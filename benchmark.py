@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import random
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from time import perf_counter
+from datetime import datetime as dt
+
+# Замеры отрисовки выполняются без окна
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+# Приветствие pygame не смешивается с отчётом в формате JSON в стандартном выводе
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from constants import *
+from level import Level
+from renderers import Renderer, DirtyRenderer
+from spritesheets import AssetCache
+
+# Версия формата результатов. Увеличивается при изменении состава замеров.
+BENCHMARK_VERSION = 2
+
+# Виды синтетических уровней и размеры по умолчанию
+LEVEL_KINDS = ["open", "maze", "hazard", "elements"]
+DEFAULT_SIZES = [15, 25, 50, 100, 200, 500]
+# Наименьший размер синтетического уровня: стены по краям и хотя бы одна клетка внутри
+MIN_LEVEL_SIZE = 3
+
+# Замеры, которые сравниваются между запусками (меньше - лучше)
+METRICS = ["parse_ms", "load_ms", "build_ms", "tick_ms", "render_full_ms", "render_dirty_ms",
+           "bytes_per_tile"]
+# Изменение замера (в долях), начиная с которого оно считается значимым при сравнении
+DEFAULT_THRESHOLD = 0.1
+
+HAZARD_BLOCKS = [LEVEL_BLOCK_LAVA, LEVEL_BLOCK_RIVER, LEVEL_BLOCK_ACID]
+# Элементы, которые расставляются на уровне с большим количеством элементов
+MULTI_ELEMS = [LEVEL_ELEM_RUBY, LEVEL_ELEM_AQUAMARINE, LEVEL_ELEM_DOORBUTTON_1, LEVEL_ELEM_DOORBUTTON_2,
+               LEVEL_ELEM_DOOR_1, LEVEL_ELEM_DOOR_2, LEVEL_ELEM_PORTAL_SWITCH_1, LEVEL_ELEM_PORTAL_SWITCH_2]
+# Ходы игроков при замере тактов симуляции
+MOVE_KEYS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+
+def generate_maze(grid, rnd):
+    """Лабиринт на клетках с нечётными координатами (обход в глубину со случайным выбором соседа)"""
+    height, width = len(grid), len(grid[0])
+    stack = [(1, 1)]
+    grid[1][1] = LEVEL_BLOCK_FLOOR
+    while stack:
+        col, row = stack[-1]
+        neighbours = [(col + dx, row + dy) for dx, dy in [(-2, 0), (2, 0), (0, -2), (0, 2)]
+                      if 0 < col + dx < width - 1 and 0 < row + dy < height - 1 and
+                      grid[row + dy][col + dx] == LEVEL_BLOCK_WALL]
+        if not neighbours:
+            stack.pop()
+            continue
+        next_col, next_row = rnd.choice(neighbours)
+        grid[(row + next_row) // 2][(col + next_col) // 2] = LEVEL_BLOCK_FLOOR
+        grid[next_row][next_col] = LEVEL_BLOCK_FLOOR
+        stack.append((next_col, next_row))
+
+
+def generate_level(kind, size, seed=0):
+    """Синтетический уровень size x size в виде списка строк.
+       Уровень окружён стенами, игроки и выходы расположены в левом верхнем углу."""
+    rnd = random.Random(f"{kind}:{size}:{seed}")
+    grid = [[LEVEL_BLOCK_WALL] * size for _ in range(size)]
+    if kind == "maze":
+        generate_maze(grid, rnd)
+    else:
+        for row in range(1, size - 1):
+            for col in range(1, size - 1):
+                block = LEVEL_BLOCK_FLOOR
+                if kind == "hazard" and rnd.random() < 0.6:
+                    block = rnd.choice(HAZARD_BLOCKS)
+                elif kind == "elements" and rnd.random() < 0.3:
+                    block = rnd.choice(MULTI_ELEMS)
+                grid[row][col] = block
+
+    if kind == "elements" and size >= 8:
+        grid[size - 2][size - 2] = LEVEL_ELEM_INPUT_PORTAL_1
+        grid[size - 2][size - 3] = LEVEL_ELEM_OUTPUT_PORTAL_1
+    # Стартовая площадка игроков
+    for col, row, elem in [(1, 1, LEVEL_PLAYER_FIRE), (2, 1, LEVEL_PLAYER_WATER),
+                           (1, 2, LEVEL_ELEM_FIRE_EXIT), (2, 2, LEVEL_ELEM_WATER_EXIT)]:
+        if col < size - 1 and row < size - 1:
+            grid[row][col] = elem
+    return ["".join(line) for line in grid]
+
+
+def write_level(directory, kind, size, seed=0):
+    """Запись синтетического уровня в файл. Возвращает полный путь к файлу."""
+    filename = os.path.join(directory, f"bench_{kind}_{size}.txt")
+    with open(filename, "w") as f:
+        f.write("\n".join(generate_level(kind, size, seed)) + "\n")
+    return filename
+
+
+def measure(function, repeat):
+    """Медиана времени выполнения функции в миллисекундах"""
+    times = []
+    for _ in range(repeat):
+        start_time = perf_counter()
+        function()
+        times.append((perf_counter() - start_time) * 1000)
+    return statistics.median(times)
+
+
+def measure_ticks(game, ticks, seed=0):
+    """Медиана времени такта симуляции со случайными ходами игроков"""
+    rnd = random.Random(seed)
+    times = []
+    for _ in range(ticks):
+        for player in (game.fire_player, game.water_player):
+            if player is not None and rnd.random() < 0.3:
+                game.pending_moves.append((player, *rnd.choice(MOVE_KEYS)))
+        start_time = perf_counter()
+        game.update()
+        times.append((perf_counter() - start_time) * 1000)
+    return statistics.median(times)
+
+
+def measure_render(game, renderer, frames):
+    """Медиана времени отрисовки кадра заданным способом"""
+    game.set_renderer(renderer)
+    game.display()
+    return measure(game.display, frames)
+
+
+def benchmark_level(game, filename, repeat, ticks):
+    """Замеры для одного уровня"""
+    with open(filename) as f:
+        lines = [line.rstrip() for line in f.read().splitlines()]
+
+    def parse():
+        Level().parse_level(lines)
+
+    result = dict()
+    result["parse_ms"] = measure(parse, repeat)
+    Level(filename)
+    result["load_ms"] = measure(lambda: Level(filename), repeat)
+
+    level = Level(filename)
+    result["width"], result["height"] = level.width, level.height
+    result["tiles"] = sum(1 for line in level.blocks for block in line if block != LEVEL_BLOCK_EMPTY)
+
+    # Память на клетку: объём объектов, созданных для уровня (спрайты, симуляция)
+    game.new_game(filename)
+    game.reset_game()
+    tracemalloc.start()
+    game.new_game(filename)
+    result["bytes_per_tile"] = round(tracemalloc.get_traced_memory()[0] / max(result["tiles"], 1), 1)
+    tracemalloc.stop()
+
+    result["build_ms"] = measure(lambda: game.new_game(filename), repeat)
+    result["sprites"] = len(game.all_sprites)
+    result["render_full_ms"] = measure_render(game, Renderer(game.screen), repeat * 10)
+    result["render_dirty_ms"] = measure_render(game, DirtyRenderer(game.screen), repeat * 10)
+    result["tick_ms"] = measure_ticks(game, ticks)
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in result.items()}
+
+
+def get_commit():
+    """Текущий коммит репозитория, если он доступен"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=CURRENT_DIR or ".",
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(kinds, sizes, repeat=5, ticks=300, output=print):
+    """Замеры для всех сочетаний видов и размеров синтетических уровней"""
+    from game import Game
+
+    game = Game()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in kinds:
+            for size in sizes:
+                filename = write_level(directory, kind, size)
+                result = dict(kind=kind, size=size, **benchmark_level(game, filename, repeat, ticks))
+                output(format_result(result))
+                results.append(result)
+    game.reset_game()
+    return {"version": BENCHMARK_VERSION, "commit": get_commit(), "date": dt.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "pygame": pygame.version.ver,
+            "platform": platform.platform(), "video_driver": pygame.display.get_driver(),
+            "view_size": VIEW_SIZE, "asset_cache": AssetCache.get_stats(),
+            "tile_kinds": AssetCache.get_tile_report(), "results": results}
+
+
+def format_result(result):
+    """Строка с замерами для одного уровня"""
+    return f"{result['kind']:>8} {result['size']:>4} ({result['width']}x{result['height']}): " + \
+        ", ".join(f"{metric} {result[metric]}" for metric in METRICS)
+
+
+def compare(old, new, threshold=DEFAULT_THRESHOLD, output=print):
+    """Сравнение двух запусков. Возвращает количество замеров, которые стали хуже больше чем на threshold."""
+    old_results = {(result["kind"], result["size"]): result for result in old["results"]}
+    regressions = 0
+    output(f"{old.get('commit')} -> {new.get('commit')}")
+    for result in new["results"]:
+        old_result = old_results.get((result["kind"], result["size"]))
+        if old_result is None:
+            continue
+        changes = []
+        for metric in METRICS:
+            old_value, new_value = old_result.get(metric), result.get(metric)
+            if not old_value or new_value is None:
+                continue
+            change = new_value / old_value - 1
+            mark = ""
+            if change > threshold:
+                mark = " SLOWER"
+                regressions += 1
+            elif change < -threshold:
+                mark = " faster"
+            changes.append(f"{metric} {old_value} -> {new_value} ({change:+.0%}){mark}")
+        output(f"{result['kind']:>8} {result['size']:>4}: " + ", ".join(changes))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности на синтетических уровнях")
+    parser.add_argument("--kinds", nargs="+", choices=LEVEL_KINDS, default=LEVEL_KINDS, help="виды уровней")
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="размеры уровней")
+    parser.add_argument("--repeat", type=int, default=5, help="количество повторов каждого замера")
+    parser.add_argument("--ticks", type=int, default=300, help="количество тактов симуляции")
+    parser.add_argument("-o", "--output", help="файл для результатов в формате JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="сравнение двух файлов результатов вместо замеров")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="значимое изменение замера при сравнении (в долях)")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            regressions = compare(json.load(f_old), json.load(f_new), args.threshold)
+        print(f"{regressions} metrics slower by more than {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    if min(args.sizes) < MIN_LEVEL_SIZE:
+        parser.error(f"level size must be at least {MIN_LEVEL_SIZE}")
+
+    report = run_benchmark(args.kinds, args.sizes, args.repeat, args.ticks,
+                           output=lambda line: print(line, file=sys.stderr))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import pygame
+from constants import *
+
+
+class Camera:
+    """Камера: область уровня (в пикселях уровня), которая показывается в области экрана viewport"""
+
+    def __init__(self, viewport):
+        self.viewport = pygame.Rect(viewport)
+        self.rect = pygame.Rect(0, 0, self.viewport.width, self.viewport.height)
+
+    @staticmethod
+    def get_position(center, start, end, size):
+        """Положение камеры по одной оси, при котором center в середине видимой области,
+           а видимая область не выходит за границы уровня start..end"""
+        if end - start <= size:
+            # Уровень помещается целиком: выравнивание по клеткам, как при сдвиге уровня на экране
+            return start - (size // SPRITE_SIZE - (end - start) // SPRITE_SIZE) // 2 * SPRITE_SIZE
+        return min(max(center - size // 2, start), end - size)
+
+    def look_at(self, x, y, bounds):
+        """Перемещение камеры к точке (x, y) в пределах уровня bounds"""
+        self.rect.x = self.get_position(x, bounds.left, bounds.right, self.rect.width)
+        self.rect.y = self.get_position(y, bounds.top, bounds.bottom, self.rect.height)
+
+    def to_screen(self, rect):
+        """Положение области уровня на экране"""
+        return rect.move(self.viewport.x - self.rect.x, self.viewport.y - self.rect.y)
+
+
+class LevelView:
+    """Камеры, через которые уровень показывается на экране.
+       Одна камера следит за серединой между игроками. Если уровень не виден целиком и игроки
+       не помещаются на экране вместе (с отступом VIEW_MARGIN от краёв), экран делится
+       на левую и правую половины со своей камерой у каждого игрока."""
+
+    def __init__(self, screen_rect):
+        screen_rect = pygame.Rect(screen_rect)
+        # Половины экрана разделены полосой фона шириной 2 пикселя
+        half_width = screen_rect.width // 2
+        self.single_cameras = [Camera(screen_rect)]
+        self.split_cameras = [Camera((screen_rect.x, screen_rect.y, half_width - 1, screen_rect.height)),
+                              Camera((screen_rect.x + half_width + 1, screen_rect.y,
+                                      screen_rect.width - half_width - 1, screen_rect.height))]
+        self.cameras = self.single_cameras
+        # Границы уровня в пикселях (с учётом сдвига уровня на экране)
+        self.bounds = pygame.Rect(0, 0, 0, 0)
+
+    def set_bounds(self, bounds):
+        self.bounds = pygame.Rect(bounds)
+        self.cameras = self.single_cameras
+        for camera in self.single_cameras + self.split_cameras:
+            camera.look_at(*self.bounds.topleft, self.bounds)
+
+    def is_split(self):
+        return self.cameras is self.split_cameras
+
+    def follow(self, points):
+        """Перемещение камер к точкам points (центрам игроков)"""
+        if not points:
+            return
+        camera = self.single_cameras[0]
+        camera.look_at(sum(x for x, _ in points) // len(points), sum(y for _, y in points) // len(points),
+                       self.bounds)
+        # Уровень виден целиком или расстояние между игроками позволяет показать их вместе
+        # (у края уровня камера останавливается, и игрок может подойти к краю экрана)
+        xs, ys = [x for x, _ in points], [y for _, y in points]
+        if not SPLIT_VIEW or len(points) != len(self.split_cameras) or camera.rect.contains(self.bounds) or \
+                max(xs) - min(xs) <= camera.rect.width - 2 * VIEW_MARGIN and \
+                max(ys) - min(ys) <= camera.rect.height - 2 * VIEW_MARGIN:
+            self.cameras = self.single_cameras
+            return
+        self.cameras = self.split_cameras
+        for camera, point in zip(self.split_cameras, points):
+            camera.look_at(*point, self.bounds)
+
+    def get_state(self):
+        """Положения камер. Пока они не меняются, фон экрана не перерисовывается."""
+        return tuple((camera.rect.x, camera.rect.y) for camera in self.cameras) + (self.is_split(),)
+
+    def get_rects(self):
+        """Видимые области уровня"""
+        return [camera.rect for camera in self.cameras]
+
+
+class SpriteGrid:
+    """Спрайты элементов, разложенные по участкам уровня BACKGROUND_CHUNK_SIZE x BACKGROUND_CHUNK_SIZE клеток.
+       Обновляются и рисуются только спрайты участков, которые пересекаются с видимой областью,
+       поэтому время кадра не зависит от размера уровня."""
+
+    def __init__(self, col_offset=0, row_offset=0):
+        self.col_offset = col_offset
+        self.row_offset = row_offset
+        # Спрайты участка в порядке добавления (в порядке отрисовки)
+        self.chunks = dict()
+        self.order = dict()
+
+    def add(self, sprite, col, row):
+        self.order[sprite] = len(self.order)
+        self.chunks.setdefault((col // BACKGROUND_CHUNK_SIZE, row // BACKGROUND_CHUNK_SIZE), []).append(sprite)
+
+    def clear(self):
+        self.chunks.clear()
+        self.order.clear()
+
+    def get_chunks(self, rects):
+        """Участки уровня, которые пересекаются с областями rects (в пикселях)"""
+        chunk_pixels = BACKGROUND_CHUNK_SIZE * SPRITE_SIZE
+        chunks = set()
+        for rect in rects:
+            rect = rect.move(-self.col_offset * SPRITE_SIZE, -self.row_offset * SPRITE_SIZE)
+            for chunk_row in range(rect.top // chunk_pixels, (rect.bottom - 1) // chunk_pixels + 1):
+                for chunk_col in range(rect.left // chunk_pixels, (rect.right - 1) // chunk_pixels + 1):
+                    if (chunk_col, chunk_row) in self.chunks:
+                        chunks.add((chunk_col, chunk_row))
+        return chunks
+
+    def get_sprites(self, chunks):
+        """Спрайты участков в порядке отрисовки"""
+        sprites = [sprite for chunk in chunks for sprite in self.chunks.get(chunk, [])]
+        sprites.sort(key=self.order.__getitem__)
+        return sprites
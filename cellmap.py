@@ -0,0 +1,44 @@
+from constants import *
+
+
+class CellMap:
+    """Карта занятости клеток уровня.
+       Для каждой клетки хранится тип блока и список элементов,
+       поэтому проверки при перемещении и взаимодействии выполняются без перебора групп."""
+
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.tiles = [[LEVEL_BLOCK_EMPTY] * width for _ in range(height)]
+        self.elements = dict()
+
+    def cell_on_board(self, col, row):
+        """Проверка на присутствие координат на игровом уровне"""
+        return 0 <= col < self.width and 0 <= row < self.height
+
+    def set_tile(self, col, row, tile):
+        """Установка типа блока в клетке"""
+        self.tiles[row][col] = tile
+
+    def get_tile(self, col, row):
+        """Получение типа блока в клетке (за пределами уровня - пустой блок)"""
+        if not self.cell_on_board(col, row):
+            return LEVEL_BLOCK_EMPTY
+        return self.tiles[row][col]
+
+    def add_element(self, col, row, element):
+        """Добавление элемента в клетку"""
+        if (col, row) not in self.elements:
+            self.elements[(col, row)] = []
+        self.elements[(col, row)].append(element)
+
+    def remove_element(self, col, row, element):
+        """Удаление элемента из клетки"""
+        elements = self.elements.get((col, row))
+        if elements is not None and element in elements:
+            elements.remove(element)
+            if not elements:
+                del self.elements[(col, row)]
+
+    def get_elements(self, col, row):
+        """Получение списка элементов в клетке"""
+        return self.elements.get((col, row), [])
@@ -1,36 +1,104 @@
 import os
-from pygame import Color
 
 SPRITE_SIZE = 32
-MAX_LEVEL_SIZE = 25
+# Размер видимой области уровня в клетках. Уровни меньшего размера показываются по центру экрана,
+# а по большим уровням камера перемещается вслед за игроками.
+VIEW_SIZE = 25
 
 TITLE = 'ОГОНЬ и ВОДА'
-SCREEN_WIDTH = MAX_LEVEL_SIZE * SPRITE_SIZE
-SCREEN_HEIGHT = MAX_LEVEL_SIZE * SPRITE_SIZE
-
-TURBO_MODE = False
-
-FPS = 30 if not TURBO_MODE else 100
-PLAYER_STEP = SPRITE_SIZE // (8 if not TURBO_MODE else 4)
-PLAYER_ANIMATION_DURATION = 70 if not TURBO_MODE else 10
+SCREEN_WIDTH = VIEW_SIZE * SPRITE_SIZE
+SCREEN_HEIGHT = VIEW_SIZE * SPRITE_SIZE
+
+# Частота тактов симуляции (не зависит от частоты отрисовки)
+SIMULATION_FPS = 30
+SIMULATION_TICK_DURATION = 1000 / SIMULATION_FPS
+# Ограничение частоты отрисовки (0 - без ограничения)
+RENDER_FPS = 60
+# Максимальное количество тактов симуляции за кадр.
+# Если компьютер не успевает, то лишнее время отбрасывается.
+MAX_TICKS_PER_FRAME = 30
+# Количество тактов за кадр в режиме без ограничения скорости (перемотка, повтор)
+UNTHROTTLED_TICKS_PER_FRAME = 100
+# Множители скорости игры, которые переключаются клавишей F5
+GAME_SPEEDS = [1, 2, 4]
+
+PLAYER_STEP = SPRITE_SIZE // 8
+# Количество тактов симуляции между шагами игрока
+PLAYER_STEP_TICKS = 3
+
+# Ожидание событий вместо отрисовки кадров, когда в игре ничего не происходит,
+# и таймаут ожидания в миллисекундах
+IDLE_POWER_SAVING = True
+IDLE_EVENT_TIMEOUT = 1000
+
+# Обновление на экране только изменившихся областей вместо всего кадра
+DIRTY_RENDERING = False
+
+# Фон уровня рисуется участками BACKGROUND_CHUNK_SIZE x BACKGROUND_CHUNK_SIZE клеток по мере их появления
+# на экране. В кэше хранится не больше BACKGROUND_CACHE_CHUNKS участков.
+BACKGROUND_CHUNK_SIZE = 8
+BACKGROUND_CACHE_CHUNKS = 128
+# Расстояние от игрока до края видимой области в пикселях, при котором игроки ещё помещаются на экране вместе.
+# Если игроки не помещаются, экран делится на две половины (SPLIT_VIEW), иначе камера следит за серединой между ними.
+VIEW_MARGIN = SPRITE_SIZE * 2
+SPLIT_VIEW = True
+
+# Сохранение разобранных уровней в кэше в двоичном формате для быстрой загрузки
+COMPILED_LEVELS = True
+
+# Замер времени этапов кадра, количество последних кадров для процентилей
+# и сохранение замеров в папку профилей в конце уровня
+FRAME_PROFILING = True
+FRAME_PROFILE_WINDOW = 1800
+FRAME_PROFILE_DUMP = False
+# Кадр считается пропущенным, если он длился дольше, чем FRAME_DROP_FACTOR длительностей кадра
+FRAME_DROP_FACTOR = 1.5
+# Интервал обновления наложения со статистикой (клавиша F3) в миллисекундах
+PROFILE_OVERLAY_INTERVAL = 500
+
+# Запись ввода игроков в файл повтора для каждой попытки (по умолчанию выключена,
+# включается также параметром --record игры) и количество хранимых файлов повторов
+REPLAY_RECORDING = False
+REPLAY_MAX_FILES = 100
+
+# Отмена ходов (Backspace) по снимкам состояния. Ключевые кадры при воспроизведении повтора
+# сохраняются через REPLAY_KEYFRAME_STEPS тактов, перемотка (Left/Right) - на REPLAY_SEEK_STEPS тактов.
+UNDO_ENABLED = True
+REPLAY_KEYFRAME_STEPS = 150
+REPLAY_SEEK_STEPS = 150
+
+# Шрифт надписей и размеры кэша шрифтов и отрисованных надписей
+FONT_NAME = "sans-serif"
+FONT_CACHE_SIZE = 16
+TEXT_CACHE_SIZE = 256
 
 # Константы цветов
-COLOR_BLACK = Color('black')
-COLOR_WHITE = Color('white')
-COLOR_RED = Color('red')
-COLOR_GREEN = Color('green')
-COLOR_BLUE = Color('blue')
+COLOR_BLACK = (0, 0, 0)
+COLOR_WHITE = (255, 255, 255)
+COLOR_RED = (255, 0, 0)
+COLOR_GREEN = (0, 255, 0)
+COLOR_BLUE = (0, 0, 255)
 
 # Константы папок и путей к ним
 DIR_NAME_LEVELS = 'levels'
 DIR_NAME_IMAGES = 'img'
+DIR_NAME_CACHE = '.cache'
+DIR_NAME_PROFILES = 'profiles'
+DIR_NAME_REPLAYS = 'replays'
 
 CURRENT_DIR = os.path.dirname(__file__)
 LEVELS_DIR = os.path.join(CURRENT_DIR, DIR_NAME_LEVELS)
 IMG_DIR = os.path.join(CURRENT_DIR, DIR_NAME_IMAGES)
+CACHE_DIR = os.path.join(CURRENT_DIR, DIR_NAME_CACHE)
+LEVEL_CACHE_DIR = os.path.join(CACHE_DIR, DIR_NAME_LEVELS)
+THUMBNAIL_CACHE_DIR = os.path.join(CACHE_DIR, 'thumbnails')
+ATLAS_CACHE_DIR = os.path.join(CACHE_DIR, 'atlas')
+PROFILES_DIR = os.path.join(CURRENT_DIR, DIR_NAME_PROFILES)
+REPLAYS_DIR = os.path.join(CURRENT_DIR, DIR_NAME_REPLAYS)
 
 # Константы имён файлов
 CSV_FILE_SAVE = "save.csv"
+JSON_FILE_VALIDATE_CACHE = "validate.json"
 
 SPRITE_FILE_WALLS = "walls.png"
 SPRITE_FILE_FLOOR = "floor.png"
@@ -44,6 +112,14 @@ SPRITE_FILE_LEVEL_ICONS = "level_icons.png"
 
 IMG_FILE_TITLE = "title.png"
 
+# Наборы спрайтов, которые упаковываются в общую текстуру (атлас), и ширина атласа
+ATLAS_SPRITE_FILES = [SPRITE_FILE_WALLS, SPRITE_FILE_FLOOR, SPRITE_FILE_LAVA, SPRITE_FILE_RIVER,
+                      SPRITE_FILE_ACID, SPRITE_FILE_FIRE_PLAYER, SPRITE_FILE_WATER_PLAYER,
+                      SPRITE_FILE_ELEMENTS, SPRITE_FILE_LEVEL_ICONS]
+ATLAS_WIDTH = 512
+# Перевод непрозрачных фрагментов и фрагментов без полупрозрачности в формат экрана
+OPAQUE_FAST_PATH = True
+
 # Константы обозначений блоков и элементов на уровне
 LEVEL_BLOCK_EMPTY = " "
 LEVEL_BLOCK_FLOOR = "."
@@ -70,6 +146,12 @@ LEVEL_ELEM_OUTPUT_PORTAL_2 = "O"
 LEVEL_ELEM_PORTAL_SWITCH_1 = "y"
 LEVEL_ELEM_PORTAL_SWITCH_2 = "Y"
 
+# Количество строк и столбцов уровней на странице экрана выбора уровня
+LEVEL_PAGE_ROWS = 3
+LEVEL_PAGE_COLS = 3
+# Размер клетки уровня на миниатюре в пикселях
+THUMBNAIL_TILE_SIZE = 2
+
 # Константы для цветов на начальном и конечном экранах
 SCREEN_BG_COLOR1 = "bg_color1"
 SCREEN_BG_COLOR2 = "bg_color2"
@@ -81,14 +163,40 @@ SCREEN_WATER_TEXT_COLOR = "water_text_color"
 SCREEN_WATER_SHADOW_COLOR = "water_shadow_color"
 
 SCREEN_COLORS_DICT = {
-    SCREEN_BG_COLOR1: Color(47, 72, 78),
-    SCREEN_BG_COLOR2: Color(54, 54, 54),
-    SCREEN_SHADOW_COLOR: Color(27, 38, 50),
-    SCREEN_TEXT_COLOR: Color(56, 105, 117),
-    SCREEN_FIRE_TEXT_COLOR: Color(207, 50, 50),
-    SCREEN_FIRE_SHADOW_COLOR: Color(143, 34, 34),
-    SCREEN_WATER_TEXT_COLOR: Color(60, 188, 252),
-    SCREEN_WATER_SHADOW_COLOR: Color(11, 94, 135)
+    SCREEN_BG_COLOR1: (47, 72, 78),
+    SCREEN_BG_COLOR2: (54, 54, 54),
+    SCREEN_SHADOW_COLOR: (27, 38, 50),
+    SCREEN_TEXT_COLOR: (56, 105, 117),
+    SCREEN_FIRE_TEXT_COLOR: (207, 50, 50),
+    SCREEN_FIRE_SHADOW_COLOR: (143, 34, 34),
+    SCREEN_WATER_TEXT_COLOR: (60, 188, 252),
+    SCREEN_WATER_SHADOW_COLOR: (11, 94, 135)
+}
+
+# Цвета блоков, элементов и игроков на миниатюрах уровней
+THUMBNAIL_COLORS_DICT = {
+    LEVEL_BLOCK_EMPTY: (54, 54, 54),
+    LEVEL_BLOCK_FLOOR: (120, 110, 100),
+    LEVEL_BLOCK_WALL: (30, 30, 30),
+    LEVEL_BLOCK_LAVA: (230, 90, 20),
+    LEVEL_BLOCK_RIVER: (40, 110, 230),
+    LEVEL_BLOCK_ACID: (60, 200, 60),
+    LEVEL_PLAYER_FIRE: (255, 200, 0),
+    LEVEL_PLAYER_WATER: (160, 240, 255),
+    LEVEL_ELEM_RUBY: (255, 40, 80),
+    LEVEL_ELEM_AQUAMARINE: (80, 230, 255),
+    LEVEL_ELEM_FIRE_EXIT: (255, 140, 0),
+    LEVEL_ELEM_WATER_EXIT: (0, 160, 255),
+    LEVEL_ELEM_DOORBUTTON_1: (220, 220, 0),
+    LEVEL_ELEM_DOORBUTTON_2: (220, 220, 0),
+    LEVEL_ELEM_DOOR_1: (160, 120, 60),
+    LEVEL_ELEM_DOOR_2: (160, 120, 60),
+    LEVEL_ELEM_INPUT_PORTAL_1: (190, 80, 255),
+    LEVEL_ELEM_INPUT_PORTAL_2: (190, 80, 255),
+    LEVEL_ELEM_OUTPUT_PORTAL_1: (190, 80, 255),
+    LEVEL_ELEM_OUTPUT_PORTAL_2: (190, 80, 255),
+    LEVEL_ELEM_PORTAL_SWITCH_1: (255, 255, 255),
+    LEVEL_ELEM_PORTAL_SWITCH_2: (255, 255, 255)
 }
 
 TIME_START_GAME = 1
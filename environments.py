@@ -0,0 +1,291 @@
+import sys
+import argparse
+from time import perf_counter
+from constants import *
+from level import Level
+from solver import SolverModel, ACTION_DIRECTIONS, ACTION_USE
+
+# Пакетная среда работает только с массивами NumPy
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Действие игрока, который на этом шаге ничего не делает (остальные действия - как в solver.py)
+ACTION_NONE = 5
+ACTION_COUNT = 6
+
+# Столбцы наблюдения: номер уровня, клетки игроков, состояния рычагов, несобранные камни (битовая маска)
+OBS_LEVEL = 0
+OBS_FIRE_COL = 1
+OBS_FIRE_ROW = 2
+OBS_WATER_COL = 3
+OBS_WATER_ROW = 4
+OBS_SWITCHES = 5
+OBS_STONES = 6
+OBS_SIZE = 7
+
+# Награды за шаг: сбор камня, прохождение уровня, гибель игрока и каждый шаг
+REWARD_STONE = 0.1
+REWARD_WIN = 1.0
+REWARD_DEATH = -1.0
+REWARD_STEP = -0.01
+
+# Ограничение количества шагов одной попытки
+ENV_MAX_STEPS = 500
+# Камни хранятся битовой маской в 64-битном числе
+ENV_MAX_STONES = 64
+
+
+class LevelTables:
+    """Неизменяемые данные уровня в виде массивов для пакетной среды.
+       Двери, кнопки, рычаги, порталы, камни и выходы берутся из модели решателя (SolverModel),
+       поэтому ход среды совпадает с ходом решателя. В отличие от решателя, в клетки
+       со смертельными блоками переместиться можно: игрок в них погибает."""
+
+    def __init__(self, level):
+        model = SolverModel(level)
+        if not model.is_complete():
+            raise ValueError("level has no players or no exits")
+        if len(model.stone_cells) > ENV_MAX_STONES:
+            raise ValueError(f"level has more than {ENV_MAX_STONES} stones")
+        self.width, self.height = model.width, model.height
+        self.cell_count = model.cell_count
+
+        # Соседние клетки по направлениям (-1 - стена или граница уровня) и смертельные клетки для каждого игрока
+        self.neighbours = numpy.full((4, self.cell_count), -1, dtype=numpy.int32)
+        self.death = numpy.zeros((2, self.cell_count), dtype=bool)
+        for cell in range(self.cell_count):
+            col, row = model.get_col_row(cell)
+            for action, (col_offset, row_offset) in enumerate(ACTION_DIRECTIONS):
+                near_col, near_row = col + col_offset, row + row_offset
+                if 0 <= near_col < self.width and 0 <= near_row < self.height and \
+                        level.blocks[near_row][near_col] != LEVEL_BLOCK_WALL:
+                    self.neighbours[action, cell] = model.get_cell(near_col, near_row)
+            for owner, death_tiles in enumerate([{LEVEL_BLOCK_RIVER, LEVEL_BLOCK_ACID},
+                                                 {LEVEL_BLOCK_LAVA, LEVEL_BLOCK_ACID}]):
+                self.death[owner, cell] = level.blocks[row][col] in death_tiles
+
+        self.door_kinds = numpy.array(model.door_kinds, dtype=numpy.int8)
+        self.button_kinds = numpy.array(model.button_kinds, dtype=numpy.int8)
+        self.switch_kinds = numpy.array(model.switch_kinds, dtype=numpy.int8)
+        # Входной и выходной порталы каждого вида (-1 - порталов нет)
+        self.portals = numpy.array([portals if portals is not None else (-1, -1) for portals in model.portals],
+                                   dtype=numpy.int32)
+        # Бит камня, который собирает игрок в клетке
+        self.stone_bits = numpy.zeros((2, self.cell_count), dtype=numpy.uint64)
+        for owner in range(2):
+            for cell, bit in model.stone_bits[owner].items():
+                self.stone_bits[owner, cell] = bit
+        self.exits = numpy.array(model.exits, dtype=numpy.int32)
+        self.start_cells = numpy.array(model.start_cells, dtype=numpy.int32)
+        self.start_stones = model.unpack(model.get_start_state())[2]
+
+
+class BatchEnvironment:
+    """Пакетная среда для обучения агентов: N независимых попыток прохождения уровней,
+       которые выполняют шаг одним вызовом step() без pygame и без объектов симуляции.
+       Шаг - одновременные действия обоих игроков в модели решателя (см. SolverModel):
+       перемещение в соседнюю клетку, взаимодействие с рычагом или порталом или бездействие.
+       Анимация перемещения не моделируется. Двери, рычаги и порталы проверяются
+       по состоянию в начале шага, поэтому порядок игроков не важен.
+
+       Состояние попыток хранится в массивах: номер уровня, клетки игроков, состояния рычагов,
+       битовая маска несобранных камней и количество шагов. Данные уровней дополняются
+       до наибольшего количества клеток, чтобы выбирать их по номеру уровня одной операцией.
+       Завершённые попытки сразу начинаются заново."""
+
+    def __init__(self, levels, count, max_steps=ENV_MAX_STEPS, first_index=0):
+        if numpy is None:
+            raise RuntimeError("batch environment requires numpy")
+        if not levels:
+            raise ValueError("no levels")
+        self.count = count
+        self.max_steps = max_steps
+        self.tables = [LevelTables(level) for level in levels]
+        self.stack_tables()
+
+        # Попытки распределяются по уровням по очереди. first_index - номер первой попытки
+        # среди попыток всех сред, когда они разделены между процессами (см. rollouts.py).
+        self.level_ids = numpy.arange(first_index, first_index + count, dtype=numpy.int32) % len(self.tables)
+        self.cells = numpy.zeros((count, 2), dtype=numpy.int32)
+        self.switches = numpy.zeros(count, dtype=numpy.uint8)
+        self.stones = numpy.zeros(count, dtype=numpy.uint64)
+        self.steps = numpy.zeros(count, dtype=numpy.int32)
+        self.rows = numpy.arange(count)
+        self.reset()
+
+    def stack_tables(self):
+        """Объединение данных уровней в массивы с первым измерением по номеру уровня"""
+        level_count = len(self.tables)
+        cell_count = max(tables.cell_count for tables in self.tables)
+
+        def stack(name, fill, dtype, shape=()):
+            result = numpy.full((level_count, *shape, cell_count), fill, dtype=dtype)
+            for index, tables in enumerate(self.tables):
+                result[index, ..., :tables.cell_count] = getattr(tables, name)
+            return result
+
+        self.neighbours = stack("neighbours", -1, numpy.int32, (4,))
+        self.death = stack("death", False, bool, (2,))
+        self.door_kinds = stack("door_kinds", -1, numpy.int8)
+        self.button_kinds = stack("button_kinds", -1, numpy.int8)
+        self.switch_kinds = stack("switch_kinds", -1, numpy.int8)
+        self.stone_bits = stack("stone_bits", 0, numpy.uint64, (2,))
+        self.portals = numpy.array([tables.portals for tables in self.tables], dtype=numpy.int32)
+        self.exits = numpy.array([tables.exits for tables in self.tables], dtype=numpy.int32)
+        self.start_cells = numpy.array([tables.start_cells for tables in self.tables], dtype=numpy.int32)
+        self.start_stones = numpy.array([tables.start_stones for tables in self.tables], dtype=numpy.uint64)
+        self.widths = numpy.array([tables.width for tables in self.tables], dtype=numpy.int32)
+
+    def reset(self, mask=None):
+        """Начало попыток заново (mask - массив признаков попыток, по умолчанию все).
+           Возвращает наблюдения."""
+        if mask is None:
+            mask = numpy.ones(self.count, dtype=bool)
+        level_ids = self.level_ids[mask]
+        self.cells[mask] = self.start_cells[level_ids]
+        self.switches[mask] = 0
+        self.stones[mask] = self.start_stones[level_ids]
+        self.steps[mask] = 0
+        return self.get_observations()
+
+    def get_observations(self):
+        """Наблюдения попыток: массив (N, OBS_SIZE), столбцы OBS_*"""
+        obs = numpy.empty((self.count, OBS_SIZE), dtype=numpy.int64)
+        widths = self.widths[self.level_ids][:, None]
+        obs[:, OBS_LEVEL] = self.level_ids
+        obs[:, [OBS_FIRE_COL, OBS_WATER_COL]] = self.cells % widths
+        obs[:, [OBS_FIRE_ROW, OBS_WATER_ROW]] = self.cells // widths
+        obs[:, OBS_SWITCHES] = self.switches
+        obs[:, OBS_STONES] = self.stones.view(numpy.int64)
+        return obs
+
+    def step(self, actions):
+        """Шаг всех попыток. actions - массив (N, 2) действий игроков 'Огонь' и 'Вода'.
+           Возвращает наблюдения, награды, признаки завершения попыток и словарь с подробностями:
+           won, died, truncated и наблюдения завершённых попыток перед началом заново (final_observations)."""
+        actions = numpy.asarray(actions)
+        if actions.shape != (self.count, 2):
+            raise ValueError(f"actions must have shape ({self.count}, 2)")
+        if ((actions < 0) | (actions >= ACTION_COUNT)).any():
+            raise ValueError(f"actions must be in range 0..{ACTION_COUNT - 1}")
+        rows, level_ids, cells = self.rows, self.level_ids, self.cells
+
+        # Нажатые кнопки и клетки игроков в начале шага
+        button_kinds = self.button_kinds[level_ids[:, None], cells]
+        pressed = numpy.stack([(button_kinds == kind).any(axis=1) for kind in range(2)], axis=1)
+        new_cells = cells.copy()
+        toggled = numpy.zeros(self.count, dtype=numpy.uint8)
+        died = numpy.zeros(self.count, dtype=bool)
+        for owner in range(2):
+            action = actions[:, owner]
+            cell = cells[:, owner]
+
+            # Перемещение: в дверь можно войти, если нажата её кнопка или в ней стоит другой игрок
+            near_cell = self.neighbours[level_ids, numpy.minimum(action, 3), cell]
+            door_kinds = self.door_kinds[level_ids, near_cell]
+            closed = (door_kinds >= 0) & ~pressed[rows, numpy.maximum(door_kinds, 0)] & \
+                (near_cell != cells[:, 1 - owner])
+            moved = (action < 4) & (near_cell >= 0) & ~closed
+            new_cells[moved, owner] = near_cell[moved]
+            died |= moved & self.death[level_ids, owner, near_cell]
+
+            # Взаимодействие с рычагом или входным порталом
+            use = action == ACTION_USE
+            switch_kinds = self.switch_kinds[level_ids, cell]
+            on_switch = use & (switch_kinds >= 0)
+            toggled ^= numpy.where(on_switch, numpy.left_shift(1, numpy.maximum(switch_kinds, 0)), 0) \
+                .astype(numpy.uint8)
+            for kind in range(2):
+                portals = self.portals[level_ids, kind]
+                reversed_portals = (self.switches >> kind) & 1 == 1
+                input_cells = numpy.where(reversed_portals, portals[:, 1], portals[:, 0])
+                output_cells = numpy.where(reversed_portals, portals[:, 0], portals[:, 1])
+                teleported = use & ~on_switch & (input_cells >= 0) & (cell == input_cells)
+                new_cells[teleported, owner] = output_cells[teleported]
+        self.switches ^= toggled
+
+        # Камни собираются при входе в клетку
+        rewards = numpy.full(self.count, REWARD_STEP, dtype=numpy.float32)
+        for owner in range(2):
+            bits = self.stone_bits[level_ids, owner, new_cells[:, owner]]
+            collected = (self.stones & bits) != 0
+            rewards += collected * numpy.float32(REWARD_STONE)
+            self.stones &= ~bits
+        self.cells = new_cells
+        self.steps += 1
+
+        won = ~died & (self.stones == 0) & (new_cells == self.exits[level_ids]).all(axis=1)
+        truncated = ~died & ~won & (self.steps >= self.max_steps)
+        rewards += won * numpy.float32(REWARD_WIN) + died * numpy.float32(REWARD_DEATH)
+        dones = died | won | truncated
+
+        info = {"won": won, "died": died, "truncated": truncated}
+        if dones.any():
+            info["final_observations"] = self.get_observations()
+            obs = self.reset(dones)
+        else:
+            obs = self.get_observations()
+        return obs, rewards, dones, info
+
+    def sample_actions(self, generator):
+        """Случайные действия для всех попыток (generator - numpy.random.Generator)"""
+        return generator.integers(0, ACTION_COUNT, size=(self.count, 2), dtype=numpy.int8)
+
+
+def load_levels(filenames, output=print):
+    """Загрузка уровней для среды. Уровни без игроков или выходов пропускаются."""
+    levels = []
+    for filename in filenames:
+        level = Level(os.path.abspath(filename))
+        if not SolverModel(level).is_complete():
+            output(f"{filename}: skipped, no players or no exits")
+            continue
+        levels.append(level)
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер скорости пакетной среды со случайными действиями")
+    parser.add_argument("levels", nargs="*", help="файлы уровней (по умолчанию - все уровни игры)")
+    parser.add_argument("--envs", type=int, default=4096, help="количество одновременных попыток")
+    parser.add_argument("--steps", type=int, default=1000, help="количество шагов")
+    parser.add_argument("--max-steps", type=int, default=ENV_MAX_STEPS,
+                        help="ограничение количества шагов одной попытки")
+    parser.add_argument("--seed", type=int, default=0, help="начальное значение генератора действий")
+    args = parser.parse_args()
+
+    if numpy is None:
+        print("numpy is required")
+        sys.exit(2)
+    if args.levels:
+        filenames = args.levels
+    else:
+        from validate import get_level_files
+        filenames = get_level_files()
+    levels = load_levels(filenames)
+
+    try:
+        env = BatchEnvironment(levels, args.envs, args.max_steps)
+    except ValueError as error:
+        print(f"cannot create environment: {error}")
+        sys.exit(2)
+    generator = numpy.random.default_rng(args.seed)
+    actions = [env.sample_actions(generator) for _ in range(min(args.steps, 64))]
+    episodes = wins = deaths = 0
+    start_time = perf_counter()
+    for step in range(args.steps):
+        _, _, dones, info = env.step(actions[step % len(actions)])
+        episodes += int(dones.sum())
+        wins += int(info["won"].sum())
+        deaths += int(info["died"].sum())
+    duration = perf_counter() - start_time
+
+    print(f"{len(levels)} levels, {args.envs} environments, {args.steps} steps: {duration:.3f} s, "
+          f"{args.envs * args.steps / duration:,.0f} steps/s")
+    print(f"episodes: {episodes}, won: {wins}, died: {deaths}")
+
+
+if __name__ == "__main__":
+    main()
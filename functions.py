@@ -1,16 +1,89 @@
+import re
 import pygame
+from collections import OrderedDict
 from constants import *
 
 
+class TextCache:
+    """Общий для всего процесса кэш шрифтов и отрисованных надписей.
+       Записи, которые дольше всего не использовались, удаляются при превышении размера кэша.
+       Надписи выдаются как общие поверхности, которые нельзя изменять."""
+
+    # Шрифты по ключу (имя шрифта, размер)
+    fonts = OrderedDict()
+    # Надписи по ключу (текст, размер, цвет, имя шрифта)
+    texts = OrderedDict()
+
+    # Счётчики обращений к кэшу
+    font_hits = 0
+    font_misses = 0
+    text_hits = 0
+    text_misses = 0
+
+    @classmethod
+    def get_font(cls, name, size):
+        """Получение шрифта по имени и размеру"""
+        key = (name, size)
+        font = cls.fonts.get(key)
+        if font is not None:
+            cls.font_hits += 1
+            cls.fonts.move_to_end(key)
+            return font
+        cls.font_misses += 1
+        font = pygame.font.SysFont(name, size)
+        cls.fonts[key] = font
+        if len(cls.fonts) > FONT_CACHE_SIZE:
+            cls.fonts.popitem(last=False)
+        return font
+
+    @classmethod
+    def render(cls, text, size, color, name=FONT_NAME):
+        """Получение общей поверхности с отрисованной надписью"""
+        key = (text, size, tuple(color), name)
+        text_surface = cls.texts.get(key)
+        if text_surface is not None:
+            cls.text_hits += 1
+            cls.texts.move_to_end(key)
+            return text_surface
+        cls.text_misses += 1
+        text_surface = cls.get_font(name, size).render(text, True, color)
+        cls.texts[key] = text_surface
+        if len(cls.texts) > TEXT_CACHE_SIZE:
+            cls.texts.popitem(last=False)
+        return text_surface
+
+    @classmethod
+    def get_stats(cls):
+        """Статистика использования кэша"""
+        return {"font_hits": cls.font_hits, "font_misses": cls.font_misses, "fonts": len(cls.fonts),
+                "text_hits": cls.text_hits, "text_misses": cls.text_misses, "texts": len(cls.texts)}
+
+    @classmethod
+    def clear(cls):
+        """Очистка кэша и сброс счётчиков"""
+        cls.fonts.clear()
+        cls.texts.clear()
+        cls.font_hits, cls.font_misses, cls.text_hits, cls.text_misses = 0, 0, 0, 0
+
+
+def get_level_numbers():
+    """Номера уровней, файлы которых есть в папке уровней, по возрастанию"""
+    numbers = []
+    for filename in os.listdir(LEVELS_DIR):
+        match = re.fullmatch(r"level(\d+)\.txt", filename)
+        if match:
+            numbers.append(int(match.group(1)))
+    return sorted(numbers)
+
+
 def get_empty_image(width=SPRITE_SIZE, height=SPRITE_SIZE):
     image = pygame.Surface((width, height), pygame.SRCALPHA, 32)
     return image
 
 
 def display_text(surface, text, size, color, x, y):
-    """Отображение текста"""
-    font = pygame.font.SysFont("sans-serif", size)
-    text_surface = font.render(text, True, color)
+    """Отображение текста. Возвращаемая поверхность общая, изменять её нельзя."""
+    text_surface = TextCache.render(text, size, color)
     text_rect = text_surface.get_rect()
     text_rect.center = (x, y)
     surface.blit(text_surface, text_rect)
@@ -1,107 +1,24 @@
 import sys
-from typing import Union
+import argparse
+from time import perf_counter
+from typing import Optional
 from datetime import datetime as dt
 import pygame
 from constants import *
 from sprites import BaseSprite
-from sprites import Floor, Wall, Lava, River, Acid
 from sprites import FirePlayer, WaterPlayer
-from sprites import ElementSprite, Ruby, Aquamarine, FireExit, WaterExit
+from sprites import Ruby, Aquamarine, FireExit, WaterExit
 from sprites import DoorButton, Door, PortalSwitch, Portal
 from screens import StartScreen, EndScreen
-
-
-class Level:
-    """Уровень игры"""
-
-    def __init__(self, filename):
-        self.filename = filename
-        self.width, self.height = 0, 0
-        self.col_offset, self.row_offset = 0, 0
-        self.blocks = []
-        self.indexes = []
-        self.fire_player_pos = None
-        self.water_player_pos = None
-        self.elem_pos_dict = dict()
-        self.load_level(filename)
-
-    @staticmethod
-    def get_kind(elem):
-        """Определение вида элемента по его обозначению"""
-        return 1 if elem.isupper() else 0
-
-    def load_level(self, filename):
-        """Загрузка уровня"""
-        fullname = os.path.join(LEVELS_DIR, filename)
-
-        with open(fullname) as f:
-            data = [line.rstrip() for line in f.readlines()]
-
-        # Определение размеров уровня
-        self.width = min([max(map(len, data)), MAX_LEVEL_SIZE])
-        self.height = min([len(data), MAX_LEVEL_SIZE])
-        # Определение сдвига при отображении спрайтов уровня
-        self.col_offset = (MAX_LEVEL_SIZE - self.width) // 2
-        self.row_offset = (MAX_LEVEL_SIZE - self.height) // 2
-        # Добавление пустых элементов в неполных строках
-        # и обрезка уровня, который превышает максимальные размеры
-        data = list(map(lambda x: x[:self.width].ljust(self.width, LEVEL_BLOCK_EMPTY),
-                        data[:self.height]))
-
-        # Множество обозначений блоков
-        blocks_set = {LEVEL_BLOCK_EMPTY, LEVEL_BLOCK_WALL, LEVEL_BLOCK_FLOOR,
-                      LEVEL_BLOCK_LAVA, LEVEL_BLOCK_RIVER, LEVEL_BLOCK_ACID}
-        # Меожество обозначений элементов,
-        # которые могут присутствовать на уровне в единственном экземпляре
-        elem_single_set = {LEVEL_ELEM_FIRE_EXIT, LEVEL_ELEM_WATER_EXIT,
-                           LEVEL_ELEM_INPUT_PORTAL_1, LEVEL_ELEM_INPUT_PORTAL_2,
-                           LEVEL_ELEM_OUTPUT_PORTAL_1, LEVEL_ELEM_OUTPUT_PORTAL_2}
-        # Меожество обозначений элементов,
-        # которые может быть несколько на уровне
-        elems_multi_set = {LEVEL_ELEM_RUBY, LEVEL_ELEM_AQUAMARINE,
-                           LEVEL_ELEM_DOORBUTTON_1, LEVEL_ELEM_DOORBUTTON_2,
-                           LEVEL_ELEM_DOOR_1, LEVEL_ELEM_DOOR_2,
-                           LEVEL_ELEM_PORTAL_SWITCH_1, LEVEL_ELEM_PORTAL_SWITCH_2}
-
-        # Заполнение данных об уровне
-        self.blocks = [[0] * self.width for _ in range(self.height)]
-        for row, line in enumerate(data):
-            for col, elem in enumerate(line):
-                self.blocks[row][col] = elem if elem in blocks_set else LEVEL_BLOCK_FLOOR
-                if elem == LEVEL_PLAYER_FIRE:
-                    self.fire_player_pos = col, row
-                elif elem == LEVEL_PLAYER_WATER:
-                    self.water_player_pos = col, row
-                elif elem in elem_single_set:
-                    self.elem_pos_dict[elem] = [(col, row)]
-                elif elem in elems_multi_set:
-                    if elem not in self.elem_pos_dict:
-                        self.elem_pos_dict[elem] = []
-                    self.elem_pos_dict[elem].append((col, row))
-
-        # Подсчёт индексов на уровне
-        self.indexes = [[0] * self.width for _ in range(self.height)]
-        self.calculate_indexes()
-
-    def calculate_indexes(self):
-        """Расчёт индексов блоков уровня с учётом соседних блоков того же типа"""
-        for row in range(self.height):
-            for col in range(self.width):
-                if self.indexes[row][col] < 0:
-                    continue
-                index = 0
-                near_list = [(col, row - 1, 1), (col + 1, row, 2),
-                             (col, row + 1, 4), (col - 1, row, 8)]
-                for near_col, near_row, weight in near_list:
-                    if not self.cell_on_board(near_col, near_row):
-                        continue
-                    if self.blocks[near_row][near_col] == self.blocks[row][col]:
-                        index += weight
-                self.indexes[row][col] = index
-
-    def cell_on_board(self, col, row):
-        """Проверка на присутствие координат на игровом уровне"""
-        return 0 <= col < self.width and 0 <= row < self.height
+from renderers import Renderer, DirtyRenderer
+from camera import SpriteGrid
+from profiler import FrameProfiler, PHASE_TICK, PHASE_EVENTS, PHASE_UPDATE, PHASE_SIMULATION, PHASE_DISPLAY
+from profiler import PHASE_SPRITES_PREFIX
+from level import Level
+from replays import ReplayRecorder, ReplayPlayer
+from snapshots import Snapshot, UndoHistory
+from functions import TextCache
+from simulation import Simulation
 
 
 class GameInfo:
@@ -165,19 +82,33 @@ class GameInfo:
     def set_win_game(self, win_name):
         self.win_game = win_name
 
+    def get_state(self):
+        """Состояние информации об игре для снимка"""
+        return (self.win_game, self.ruby_count_at_start, self.ruby_count_at_end,
+                self.aquamarine_count_at_start, self.aquamarine_count_at_end,
+                self.start_game_time, self.end_game_time,
+                self.fire_exit_activation_time, self.water_exit_activation_time)
+
+    def set_state(self, state):
+        """Восстановление состояния информации об игре"""
+        (self.win_game, self.ruby_count_at_start, self.ruby_count_at_end,
+         self.aquamarine_count_at_start, self.aquamarine_count_at_end,
+         self.start_game_time, self.end_game_time,
+         self.fire_exit_activation_time, self.water_exit_activation_time) = state
+
     def get_players_status_text(self):
         """Получение статуса игроков после окончания игры"""
         if not self.fire_player.is_alive:
-            if isinstance(self.fire_player.death_sprite, River):
+            if self.fire_player.death_tile == LEVEL_BLOCK_RIVER:
                 return f"Огонь утонул в реке"
-            elif isinstance(self.fire_player.death_sprite, Acid):
+            elif self.fire_player.death_tile == LEVEL_BLOCK_ACID:
                 return f"Огонь наступил в кислоту"
             else:
                 return f"Огонь погиб"
         elif not self.water_player.is_alive:
-            if isinstance(self.water_player.death_sprite, Lava):
+            if self.water_player.death_tile == LEVEL_BLOCK_LAVA:
                 return f"Вода сгорела в лаве"
-            elif isinstance(self.water_player.death_sprite, Acid):
+            elif self.water_player.death_tile == LEVEL_BLOCK_ACID:
                 return f"Вода наступила в кислоту"
             else:
                 return f"Вода погибла"
@@ -218,6 +149,9 @@ class Game:
         pygame.display.set_caption(TITLE)
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         self.clock = pygame.time.Clock()
+        self.renderer = DirtyRenderer(self.screen) if DIRTY_RENDERING else Renderer(self.screen)
+        # Замер времени этапов кадра
+        self.profiler = FrameProfiler()
 
         self.levelname = None
 
@@ -228,187 +162,269 @@ class Game:
         self.game_over = False
         self.with_end_screen = False
 
-        # Группы спрайтов
-        self.all_sprites = pygame.sprite.Group()
-        self.wall_sprites = pygame.sprite.Group()
-        self.lava_sprites = pygame.sprite.Group()
-        self.river_sprites = pygame.sprite.Group()
-        self.acid_sprites = pygame.sprite.Group()
-
-        self.elements_sprites = pygame.sprite.Group()
-        self.door_sprites = pygame.sprite.Group()
+        # Множитель скорости игры и режим без ограничения скорости
+        self.speed = GAME_SPEEDS[0]
+        self.unthrottled = False
+        # Время, накопленное для следующих тактов симуляции (в миллисекундах)
+        self.tick_accumulator = 0.0
 
-        # Уникальные объекты
+        # Группы спрайтов. Неизменяемые блоки уровня рисуются на фоне без спрайтов.
+        self.all_sprites = pygame.sprite.Group()
+        self.dynamic_sprites = pygame.sprite.Group()
+        self.player_sprites = pygame.sprite.Group()
+        # Спрайты элементов в порядке создания (в том числе спрайты собранных камней)
+        self.element_sprites = []
+        # Спрайты элементов по участкам уровня, видимые участки и их спрайты
+        self.sprite_grid = SpriteGrid()
+        self.visible_chunks = set()
+        self.visible_sprites = []
+
+        # Текущий уровень
+        self.level: Optional[Level] = None
+
+        # Симуляция правил игры для текущего уровня
+        self.simulation: Optional[Simulation] = None
+        # Ввод, который будет применён на следующем такте симуляции
+        self.pending_moves = []
+        self.interacting_players = []
+
+        # Уникальные объекты симуляции
         self.fire_player = None
         self.water_player = None
         self.fire_exit = None
         self.water_exit = None
 
-        # Словарь для соединения элементов на уровне
-        self.connection_dict = {}
-
         # Информация об игре
         self.game_info = None
 
+        # Запись ввода текущей попытки и воспроизведение записанного ввода
+        self.recorder: Optional[ReplayRecorder] = None
+        self.replay_player: Optional[ReplayPlayer] = None
+        # Запись повтора каждой попытки в папку повторов
+        self.record_replays = REPLAY_RECORDING
+
+        # Снимок начального состояния уровня и история снимков для отмены ходов
+        self.initial_snapshot: Optional[Snapshot] = None
+        self.undo_history = UndoHistory()
+        # Взаимодействующие игроки на предыдущем такте (начало взаимодействия - момент для снимка)
+        self.previous_interacting = ()
+        # Уровень не пройден: ожидается отмена хода, перезапуск или показ результатов
+        self.level_lost = False
+        self.lost_message: Optional[pygame.Surface] = None
+
     def reset_game(self):
         """Сброс атрибутов игры"""
         BaseSprite.reset_offset()
         for sprite in self.all_sprites:
             sprite.kill()
-
+        self.renderer.reset()
+        self.player_sprites.empty()
+        self.element_sprites.clear()
+        self.sprite_grid.clear()
+        self.visible_chunks = set()
+        self.visible_sprites = []
+
+        self.level = None
+        self.simulation = None
+        self.pending_moves.clear()
+        self.interacting_players.clear()
         self.fire_player = None
         self.water_player = None
         self.fire_exit = None
         self.water_exit = None
 
-        self.connection_dict.clear()
-
         self.game_info = None
+        self.recorder = None
+        self.replay_player = None
+
+        self.initial_snapshot = None
+        self.undo_history.clear()
+        self.previous_interacting = ()
+        self.level_lost = False
 
-    def new_game(self, levelname):
-        """Создание новой игры"""
+    def new_game(self, levelname, replay=None):
+        """Создание новой игры.
+           Если задан повтор, то вместо ввода с клавиатуры используется записанный ввод."""
         self.reset_game()
 
+        self.profiler.reset(levelname)
+
         # Создание объекта с данными уровня
         level = Level(levelname)
+        self.level = level
         # Загрузка сдвига для текущего уровня
         BaseSprite.set_offset(level.col_offset, level.row_offset)
+        self.sprite_grid = SpriteGrid(level.col_offset, level.row_offset)
 
-        # Создание спрайтов для блоков уровня
-        for row in range(level.height):
-            for col in range(level.width):
-                if level.blocks[row][col] == LEVEL_BLOCK_WALL:
-                    level_sprite = Wall(col, row, level.indexes[row][col])
-                    self.wall_sprites.add(level_sprite)
-                elif level.blocks[row][col] == LEVEL_BLOCK_LAVA:
-                    level_sprite = Lava(col, row, level.indexes[row][col])
-                    self.lava_sprites.add(level_sprite)
-                elif level.blocks[row][col] == LEVEL_BLOCK_RIVER:
-                    level_sprite = River(col, row, level.indexes[row][col])
-                    self.river_sprites.add(level_sprite)
-                elif level.blocks[row][col] == LEVEL_BLOCK_ACID:
-                    level_sprite = Acid(col, row, level.indexes[row][col])
-                    self.acid_sprites.add(level_sprite)
-                elif level.blocks[row][col] == LEVEL_BLOCK_EMPTY:
-                    continue
-                else:
-                    level_sprite = Floor(col, row, level.indexes[row][col])
+        # Создание симуляции уровня
+        self.simulation = Simulation(level)
+        self.fire_player = self.simulation.fire_player
+        self.water_player = self.simulation.water_player
+        self.fire_exit = self.simulation.fire_exit
+        self.water_exit = self.simulation.water_exit
 
-                self.all_sprites.add(level_sprite)
+        if replay is not None:
+            self.replay_player = ReplayPlayer(replay)
+        elif self.record_replays:
+            self.recorder = ReplayRecorder(levelname)
 
         # Создание спрайтов для элементов уровня
-        for elem in level.elem_pos_dict:
-            for col, row in level.elem_pos_dict[elem]:
-                if elem == LEVEL_ELEM_RUBY:
-                    level_sprite = Ruby(col, row)
-                elif elem == LEVEL_ELEM_AQUAMARINE:
-                    level_sprite = Aquamarine(col, row)
-                elif elem == LEVEL_ELEM_FIRE_EXIT:
-                    level_sprite = FireExit(col, row)
-                    self.fire_exit = level_sprite
-                elif elem == LEVEL_ELEM_WATER_EXIT:
-                    level_sprite = WaterExit(col, row)
-                    self.water_exit = level_sprite
-                elif elem == LEVEL_ELEM_DOORBUTTON_1 or \
-                        elem == LEVEL_ELEM_DOORBUTTON_2:
-                    level_sprite = DoorButton(col, row, level.get_kind(elem))
-                elif elem == LEVEL_ELEM_DOOR_1 or \
-                        elem == LEVEL_ELEM_DOOR_2:
-                    level_sprite = Door(col, row, level.get_kind(elem))
-                    self.door_sprites.add(level_sprite)
-                elif elem == LEVEL_ELEM_INPUT_PORTAL_1 or \
-                        elem == LEVEL_ELEM_INPUT_PORTAL_2:
-                    level_sprite = Portal(col, row, level.get_kind(elem), True)
-                elif elem == LEVEL_ELEM_OUTPUT_PORTAL_1 or \
-                        elem == LEVEL_ELEM_OUTPUT_PORTAL_2:
-                    level_sprite = Portal(col, row, level.get_kind(elem), False)
-                elif elem == LEVEL_ELEM_PORTAL_SWITCH_1 or \
-                        elem == LEVEL_ELEM_PORTAL_SWITCH_2:
-                    level_sprite = PortalSwitch(col, row, level.get_kind(elem))
-                else:
-                    continue
-
-                # Добавление элементов в словарь соединений
-                if elem not in self.connection_dict:
-                    self.connection_dict[elem] = []
-                self.connection_dict[elem].append(level_sprite)
+        for element in self.simulation.elements:
+            if element.symbol == LEVEL_ELEM_RUBY:
+                level_sprite = Ruby(element)
+            elif element.symbol == LEVEL_ELEM_AQUAMARINE:
+                level_sprite = Aquamarine(element)
+            elif element.symbol == LEVEL_ELEM_FIRE_EXIT:
+                level_sprite = FireExit(element)
+            elif element.symbol == LEVEL_ELEM_WATER_EXIT:
+                level_sprite = WaterExit(element)
+            elif element.symbol in (LEVEL_ELEM_DOORBUTTON_1, LEVEL_ELEM_DOORBUTTON_2):
+                level_sprite = DoorButton(element)
+            elif element.symbol in (LEVEL_ELEM_DOOR_1, LEVEL_ELEM_DOOR_2):
+                level_sprite = Door(element)
+            elif element.symbol in (LEVEL_ELEM_PORTAL_SWITCH_1, LEVEL_ELEM_PORTAL_SWITCH_2):
+                level_sprite = PortalSwitch(element)
+            else:
+                level_sprite = Portal(element)
 
-                self.elements_sprites.add(level_sprite)
-                self.all_sprites.add(level_sprite)
+            self.element_sprites.append(level_sprite)
+            self.sprite_grid.add(level_sprite, element.col, element.row)
+            self.dynamic_sprites.add(level_sprite)
+            self.all_sprites.add(level_sprite)
 
         # Создание спрайтов для игроков
-        if level.fire_player_pos is not None:
-            self.fire_player = FirePlayer(*level.fire_player_pos)
-            self.all_sprites.add(self.fire_player)
-            for group in [self.river_sprites, self.acid_sprites]:
-                self.fire_player.add_death_group(group)
-        if level.water_player_pos is not None:
-            self.water_player = WaterPlayer(*level.water_player_pos)
-            self.all_sprites.add(self.water_player)
-            for group in [self.lava_sprites, self.acid_sprites]:
-                self.water_player.add_death_group(group)
-
-        # Соединение элементов
-        self.connect_elements()
+        if self.fire_player is not None:
+            level_sprite = FirePlayer(self.fire_player)
+            self.player_sprites.add(level_sprite)
+            self.dynamic_sprites.add(level_sprite)
+            self.all_sprites.add(level_sprite)
+        if self.water_player is not None:
+            level_sprite = WaterPlayer(self.water_player)
+            self.player_sprites.add(level_sprite)
+            self.dynamic_sprites.add(level_sprite)
+            self.all_sprites.add(level_sprite)
+
+        # Фон уровня из неизменяемых блоков и камеры, которые следят за игроками
+        self.set_renderer(self.renderer)
 
         # Заполнение информации об игре
         self.game_info = GameInfo()
         self.game_info.add_players(self.fire_player, self.water_player)
-        self.game_info.set_stone_count(TIME_START_GAME,
-                                       len(self.fire_exit.ruby_sprites),
-                                       len(self.water_exit.aquamarine_sprites))
+        self.game_info.set_stone_count(TIME_START_GAME, *self.simulation.get_stone_count())
         self.game_info.set_time(TIME_START_GAME)
 
+        self.initial_snapshot = self.take_snapshot()
         self.game_over = False
 
-    def connect_elements(self):
-        """Соединение элементов для корректной обработки взаимодействий"""
-        # Соединение камней, выходов из уровня и игроков
-        for level_elem_stone, level_elem_exit, player in \
-                [(LEVEL_ELEM_RUBY, LEVEL_ELEM_FIRE_EXIT, self.fire_player),
-                 (LEVEL_ELEM_AQUAMARINE, LEVEL_ELEM_WATER_EXIT, self.water_player)]:
-
-            if level_elem_exit in self.connection_dict:
-                level_exit = self.connection_dict[level_elem_exit][0]
-                if player is not None:
-                    level_exit.connect_player(player)
-                if level_elem_stone in self.connection_dict:
-                    for stone in self.connection_dict[level_elem_stone]:
-                        if player is not None:
-                            stone.connect_player(player)
-                        level_exit.connect_stone(stone)
-
-        # Соединение кнопок, дверей и игроков
-        for level_elem_doorbutton, level_elem_door in \
-                [(LEVEL_ELEM_DOORBUTTON_1, LEVEL_ELEM_DOOR_1),
-                 (LEVEL_ELEM_DOORBUTTON_2, LEVEL_ELEM_DOOR_2)]:
-
-            if level_elem_doorbutton in self.connection_dict and \
-                    level_elem_door in self.connection_dict:
-                for button in self.connection_dict[level_elem_doorbutton]:
-                    for door in self.connection_dict[level_elem_door]:
-                        button.connect_door(door)
-                        door.connect_button(button)
-                        door.connect_players(self.fire_player, self.water_player)
-
-        # Соединение рычагов и порталов
-        for level_elem_input_portal, level_elem_output_portal, level_elem_portal_switch in \
-                [(LEVEL_ELEM_INPUT_PORTAL_1, LEVEL_ELEM_OUTPUT_PORTAL_1, LEVEL_ELEM_PORTAL_SWITCH_1),
-                 (LEVEL_ELEM_INPUT_PORTAL_2, LEVEL_ELEM_OUTPUT_PORTAL_2, LEVEL_ELEM_PORTAL_SWITCH_2)
-                 ]:
-
-            if level_elem_input_portal in self.connection_dict and \
-                    level_elem_output_portal in self.connection_dict:
-                input_portal = self.connection_dict[level_elem_input_portal][0]
-                output_portal = self.connection_dict[level_elem_output_portal][0]
-                input_portal.connect_portal(output_portal)
-                output_portal.connect_portal(input_portal)
-                if level_elem_portal_switch in self.connection_dict:
-                    for switch in self.connection_dict[level_elem_portal_switch]:
-                        switch.connect_portals(input_portal, output_portal)
-                        for other_switch in self.connection_dict[level_elem_portal_switch]:
-                            if switch != other_switch:
-                                switch.connect_other_switches(other_switch)
+    def set_renderer(self, renderer):
+        """Задание способа отрисовки текущего уровня"""
+        self.renderer = renderer
+        renderer.set_level(self.level)
+        self.visible_chunks = set()
+        self.visible_sprites = []
+        self.update_view()
+
+    def update_view(self):
+        """Перемещение камер вслед за игроками и выбор спрайтов элементов, которые видны на экране.
+           Спрайты элементов за пределами экрана не обновляются, поэтому появившиеся на экране
+           спрайты синхронизируются с симуляцией."""
+        self.renderer.view.follow([sprite.get_pos() for sprite in self.player_sprites])
+        chunks = self.sprite_grid.get_chunks(self.renderer.view.get_rects())
+        if chunks == self.visible_chunks:
+            return
+        for sprite in self.sprite_grid.get_sprites(chunks - self.visible_chunks):
+            sprite.update()
+        self.visible_chunks = chunks
+        self.visible_sprites = self.sprite_grid.get_sprites(chunks)
+        self.renderer.set_sprites(self.visible_sprites + self.player_sprites.sprites())
+
+    def update_sprites(self):
+        """Обновление видимых спрайтов элементов и спрайтов игроков"""
+        for sprite in self.visible_sprites:
+            sprite.update()
+        self.player_sprites.update()
+
+    def take_snapshot(self, previous=None):
+        """Снимок состояния симуляции и информации об игре"""
+        snapshot = self.simulation.get_snapshot(previous)
+        snapshot.game_info = self.game_info.get_state()
+        return snapshot
+
+    def restore_snapshot(self, snapshot):
+        """Восстановление состояния игры из снимка без пересоздания спрайтов"""
+        self.simulation.restore_snapshot(snapshot)
+        self.game_info.set_state(snapshot.game_info)
+        self.pending_moves.clear()
+        self.interacting_players.clear()
+        self.previous_interacting = ()
+        self.level_lost = False
+        self.tick_accumulator = 0.0
+        self.sync_sprites()
+
+    def sync_sprites(self):
+        """Синхронизация спрайтов с восстановленным состоянием симуляции.
+           Спрайты возвращённых камней добавляются в группы в исходном порядке отрисовки."""
+        self.dynamic_sprites.empty()
+        for sprite in self.element_sprites:
+            if sprite.element.is_removed:
+                sprite.kill()
+            else:
+                sprite.add(self.dynamic_sprites, self.all_sprites)
+                sprite.set_active(sprite.element.is_active)
+        for sprite in self.player_sprites:
+            self.dynamic_sprites.add(sprite)
+            sprite.update()
+            # Переход к восстановленной позиции не сглаживается
+            sprite.prev_pos = None
+
+    def get_state(self, previous=None):
+        """Полное состояние попытки: снимок, история отмены ходов и признак проигрыша"""
+        return self.take_snapshot(previous), self.undo_history.copy(), self.level_lost, self.previous_interacting
+
+    def set_state(self, state):
+        """Восстановление полного состояния попытки"""
+        snapshot, undo_history, level_lost, previous_interacting = state
+        self.restore_snapshot(snapshot)
+        self.undo_history = undo_history.copy()
+        self.level_lost = level_lost
+        self.previous_interacting = previous_interacting
+
+    def save_undo_snapshot(self):
+        """Сохранение снимка перед ходом игрока или началом взаимодействия.
+           Снимок не сохраняется, если состояние не изменилось с предыдущего снимка."""
+        top = self.undo_history.top()
+        snapshot = self.take_snapshot(top or self.initial_snapshot)
+        if not snapshot.is_same_state(top):
+            self.undo_history.push(snapshot)
+
+    def undo(self):
+        """Отмена последнего хода. Возвращает False, если отменять нечего."""
+        snapshot = self.undo_history.pop()
+        if snapshot is None:
+            return False
+        if self.recorder is not None:
+            self.recorder.record_undo(self.simulation.tick_count)
+        self.restore_snapshot(snapshot)
+        return True
+
+    def restart(self):
+        """Перезапуск уровня без пересоздания спрайтов. Новая попытка записывается в новый повтор."""
+        self.save_replay()
+        self.restore_snapshot(self.initial_snapshot)
+        self.undo_history.clear()
+        self.game_info.set_time(TIME_START_GAME)
+        if self.recorder is not None:
+            self.recorder = ReplayRecorder(self.recorder.replay.levelname)
+
+    def save_replay(self):
+        """Сохранение повтора текущей попытки"""
+        if self.recorder is None:
+            return
+        self.recorder.finish(self.simulation)
+        try:
+            self.recorder.save()
+        except OSError:
+            pass
 
     def process_events(self):
         """Обработка событий игры"""
@@ -416,46 +432,104 @@ class Game:
             if event.type == pygame.QUIT:
                 sys.exit()
             if event.type == pygame.KEYDOWN:
-                # Выход из уровня по кнопке Escape
-                if event.key == pygame.K_ESCAPE:
+                # Выход из уровня по кнопке Escape (после проигрыша - с показом результатов)
+                if event.key == pygame.K_ESCAPE or event.key == pygame.K_RETURN and self.level_lost:
                     self.game_over = True
-                    self.with_end_screen = False
+                    self.with_end_screen = self.level_lost
+                # Переключение скорости игры
+                if event.key == pygame.K_F5:
+                    self.change_speed()
+                # Показ и скрытие статистики времени кадра
+                if event.key == pygame.K_F3:
+                    self.profiler.toggle_overlay()
+                if self.replay_player is not None:
+                    # Ускорение и перемотка при воспроизведении повтора
+                    if event.key == pygame.K_F6:
+                        self.unthrottled = not self.unthrottled
+                    elif event.key == pygame.K_LEFT:
+                        self.replay_player.seek(self, -REPLAY_SEEK_STEPS)
+                    elif event.key == pygame.K_RIGHT:
+                        self.replay_player.seek(self, REPLAY_SEEK_STEPS)
+                    continue
+                # Отмена хода и перезапуск уровня
+                if event.key == pygame.K_BACKSPACE and UNDO_ENABLED:
+                    self.undo()
+                elif event.key == pygame.K_r:
+                    self.restart()
 
                 # Клавиши для перемещения игроков
                 if event.key == pygame.K_a:
-                    self.fire_player.move_to_cell(-1, 0, self.wall_sprites, self.door_sprites)
+                    self.pending_moves.append((self.fire_player, -1, 0))
                 elif event.key == pygame.K_d:
-                    self.fire_player.move_to_cell(1, 0, self.wall_sprites, self.door_sprites)
+                    self.pending_moves.append((self.fire_player, 1, 0))
                 elif event.key == pygame.K_w:
-                    self.fire_player.move_to_cell(0, -1, self.wall_sprites, self.door_sprites)
+                    self.pending_moves.append((self.fire_player, 0, -1))
                 elif event.key == pygame.K_s:
-                    self.fire_player.move_to_cell(0, 1, self.wall_sprites, self.door_sprites)
+                    self.pending_moves.append((self.fire_player, 0, 1))
                 elif event.key == pygame.K_LEFT:
-                    self.water_player.move_to_cell(-1, 0, self.wall_sprites, self.door_sprites)
+                    self.pending_moves.append((self.water_player, -1, 0))
                 elif event.key == pygame.K_RIGHT:
-                    self.water_player.move_to_cell(1, 0, self.wall_sprites, self.door_sprites)
+                    self.pending_moves.append((self.water_player, 1, 0))
                 elif event.key == pygame.K_UP:
-                    self.water_player.move_to_cell(0, -1, self.wall_sprites, self.door_sprites)
+                    self.pending_moves.append((self.water_player, 0, -1))
                 elif event.key == pygame.K_DOWN:
-                    self.water_player.move_to_cell(0, 1, self.wall_sprites, self.door_sprites)
+                    self.pending_moves.append((self.water_player, 0, 1))
 
         pressed_key = pygame.key.get_pressed()
         # Если нажаты левый и/или правый CTRL,
         # то соответствующий игрок взаимодействует с предметом, с которым пересекается
-        interaction_list = []
+        self.interacting_players.clear()
         if pressed_key[pygame.K_LCTRL]:
-            interaction_list.append(self.fire_player)
+            self.interacting_players.append(self.fire_player)
         if pressed_key[pygame.K_RCTRL]:
-            interaction_list.append(self.water_player)
-        for player in interaction_list:
-            elem_sprite: Union[pygame.sprite.Sprite, ElementSprite]
-            elem_sprite = pygame.sprite.spritecollideany(player, self.elements_sprites)
-            if elem_sprite is not None:
-                elem_sprite.interact_with(player)
+            self.interacting_players.append(self.water_player)
+
+    def change_speed(self):
+        """Переключение множителя скорости игры"""
+        index = GAME_SPEEDS.index(self.speed) if self.speed in GAME_SPEEDS else -1
+        self.speed = GAME_SPEEDS[(index + 1) % len(GAME_SPEEDS)]
 
     def update(self):
-        """Обновление спрайтов"""
-        self.all_sprites.update()
+        """Один такт симуляции и обновление спрайтов"""
+        if self.replay_player is not None:
+            self.replay_player.apply(self)
+        if self.level_lost:
+            # После проигрыша симуляция остановлена до отмены хода или перезапуска
+            self.pending_moves.clear()
+        else:
+            self.update_simulation()
+
+        # Воспроизведение повтора заканчивается на такте, на котором попытка была прервана
+        if self.replay_player is not None and not self.game_over and \
+                self.replay_player.is_finished(self.simulation.tick_count):
+            self.game_over = True
+            self.with_end_screen = False
+
+    def update_simulation(self):
+        """Применение ввода, такт симуляции и обновление спрайтов"""
+        if self.recorder is not None:
+            self.recorder.record(self.simulation.tick_count, (self.fire_player, self.water_player),
+                                 self.pending_moves, self.interacting_players)
+        # Перед ходом игрока или началом взаимодействия сохраняется снимок для отмены хода
+        interacting = tuple(self.interacting_players)
+        if UNDO_ENABLED and (any(player is not None and not player.is_walking()
+                                 for player, _, _ in self.pending_moves) or
+                             interacting and interacting != self.previous_interacting):
+            self.save_undo_snapshot()
+        self.previous_interacting = interacting
+
+        for player, col, row in self.pending_moves:
+            self.simulation.move_player(player, col, row)
+        self.pending_moves.clear()
+        for player in self.interacting_players:
+            self.simulation.interact(player)
+        with self.profiler.phase(PHASE_SIMULATION):
+            self.simulation.update()
+        # Блоки уровня не меняются, поэтому обновляются только видимые динамические спрайты
+        if self.profiler.is_detailed():
+            self.update_sprites_profiled()
+        else:
+            self.update_sprites()
 
         # Запись информации о времени активации порталов
         if self.game_info is not None:
@@ -468,51 +542,115 @@ class Game:
                     self.water_exit.is_active:
                 self.game_info.set_time(TIME_WATER_EXIT_ACTIVATION)
 
-        # Уровень не пройден, если один из игроков не выжил
-        for player in [self.fire_player, self.water_player]:
-            if player is not None and not player.is_alive:
-                self.game_info.set_time(TIME_END_GAME)
-                self.game_info.set_stone_count(TIME_END_GAME,
-                                               len(self.fire_exit.ruby_sprites),
-                                               len(self.water_exit.aquamarine_sprites))
-                self.game_info.set_win_game(False)
+        # Уровень пройден, если оба игрока одновременно покинули его,
+        # и не пройден, если один из игроков не выжил.
+        # После проигрыша можно отменить ход или начать заново, поэтому результаты показываются по Enter.
+        if self.simulation.game_over:
+            self.game_info.set_time(TIME_END_GAME)
+            self.game_info.set_stone_count(TIME_END_GAME, *self.simulation.get_stone_count())
+            self.game_info.set_win_game(self.simulation.win_game)
+            if self.simulation.win_game or not UNDO_ENABLED:
+                # Воспроизведение повтора не меняет прогресс игрока
+                if self.simulation.win_game and self.replay_player is None:
+                    self.start_screen.unlock_new_level()
                 self.game_over = True
                 self.with_end_screen = True
-                return
-
-        # Уровень пройден, если произошло взаимодейтвие игроков с обоими выходами одновременно
-        if self.fire_exit is not None and self.fire_exit.is_interacted and \
-                self.water_exit is not None and self.water_exit.is_interacted:
-            self.game_info.set_time(TIME_END_GAME)
-            self.game_info.set_stone_count(TIME_END_GAME,
-                                           len(self.fire_exit.ruby_sprites),
-                                           len(self.water_exit.aquamarine_sprites))
-            self.game_info.set_win_game(True)
-            self.start_screen.unlock_new_level()
-            self.game_over = True
-            self.with_end_screen = True
-            return
-
-        # Сброс признака взаимодействия со всех элементов уровня
-        for elem_sprite in self.elements_sprites:
-            elem_sprite: Union[pygame.sprite.Sprite, ElementSprite]
-            elem_sprite.reset_interaction()
-
-    def display(self):
-        """Отрисовка элементов игры"""
-        self.screen.fill(COLOR_BLACK)
-        self.all_sprites.draw(self.screen)
-
-        pygame.display.flip()
+            else:
+                self.level_lost = True
+
+    def update_sprites_profiled(self):
+        """Обновление видимых динамических спрайтов с замером времени по классам спрайтов"""
+        for sprite in self.visible_sprites + self.player_sprites.sprites():
+            start_time = perf_counter()
+            sprite.update()
+            self.profiler.add(PHASE_SPRITES_PREFIX + type(sprite).__name__, (perf_counter() - start_time) * 1000)
+
+    def display(self, alpha=1.0):
+        """Отрисовка элементов игры.
+           alpha - доля времени, прошедшего с последнего такта симуляции до следующего."""
+        for sprite in self.player_sprites:
+            sprite.interpolate(alpha)
+        self.update_view()
+        self.renderer.set_overlay(self.get_lost_message() if self.level_lost else self.profiler.get_overlay())
+        self.renderer.draw()
+
+    def get_lost_message(self):
+        """Подсказка после проигрыша"""
+        if self.lost_message is None:
+            lines = [TextCache.render(text, 24, COLOR_WHITE) for text in
+                     ["Backspace - отменить ход", "R - начать заново", "Enter - результаты"]]
+            width = max(line.get_width() for line in lines) + 16
+            height = sum(line.get_height() for line in lines) + 16
+            self.lost_message = pygame.Surface((width, height), pygame.SRCALPHA, 32)
+            self.lost_message.fill((0, 0, 0, 180))
+            y = 8
+            for line in lines:
+                self.lost_message.blit(line, (8, y))
+                y += line.get_height()
+        return self.lost_message
+
+    def get_frame_ticks(self, frame_time):
+        """Количество тактов симуляции, которые нужно выполнить за кадр"""
+        if self.unthrottled:
+            self.tick_accumulator = 0.0
+            return UNTHROTTLED_TICKS_PER_FRAME
+
+        self.tick_accumulator += frame_time * self.speed
+        ticks = int(self.tick_accumulator // SIMULATION_TICK_DURATION)
+        self.tick_accumulator -= ticks * SIMULATION_TICK_DURATION
+        if ticks > MAX_TICKS_PER_FRAME:
+            # Компьютер не успевает: лишнее время отбрасывается
+            ticks = MAX_TICKS_PER_FRAME
+            self.tick_accumulator = 0.0
+        return ticks
+
+    def is_idle(self):
+        """Проверка, что в игре ничего не происходит и нет ввода игроков.
+           При воспроизведении повтора ввод ожидается в следующих тактах."""
+        return self.replay_player is None and not self.pending_moves and not self.interacting_players and \
+            (self.level_lost or self.simulation.is_idle())
+
+    def wait_idle(self):
+        """Ожидание события, пока в игре ничего не происходит.
+           Время ожидания не учитывается в симуляции."""
+        self.display()
+        event = pygame.event.wait(IDLE_EVENT_TIMEOUT)
+        if event.type != pygame.NOEVENT:
+            # Событие возвращается в очередь для обработки в основном цикле
+            pygame.event.post(event)
+        self.tick_accumulator = 0.0
+        self.clock.tick()
 
     def run(self):
-        """Основной цикл игры"""
+        """Основной цикл игры.
+           Симуляция выполняется с фиксированной частотой SIMULATION_FPS тактов в секунду
+           (с учётом множителя скорости), а отрисовка - так часто, как позволяет компьютер.
+           Когда в игре ничего не происходит, цикл ожидает события, не загружая процессор.
+           Время этапов каждого кадра замеряется, замеры сохраняются в конце уровня."""
+        self.tick_accumulator = 0.0
+        self.clock.tick()
         while not self.game_over:
-            self.process_events()
-            self.update()
-            self.display()
-
-            self.clock.tick(FPS)
+            if IDLE_POWER_SAVING and self.is_idle():
+                self.wait_idle()
+            self.profiler.begin_frame()
+            with self.profiler.phase(PHASE_TICK):
+                frame_time = self.clock.tick(0 if self.unthrottled else RENDER_FPS)
+            with self.profiler.phase(PHASE_EVENTS):
+                self.process_events()
+            for _ in range(self.get_frame_ticks(frame_time)):
+                with self.profiler.phase(PHASE_UPDATE):
+                    self.update()
+                if self.game_over:
+                    break
+            with self.profiler.phase(PHASE_DISPLAY):
+                self.display(self.tick_accumulator / SIMULATION_TICK_DURATION)
+            self.profiler.end_frame()
+        if FRAME_PROFILE_DUMP:
+            try:
+                self.profiler.save()
+            except OSError:
+                pass
+        self.save_replay()
 
     def show_start_screen(self):
         """Показ начального экрана"""
@@ -526,7 +664,13 @@ class Game:
 
 
 def main():
+    parser = argparse.ArgumentParser(description=TITLE)
+    parser.add_argument("--record", action="store_true",
+                        help=f"запись повтора каждой попытки в папку {DIR_NAME_REPLAYS}")
+    args = parser.parse_args()
+
     mygame = Game()
+    mygame.record_replays = mygame.record_replays or args.record
 
     while mygame.running:
         mygame.show_start_screen()
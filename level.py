@@ -0,0 +1,215 @@
+import mmap
+import struct
+import hashlib
+from constants import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Формат скомпилированного уровня: заголовок, блоки (по байту на клетку),
+# индексы блоков (по байту на клетку) и таблица элементов
+COMPILED_LEVEL_MAGIC = b"FWLV"
+COMPILED_LEVEL_VERSION = 2
+# Сигнатура, версия, ширина, высота,
+# позиции игроков 'Огонь' и 'Вода' (-1 - игрока нет), количество элементов
+COMPILED_LEVEL_HEADER = struct.Struct("<4sHIIiiiiI")
+# Обозначение элемента, столбец, строка
+COMPILED_LEVEL_ELEM = struct.Struct("<cII")
+
+
+def get_level_hash(levelname):
+    """Хэш текста уровня (для проверки, что повтор или сервер используют тот же уровень)"""
+    with open(os.path.join(LEVELS_DIR, levelname), "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+class Level:
+    """Уровень игры.
+       Без имени файла создаётся пустой уровень, который заполняется методом parse_level()."""
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.width, self.height = 0, 0
+        self.col_offset, self.row_offset = 0, 0
+        self.blocks = []
+        self.indexes = []
+        self.fire_player_pos = None
+        self.water_player_pos = None
+        self.elem_pos_dict = dict()
+        if filename is not None:
+            self.load_level(filename)
+
+    @staticmethod
+    def get_kind(elem):
+        """Определение вида элемента по его обозначению"""
+        return 1 if elem.isupper() else 0
+
+    def load_level(self, filename):
+        """Загрузка уровня.
+           Уровень загружается из скомпилированного файла в кэше, если он есть,
+           иначе разбирается текст уровня и скомпилированный файл сохраняется."""
+        fullname = os.path.join(LEVELS_DIR, filename)
+
+        with open(fullname, "rb") as f:
+            source = f.read()
+
+        compiled_filename = self.get_compiled_filename(source) if COMPILED_LEVELS else None
+        if compiled_filename is not None and self.load_compiled(compiled_filename):
+            return
+        self.parse_level([line.rstrip() for line in source.decode().splitlines()])
+        if compiled_filename is not None:
+            self.save_compiled(compiled_filename)
+
+    @staticmethod
+    def get_compiled_filename(source):
+        """Имя скомпилированного файла уровня по хэшу текста уровня"""
+        return os.path.join(LEVEL_CACHE_DIR, hashlib.sha256(source).hexdigest() + ".lvl")
+
+    def load_compiled(self, filename):
+        """Загрузка скомпилированного уровня через отображение файла в память.
+           Возвращает False, если файла нет или он не подходит."""
+        try:
+            with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, version, width, height, fire_col, fire_row, water_col, water_row, elem_count = \
+                    COMPILED_LEVEL_HEADER.unpack_from(data)
+                if magic != COMPILED_LEVEL_MAGIC or version != COMPILED_LEVEL_VERSION:
+                    return False
+                cell_count = width * height
+                blocks_start = COMPILED_LEVEL_HEADER.size
+                indexes_start = blocks_start + cell_count
+                elems_start = indexes_start + cell_count
+                if len(data) != elems_start + elem_count * COMPILED_LEVEL_ELEM.size:
+                    return False
+
+                blocks = data[blocks_start:indexes_start].decode()
+                indexes = data[indexes_start:elems_start]
+                elem_pos_dict = dict()
+                for elem, col, row in COMPILED_LEVEL_ELEM.iter_unpack(data[elems_start:]):
+                    elem_pos_dict.setdefault(elem.decode(), []).append((col, row))
+        except (OSError, ValueError, struct.error, UnicodeDecodeError):
+            return False
+
+        self.width, self.height = width, height
+        self.set_offset()
+        self.blocks = [list(blocks[row * width:(row + 1) * width]) for row in range(height)]
+        self.indexes = [list(indexes[row * width:(row + 1) * width]) for row in range(height)]
+        self.fire_player_pos = (fire_col, fire_row) if fire_col >= 0 else None
+        self.water_player_pos = (water_col, water_row) if water_col >= 0 else None
+        self.elem_pos_dict = elem_pos_dict
+        return True
+
+    def save_compiled(self, filename):
+        """Сохранение скомпилированного уровня. Ошибки записи не мешают игре."""
+        fire_col, fire_row = self.fire_player_pos if self.fire_player_pos is not None else (-1, -1)
+        water_col, water_row = self.water_player_pos if self.water_player_pos is not None else (-1, -1)
+        elems = [(elem.encode(), col, row) for elem, positions in self.elem_pos_dict.items()
+                 for col, row in positions]
+        data = bytearray(COMPILED_LEVEL_HEADER.pack(
+            COMPILED_LEVEL_MAGIC, COMPILED_LEVEL_VERSION, self.width, self.height,
+            fire_col, fire_row, water_col, water_row, len(elems)))
+        data += "".join("".join(line) for line in self.blocks).encode()
+        data += bytes(index for line in self.indexes for index in line)
+        for elem in elems:
+            data += COMPILED_LEVEL_ELEM.pack(*elem)
+
+        # Запись через временный файл, чтобы другой процесс не прочитал файл частично
+        temp_filename = f"{filename}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(temp_filename, "wb") as f:
+                f.write(data)
+            os.replace(temp_filename, filename)
+        except OSError:
+            pass
+
+    def set_offset(self):
+        """Определение сдвига при отображении спрайтов уровня.
+           Уровень меньше видимой области показывается по центру экрана, больший уровень не сдвигается."""
+        self.col_offset = max((VIEW_SIZE - self.width) // 2, 0)
+        self.row_offset = max((VIEW_SIZE - self.height) // 2, 0)
+
+    def parse_level(self, data):
+        """Разбор текста уровня. Размер уровня не ограничен."""
+        # Определение размеров уровня
+        self.width = max(map(len, data), default=0)
+        self.height = len(data)
+        self.set_offset()
+        # Добавление пустых элементов в неполных строках
+        data = [line.ljust(self.width, LEVEL_BLOCK_EMPTY) for line in data]
+
+        # Множество обозначений блоков
+        blocks_set = {LEVEL_BLOCK_EMPTY, LEVEL_BLOCK_WALL, LEVEL_BLOCK_FLOOR,
+                      LEVEL_BLOCK_LAVA, LEVEL_BLOCK_RIVER, LEVEL_BLOCK_ACID}
+        # Меожество обозначений элементов,
+        # которые могут присутствовать на уровне в единственном экземпляре
+        elem_single_set = {LEVEL_ELEM_FIRE_EXIT, LEVEL_ELEM_WATER_EXIT,
+                           LEVEL_ELEM_INPUT_PORTAL_1, LEVEL_ELEM_INPUT_PORTAL_2,
+                           LEVEL_ELEM_OUTPUT_PORTAL_1, LEVEL_ELEM_OUTPUT_PORTAL_2}
+        # Меожество обозначений элементов,
+        # которые может быть несколько на уровне
+        elems_multi_set = {LEVEL_ELEM_RUBY, LEVEL_ELEM_AQUAMARINE,
+                           LEVEL_ELEM_DOORBUTTON_1, LEVEL_ELEM_DOORBUTTON_2,
+                           LEVEL_ELEM_DOOR_1, LEVEL_ELEM_DOOR_2,
+                           LEVEL_ELEM_PORTAL_SWITCH_1, LEVEL_ELEM_PORTAL_SWITCH_2}
+
+        # Заполнение данных об уровне
+        self.blocks = [[0] * self.width for _ in range(self.height)]
+        for row, line in enumerate(data):
+            for col, elem in enumerate(line):
+                self.blocks[row][col] = elem if elem in blocks_set else LEVEL_BLOCK_FLOOR
+                if elem == LEVEL_PLAYER_FIRE:
+                    self.fire_player_pos = col, row
+                elif elem == LEVEL_PLAYER_WATER:
+                    self.water_player_pos = col, row
+                elif elem in elem_single_set:
+                    self.elem_pos_dict[elem] = [(col, row)]
+                elif elem in elems_multi_set:
+                    if elem not in self.elem_pos_dict:
+                        self.elem_pos_dict[elem] = []
+                    self.elem_pos_dict[elem].append((col, row))
+
+        # Подсчёт индексов на уровне
+        self.indexes = [[0] * self.width for _ in range(self.height)]
+        self.calculate_indexes()
+
+    def calculate_indexes(self):
+        """Расчёт индексов блоков уровня с учётом соседних блоков того же типа.
+           Если установлен NumPy, расчёт выполняется для всего уровня сразу."""
+        if numpy is not None and self.width and self.height:
+            self.calculate_indexes_numpy()
+        else:
+            self.calculate_indexes_python()
+
+    def calculate_indexes_numpy(self):
+        """Расчёт индексов сравнением массива блоков с его сдвигами на клетку в четырёх направлениях"""
+        blocks = numpy.frombuffer("".join("".join(line) for line in self.blocks).encode(),
+                                  dtype=numpy.uint8).reshape(self.height, self.width)
+        indexes = numpy.zeros((self.height, self.width), dtype=numpy.uint8)
+        # Сосед сверху - 1, справа - 2, снизу - 4, слева - 8
+        indexes[1:, :] += (blocks[1:, :] == blocks[:-1, :]) * numpy.uint8(1)
+        indexes[:, :-1] += (blocks[:, :-1] == blocks[:, 1:]) * numpy.uint8(2)
+        indexes[:-1, :] += (blocks[:-1, :] == blocks[1:, :]) * numpy.uint8(4)
+        indexes[:, 1:] += (blocks[:, 1:] == blocks[:, :-1]) * numpy.uint8(8)
+        self.indexes = indexes.tolist()
+
+    def calculate_indexes_python(self):
+        """Расчёт индексов по клеткам (без NumPy)"""
+        for row in range(self.height):
+            for col in range(self.width):
+                if self.indexes[row][col] < 0:
+                    continue
+                index = 0
+                near_list = [(col, row - 1, 1), (col + 1, row, 2),
+                             (col, row + 1, 4), (col - 1, row, 8)]
+                for near_col, near_row, weight in near_list:
+                    if not self.cell_on_board(near_col, near_row):
+                        continue
+                    if self.blocks[near_row][near_col] == self.blocks[row][col]:
+                        index += weight
+                self.indexes[row][col] = index
+
+    def cell_on_board(self, col, row):
+        """Проверка на присутствие координат на игровом уровне"""
+        return 0 <= col < self.width and 0 <= row < self.height
@@ -0,0 +1,434 @@
+import sys
+import random
+import select
+import socket
+import asyncio
+import argparse
+from typing import Optional
+import pygame
+from constants import *
+from snapshots import Snapshot
+from game import Game
+from level import get_level_hash
+from simulation import EVENT_MOVE, EVENT_INTERACT, EVENT_UNDO, MOVE_DIRECTIONS
+from server import GameServer, SessionMirror, SERVER_HOST, SERVER_PORT, MESSAGE_HEADER, MESSAGE_MAX_SIZE
+from server import MSG_INPUT, MSG_RESTART, MSG_LEAVE, MSG_WELCOME, MSG_UPDATE, MSG_ERROR, INPUT_HEADER
+from server import ROLE_BOTH, ROLE_FIRE, ROLE_WATER, ROLE_NAMES, ROLE_PLAYER_MASKS, pack_join, pack_message
+
+# Ожидание подключения к серверу (в секундах)
+NETWORK_CONNECT_TIMEOUT = 5
+# Наибольшее количество тактов, которые клиент повторяет при согласовании с сервером.
+# Если клиент отстал или опередил сервер сильнее, он переходит к такту сервера без предсказания.
+PREDICTION_MAX_TICKS = 60
+# Порт прокси с задержкой по умолчанию
+PROXY_PORT = SERVER_PORT + 1
+
+# Клавиши перемещения: для своего игрока подходят и WASD, и стрелки
+MOVE_KEYS = {pygame.K_a: (-1, 0), pygame.K_d: (1, 0), pygame.K_w: (0, -1), pygame.K_s: (0, 1),
+             pygame.K_LEFT: (-1, 0), pygame.K_RIGHT: (1, 0), pygame.K_UP: (0, -1), pygame.K_DOWN: (0, 1)}
+
+
+class Prediction:
+    """Предсказание состояния сессии на клиенте.
+       Ввод своих игроков применяется к локальной симуляции сразу, не дожидаясь сервера.
+       Получив состояние сервера, клиент восстанавливает его и заново выполняет такты
+       с ещё не подтверждёнными вводами, поэтому ошибки предсказания (ходы другого игрока,
+       отменённые ходы) исправляются, а свои ходы не задерживаются на время передачи.
+       Соответствие тактов клиента и сервера определяется по подтверждениям ввода:
+       ввод, применённый на такте клиента L, сервер применил на такте L - tick_offset."""
+
+    def __init__(self, simulation, mirror):
+        self.simulation = simulation
+        self.mirror = mirror
+        self.players = (simulation.fire_player, simulation.water_player)
+        self.player_mask = ROLE_PLAYER_MASKS[mirror.role]
+
+        # Такт клиента и его разница с тактом сервера
+        self.tick_count = mirror.tick_count
+        self.tick_offset = 0
+        self.simulation.tick_count = mirror.tick_count
+        # Неподтверждённый ввод: (номер ввода, такт клиента, коды событий)
+        self.sequence = 0
+        self.pending = []
+        # Взаимодействие своих игроков
+        self.interaction_mask = 0
+        # Количество исправлений предсказания своих игроков
+        self.corrections = 0
+
+    def add_input(self, codes):
+        """Ввод своих игроков, который применяется на следующем такте. Возвращает номер ввода."""
+        self.sequence += 1
+        self.pending.append((self.sequence, self.tick_count + 1, bytes(codes)))
+        return self.sequence
+
+    def apply_codes(self, codes):
+        """Применение ввода к локальной симуляции. Отмена хода выполняется только сервером."""
+        for code in codes:
+            if code == EVENT_UNDO:
+                continue
+            if code >= EVENT_INTERACT:
+                self.interaction_mask = (code - EVENT_INTERACT) & self.player_mask
+            else:
+                player_index, direction = divmod(code - EVENT_MOVE, len(MOVE_DIRECTIONS))
+                if self.player_mask & (1 << player_index):
+                    self.simulation.move_player(self.players[player_index], *MOVE_DIRECTIONS[direction])
+
+    def simulate(self, first_tick, last_tick):
+        """Такты клиента first_tick..last_tick. Ввод, который должен был быть применён раньше
+           first_tick, но ещё не применён сервером, применяется на первом такте."""
+        remote_mask = self.mirror.interaction_mask & ~self.player_mask
+        for tick in range(first_tick, last_tick + 1):
+            for _, input_tick, codes in self.pending:
+                if input_tick == tick or tick == first_tick and input_tick < first_tick:
+                    self.apply_codes(codes)
+            mask = self.interaction_mask | remote_mask
+            for index, player in enumerate(self.players):
+                if mask & (1 << index):
+                    self.simulation.interact(player)
+            self.simulation.update()
+
+    def tick(self):
+        """Один такт клиента"""
+        self.tick_count += 1
+        self.simulate(self.tick_count, self.tick_count)
+
+    def get_local_states(self):
+        return [player.get_state() for index, player in enumerate(self.players)
+                if player is not None and self.player_mask & (1 << index)]
+
+    def reconcile(self):
+        """Согласование с состоянием сервера после получения изменений"""
+        mirror = self.mirror
+        if len(mirror.players) < len(self.simulation.players):
+            # Полное состояние ещё не получено
+            return
+        for sequence, input_tick, _ in self.pending:
+            if sequence == mirror.ack_sequence:
+                self.tick_offset = input_tick - mirror.ack_tick
+        self.pending = [item for item in self.pending if item[0] > mirror.ack_sequence]
+
+        predicted = self.get_local_states()
+        players = tuple(mirror.players[index] for index, player in enumerate(self.players) if player is not None)
+        self.simulation.restore_snapshot(Snapshot(mirror.tick_count, mirror.game_over, mirror.win_game, players,
+                                                  Snapshot.share_chunks(mirror.elements), ()))
+        self.interaction_mask = mirror.interaction_mask & self.player_mask
+
+        # Такт клиента, соответствующий состоянию сервера
+        server_tick = mirror.tick_count + self.tick_offset
+        if 0 <= self.tick_count - server_tick <= PREDICTION_MAX_TICKS:
+            self.simulate(server_tick + 1, self.tick_count)
+        else:
+            self.tick_count = server_tick
+        if self.get_local_states() != predicted:
+            self.corrections += 1
+
+
+class NetworkConnection:
+    """Соединение с сервером без asyncio для клиента на pygame.
+       Сообщения сервера читаются без ожидания в каждом кадре."""
+
+    def __init__(self, levelname, host=SERVER_HOST, port=SERVER_PORT, role=ROLE_BOTH, room=""):
+        self.socket = socket.create_connection((host, port), NETWORK_CONNECT_TIMEOUT)
+        # Короткие сообщения ввода отправляются сразу, без накопления
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = bytearray()
+        self.closed = False
+        self.send(pack_join(levelname, role, room))
+
+        messages = self.receive(NETWORK_CONNECT_TIMEOUT)
+        if not messages:
+            raise ConnectionError("no response from server")
+        message_type, payload = messages.pop(0)
+        if message_type == MSG_ERROR:
+            raise ConnectionError(payload.decode(errors="replace"))
+        if message_type != MSG_WELCOME:
+            raise ConnectionError("unexpected message from server")
+        self.mirror = SessionMirror(payload)
+        # Сообщения, полученные вместе с приветствием
+        self.messages = messages
+
+    def send(self, data):
+        self.socket.sendall(data)
+
+    def receive(self, timeout=0):
+        """Полученные сообщения: список пар (тип, данные)"""
+        while not self.closed and select.select([self.socket], [], [], timeout)[0]:
+            data = self.socket.recv(65536)
+            if not data:
+                self.closed = True
+                break
+            self.buffer += data
+            timeout = 0
+
+        messages = []
+        while len(self.buffer) >= MESSAGE_HEADER.size:
+            message_type, length = MESSAGE_HEADER.unpack_from(self.buffer)
+            if length > MESSAGE_MAX_SIZE:
+                raise ConnectionError("message is too long")
+            if len(self.buffer) < MESSAGE_HEADER.size + length:
+                break
+            messages.append((message_type, bytes(self.buffer[MESSAGE_HEADER.size:MESSAGE_HEADER.size + length])))
+            del self.buffer[:MESSAGE_HEADER.size + length]
+        return messages
+
+    def poll(self):
+        """Применение полученных изменений к копии состояния сессии.
+           Возвращает True, если изменения были. При ошибке сервера выбрасывается ConnectionError."""
+        messages = self.messages + self.receive()
+        self.messages = []
+        updated = False
+        for message_type, payload in messages:
+            if message_type == MSG_ERROR:
+                raise ConnectionError(payload.decode(errors="replace"))
+            if message_type == MSG_UPDATE:
+                self.mirror.apply_update(payload)
+                updated = True
+        if self.closed and not updated:
+            raise ConnectionError("server closed the connection")
+        return updated
+
+    def send_input(self, sequence, codes):
+        self.send(pack_message(MSG_INPUT, INPUT_HEADER.pack(sequence) + bytes(codes)))
+
+    def close(self):
+        try:
+            self.send(pack_message(MSG_LEAVE))
+        except OSError:
+            pass
+        self.socket.close()
+
+
+class NetworkGame(Game):
+    """Игра по сети: каждый игрок управляет своим персонажем на своём компьютере.
+       Правила выполняются на сервере, клиент предсказывает состояние (см. Prediction)
+       и отображает его. Отмена хода (Backspace) и перезапуск (R) выполняются для обоих игроков."""
+
+    def __init__(self, connection):
+        super().__init__()
+        self.connection = connection
+        self.prediction: Optional[Prediction] = None
+        self.network_error = None
+        self.interaction_mask = 0
+
+    def new_game(self, levelname, replay=None):
+        super().new_game(levelname)
+        # Повтор записывает сервер, отмена ходов - тоже
+        self.recorder = None
+        self.prediction = Prediction(self.simulation, self.connection.mirror)
+        pygame.display.set_caption(f"{TITLE} - {ROLE_NAMES[self.connection.mirror.role]}")
+
+    def send_input(self, codes):
+        sequence = self.prediction.add_input(codes)
+        self.connection.send_input(sequence, codes)
+
+    def process_events(self):
+        """Обработка событий: ввод своих игроков отправляется на сервер и сразу предсказывается"""
+        mirror = self.connection.mirror
+        codes = []
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                sys.exit()
+            if event.type != pygame.KEYDOWN:
+                continue
+            if event.key == pygame.K_ESCAPE or event.key == pygame.K_RETURN and self.level_lost:
+                self.game_over = True
+                self.with_end_screen = self.level_lost
+            elif event.key == pygame.K_F3:
+                self.profiler.toggle_overlay()
+            elif event.key == pygame.K_BACKSPACE and UNDO_ENABLED:
+                codes.append(EVENT_UNDO)
+            elif event.key == pygame.K_r:
+                self.connection.send(pack_message(MSG_RESTART))
+            elif event.key in MOVE_KEYS:
+                # Клиент с обоими игроками управляет ими как в обычной игре
+                if mirror.role == ROLE_BOTH:
+                    player_index = 0 if event.key in (pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s) else 1
+                else:
+                    player_index = 0 if mirror.role == ROLE_FIRE else 1
+                codes.append(EVENT_MOVE + player_index * len(MOVE_DIRECTIONS) +
+                             MOVE_DIRECTIONS.index(MOVE_KEYS[event.key]))
+
+        pressed_key = pygame.key.get_pressed()
+        mask = 0
+        if mirror.role == ROLE_BOTH:
+            mask = pressed_key[pygame.K_LCTRL] | pressed_key[pygame.K_RCTRL] << 1
+        elif pressed_key[pygame.K_LCTRL] or pressed_key[pygame.K_RCTRL]:
+            mask = ROLE_PLAYER_MASKS[mirror.role]
+        if mask != self.interaction_mask:
+            self.interaction_mask = mask
+            codes.append(EVENT_INTERACT + mask)
+        if codes:
+            try:
+                self.send_input(codes)
+            except OSError as error:
+                self.network_error = str(error)
+
+    def update(self):
+        """Такт клиента: согласование с полученным состоянием сервера и предсказание"""
+        try:
+            if self.connection.poll():
+                self.prediction.reconcile()
+        except (ConnectionError, OSError) as error:
+            self.network_error = str(error)
+        if self.network_error is not None:
+            self.game_over = True
+            return
+
+        self.prediction.tick()
+        # Камни, возвращённые отменой хода, снова отображаются
+        if any(not sprite.element.is_removed and not sprite.alive() for sprite in self.visible_sprites):
+            self.sync_sprites()
+        self.update_sprites()
+
+        # Результат попытки определяет только сервер
+        mirror = self.connection.mirror
+        self.level_lost = mirror.game_over and not mirror.win_game
+        if mirror.game_over and mirror.win_game:
+            self.game_info.set_time(TIME_END_GAME)
+            self.game_info.set_stone_count(TIME_END_GAME, *self.simulation.get_stone_count())
+            self.game_info.set_win_game(True)
+            self.start_screen.unlock_new_level()
+            self.game_over = True
+            self.with_end_screen = True
+
+    def is_idle(self):
+        # Состояние может измениться по сообщению сервера
+        return False
+
+
+class LatencyProxy:
+    """Прокси для проверки игры по сети: передаёт данные между клиентом и сервером
+       с задержкой delay (и случайным разбросом jitter) миллисекунд в каждую сторону.
+       Порядок данных сохраняется."""
+
+    def __init__(self, target_host, target_port, delay, jitter=0.0, seed=None):
+        self.target_host = target_host
+        self.target_port = target_port
+        self.delay = delay / 1000
+        self.jitter = jitter / 1000
+        self.random = random.Random(seed)
+        self.server = None
+
+    async def start(self, host=SERVER_HOST, port=PROXY_PORT):
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def get_port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle_client(self, client_reader, client_writer):
+        try:
+            server_reader, server_writer = await asyncio.open_connection(self.target_host, self.target_port)
+        except OSError:
+            client_writer.close()
+            return
+        await asyncio.gather(self.pipe(client_reader, server_writer), self.pipe(server_reader, client_writer),
+                             return_exceptions=True)
+
+    async def pipe(self, reader, writer):
+        """Передача данных в одну сторону с задержкой"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        async def deliver():
+            while True:
+                send_time, data = await queue.get()
+                delay = send_time - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if not data:
+                    writer.close()
+                    return
+                writer.write(data)
+
+        task = asyncio.create_task(deliver())
+        last_time = 0.0
+        try:
+            while True:
+                try:
+                    data = await reader.read(65536)
+                except ConnectionError:
+                    data = b""
+                # Данные не обгоняют отправленные раньше
+                last_time = max(last_time, loop.time() + self.delay + self.random.uniform(-self.jitter, self.jitter))
+                queue.put_nowait((last_time, data))
+                if not data:
+                    break
+            await task
+        finally:
+            task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Игра по сети: каждый игрок на своём компьютере")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    host_parser = subparsers.add_parser("host", help="запуск сервера")
+    host_parser.add_argument("--host", default="0.0.0.0", help="адрес сервера")
+    host_parser.add_argument("--port", type=int, default=SERVER_PORT, help="порт сервера")
+
+    join_parser = subparsers.add_parser("join", help="подключение к серверу")
+    join_parser.add_argument("level", help="имя файла уровня в папке уровней")
+    join_parser.add_argument("--role", choices=["fire", "water", "both"], default="both", help="свой игрок")
+    join_parser.add_argument("--room", default="", help="имя комнаты (игроки одной комнаты играют вместе)")
+    join_parser.add_argument("--host", default=SERVER_HOST, help="адрес сервера")
+    join_parser.add_argument("--port", type=int, default=SERVER_PORT, help="порт сервера")
+
+    proxy_parser = subparsers.add_parser("proxy", help="прокси с задержкой для проверки игры по сети")
+    proxy_parser.add_argument("--listen-port", type=int, default=PROXY_PORT, help="порт прокси")
+    proxy_parser.add_argument("--host", default=SERVER_HOST, help="адрес сервера")
+    proxy_parser.add_argument("--port", type=int, default=SERVER_PORT, help="порт сервера")
+    proxy_parser.add_argument("--delay", type=float, default=50.0, help="задержка в одну сторону (мс)")
+    proxy_parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки (мс)")
+    args = parser.parse_args()
+
+    if args.command in ("host", "proxy"):
+        async def serve():
+            if args.command == "host":
+                server = GameServer()
+                await server.start(args.host, args.port)
+                print(f"serving on {args.host}:{args.port}")
+            else:
+                server = LatencyProxy(args.host, args.port, args.delay, args.jitter)
+                await server.start(SERVER_HOST, args.listen_port)
+                print(f"proxy {SERVER_HOST}:{args.listen_port} -> {args.host}:{args.port}, delay {args.delay} ms")
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await server.stop()
+
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    role = {"fire": ROLE_FIRE, "water": ROLE_WATER, "both": ROLE_BOTH}[args.role]
+    try:
+        connection = NetworkConnection(args.level, args.host, args.port, role, args.room)
+    except (OSError, ConnectionError) as error:
+        print(f"cannot join: {error}")
+        sys.exit(2)
+    if connection.mirror.level_hash != get_level_hash(args.level):
+        print(f"level {args.level} differs from the server's one")
+        connection.close()
+        sys.exit(2)
+
+    game = NetworkGame(connection)
+    game.new_game(args.level)
+    game.run()
+    if game.network_error is not None:
+        print(f"network error: {game.network_error}", file=sys.stderr)
+    elif game.with_end_screen:
+        game.show_end_screen()
+    connection.close()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
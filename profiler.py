@@ -0,0 +1,194 @@
+import csv
+import json
+from time import perf_counter
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime as dt
+from typing import Optional
+import pygame
+from constants import *
+from functions import TextCache
+from stats import get_percentile
+
+# Этапы кадра
+PHASE_TICK = "tick"
+PHASE_EVENTS = "events"
+PHASE_UPDATE = "update"
+PHASE_SIMULATION = "simulation"
+PHASE_DISPLAY = "display"
+PHASE_FRAME = "frame"
+# Префикс этапов обновления спрайтов отдельных классов
+PHASE_SPRITES_PREFIX = "sprites:"
+
+PERCENTILES = (50, 95, 99)
+
+OVERLAY_FONT_SIZE = 14
+OVERLAY_PADDING = 4
+OVERLAY_BACKGROUND = (0, 0, 0, 180)
+
+
+class FrameProfiler:
+    """Замер времени этапов кадра основного цикла игры.
+       Для последних FRAME_PROFILE_WINDOW кадров хранится время каждого этапа (в миллисекундах),
+       по которому считаются процентили. Количество пропущенных кадров считается за весь уровень."""
+
+    def __init__(self, window=FRAME_PROFILE_WINDOW, enabled=FRAME_PROFILING):
+        self.enabled = enabled
+        self.window = window
+        self.levelname = None
+
+        # Время этапов по кадрам: этап -> значения за последние кадры
+        self.samples = dict()
+        # Время этапов текущего кадра
+        self.current = dict()
+        self.frame_start = None
+
+        self.frame_count = 0
+        self.dropped_frames = 0
+        self.frame_budget = 1000 / (RENDER_FPS or SIMULATION_FPS)
+
+        # Наложение со статистикой и время его последнего обновления
+        self.overlay_visible = False
+        self.overlay: Optional[pygame.Surface] = None
+        self.overlay_time = 0
+
+    def reset(self, levelname=None):
+        """Сброс замеров перед началом уровня"""
+        self.levelname = levelname
+        self.samples.clear()
+        self.current.clear()
+        self.frame_start = None
+        self.frame_count = 0
+        self.dropped_frames = 0
+        self.overlay = None
+
+    def is_detailed(self):
+        """Замер времени обновления спрайтов по классам. Он требует замера каждого спрайта,
+           поэтому выполняется только при показанном наложении или сохранении замеров."""
+        return self.enabled and (self.overlay_visible or FRAME_PROFILE_DUMP)
+
+    def add(self, name, duration):
+        """Добавление времени (в миллисекундах) к этапу текущего кадра"""
+        self.current[name] = self.current.get(name, 0.0) + duration
+
+    @contextmanager
+    def phase(self, name):
+        """Замер времени этапа текущего кадра"""
+        if not self.enabled:
+            yield
+            return
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (perf_counter() - start_time) * 1000)
+
+    def begin_frame(self):
+        """Начало кадра. Время между кадрами (ожидание событий в простое) не учитывается."""
+        if self.enabled:
+            self.current.clear()
+            self.frame_start = perf_counter()
+
+    def end_frame(self):
+        """Завершение кадра и сохранение времени его этапов"""
+        if not self.enabled or self.frame_start is None:
+            return
+        frame_time = (perf_counter() - self.frame_start) * 1000
+        self.frame_start = None
+        self.current[PHASE_FRAME] = frame_time
+        self.frame_count += 1
+        if frame_time > self.frame_budget * FRAME_DROP_FACTOR:
+            self.dropped_frames += 1
+
+        for name in self.current.keys() - self.samples.keys():
+            # Этап впервые встретился: в предыдущих кадрах его время нулевое
+            self.samples[name] = deque([0.0] * len(self.samples.get(PHASE_FRAME, ())), maxlen=self.window)
+        for name, values in self.samples.items():
+            values.append(self.current.get(name, 0.0))
+        self.current.clear()
+
+    def get_phase_names(self):
+        """Имена этапов в порядке выполнения, затем спрайты по классам и кадр целиком"""
+        order = [PHASE_TICK, PHASE_EVENTS, PHASE_UPDATE, PHASE_SIMULATION]
+        names = [name for name in order if name in self.samples]
+        names += sorted(name for name in self.samples if name.startswith(PHASE_SPRITES_PREFIX))
+        names += [name for name in (PHASE_DISPLAY, PHASE_FRAME) if name in self.samples]
+        return names
+
+    def get_report(self):
+        """Статистика: процентили времени этапов за последние кадры и пропущенные кадры"""
+        phases = dict()
+        for name in self.get_phase_names():
+            values = sorted(self.samples[name])
+            phases[name] = {f"p{percentile}": round(get_percentile(values, percentile), 3)
+                            for percentile in PERCENTILES}
+            phases[name]["max"] = round(values[-1], 3) if values else 0.0
+        return {"level": self.levelname, "frames": self.frame_count,
+                "dropped_frames": self.dropped_frames, "frame_budget_ms": round(self.frame_budget, 3),
+                "window": len(self.samples.get(PHASE_FRAME, ())), "phases": phases}
+
+    def save(self, directory=PROFILES_DIR):
+        """Сохранение замеров: время этапов последних кадров в CSV и статистика в JSON.
+           Возвращает имена файлов или None, если замеров нет."""
+        if not self.samples:
+            return None
+        name = os.path.splitext(os.path.basename(self.levelname or "level"))[0]
+        basename = os.path.join(directory, f"{name}_{dt.now().strftime('%Y%m%d_%H%M%S')}")
+        names = self.get_phase_names()
+        os.makedirs(directory, exist_ok=True)
+        with open(basename + ".csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame"] + names)
+            first_frame = self.frame_count - len(self.samples[PHASE_FRAME])
+            for index, row in enumerate(zip(*(self.samples[name] for name in names))):
+                writer.writerow([first_frame + index] + [f"{value:.3f}" for value in row])
+        with open(basename + ".json", "w") as f:
+            json.dump(self.get_report(), f, indent=1)
+        return basename + ".csv", basename + ".json"
+
+    def toggle_overlay(self):
+        """Показ и скрытие наложения со статистикой"""
+        self.overlay_visible = not self.overlay_visible
+        self.overlay = None
+
+    def get_overlay(self):
+        """Поверхность наложения со статистикой (None, если наложение скрыто).
+           Перерисовывается не чаще, чем раз в PROFILE_OVERLAY_INTERVAL миллисекунд."""
+        if not self.overlay_visible:
+            return None
+        ticks = pygame.time.get_ticks()
+        if self.overlay is None or ticks - self.overlay_time >= PROFILE_OVERLAY_INTERVAL:
+            self.overlay = self.render_overlay()
+            self.overlay_time = ticks
+        return self.overlay
+
+    def render_overlay(self):
+        """Отрисовка наложения: процентили этапов и пропущенные кадры.
+           Столбцы выравниваются по ширине надписей, поэтому моноширинный шрифт не нужен."""
+        report = self.get_report()
+        rows = [["ms"] + [f"p{percentile}" for percentile in PERCENTILES]]
+        for name, values in report["phases"].items():
+            rows.append([name] + [f"{values[f'p{percentile}']:.2f}" for percentile in PERCENTILES])
+        rows.append([f"dropped {report['dropped_frames']} / {report['frames']}"])
+
+        # Строки меняются в каждом обновлении, поэтому не сохраняются в кэше надписей
+        font = TextCache.get_font(FONT_NAME, OVERLAY_FONT_SIZE)
+        images = [[font.render(text, True, COLOR_WHITE) for text in row] for row in rows]
+        column_count = len(rows[0])
+        widths = [max(row[col].get_width() for row in images if len(row) == column_count)
+                  for col in range(column_count)]
+        line_height = font.get_linesize()
+        width = max(sum(widths) + OVERLAY_PADDING * (column_count + 1),
+                    max(row[0].get_width() for row in images) + OVERLAY_PADDING * 2)
+        height = line_height * len(images) + OVERLAY_PADDING * 2
+        overlay = pygame.Surface((width, height), pygame.SRCALPHA, 32)
+        overlay.fill(OVERLAY_BACKGROUND)
+        for index, row in enumerate(images):
+            y = OVERLAY_PADDING + index * line_height
+            x = OVERLAY_PADDING
+            for col, image in enumerate(row):
+                # Название этапа выравнивается влево, значения - вправо
+                offset = widths[col] - image.get_width() if col > 0 else 0
+                overlay.blit(image, (x + offset, y))
+                x += widths[col] + OVERLAY_PADDING
+        return overlay
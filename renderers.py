@@ -0,0 +1,237 @@
+import pygame
+from typing import Optional
+from collections import OrderedDict
+from constants import *
+from camera import LevelView
+from sprites import BLOCK_SPRITES
+
+
+class LevelBackground:
+    """Фон уровня из неизменяемых блоков, разделённый на участки BACKGROUND_CHUNK_SIZE x BACKGROUND_CHUNK_SIZE клеток.
+       Участок рисуется, когда впервые попадает в видимую область. В кэше хранятся последние
+       BACKGROUND_CACHE_CHUNKS участков, поэтому объём памяти не зависит от размера уровня."""
+
+    def __init__(self, level):
+        self.level = level
+        self.chunks = OrderedDict()
+        # Количество нарисованных участков (с учётом повторно нарисованных после вытеснения из кэша)
+        self.drawn_chunks = 0
+
+    def get_rect(self):
+        """Границы уровня в пикселях"""
+        return pygame.Rect(self.level.col_offset * SPRITE_SIZE, self.level.row_offset * SPRITE_SIZE,
+                           self.level.width * SPRITE_SIZE, self.level.height * SPRITE_SIZE)
+
+    def get_chunk(self, chunk_col, chunk_row):
+        """Поверхность участка из кэша или нарисованная заново"""
+        key = (chunk_col, chunk_row)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+
+        level = self.level
+        chunk = pygame.Surface((BACKGROUND_CHUNK_SIZE * SPRITE_SIZE, BACKGROUND_CHUNK_SIZE * SPRITE_SIZE)).convert()
+        chunk.fill(COLOR_BLACK)
+        first_col, first_row = chunk_col * BACKGROUND_CHUNK_SIZE, chunk_row * BACKGROUND_CHUNK_SIZE
+        for row in range(first_row, min(first_row + BACKGROUND_CHUNK_SIZE, level.height)):
+            blocks, indexes = level.blocks[row], level.indexes[row]
+            for col in range(first_col, min(first_col + BACKGROUND_CHUNK_SIZE, level.width)):
+                sprite_class = BLOCK_SPRITES.get(blocks[col])
+                if sprite_class is not None:
+                    chunk.blit(sprite_class.get_block_image(indexes[col]),
+                               ((col - first_col) * SPRITE_SIZE, (row - first_row) * SPRITE_SIZE))
+        self.chunks[key] = chunk
+        self.drawn_chunks += 1
+        while len(self.chunks) > BACKGROUND_CACHE_CHUNKS:
+            self.chunks.popitem(last=False)
+        return chunk
+
+    def draw(self, surface, camera):
+        """Отрисовка участков, которые видны камерой, в её области экрана"""
+        chunk_pixels = BACKGROUND_CHUNK_SIZE * SPRITE_SIZE
+        level_rect = self.get_rect()
+        visible = camera.rect.clip(level_rect).move(-level_rect.x, -level_rect.y)
+        if not visible.width or not visible.height:
+            return
+        clip = surface.get_clip()
+        surface.set_clip(camera.viewport)
+        for chunk_row in range(visible.top // chunk_pixels, (visible.bottom - 1) // chunk_pixels + 1):
+            for chunk_col in range(visible.left // chunk_pixels, (visible.right - 1) // chunk_pixels + 1):
+                rect = pygame.Rect(level_rect.x + chunk_col * chunk_pixels, level_rect.y + chunk_row * chunk_pixels,
+                                   chunk_pixels, chunk_pixels)
+                surface.blit(self.get_chunk(chunk_col, chunk_row), camera.to_screen(rect))
+        surface.set_clip(clip)
+
+
+class Renderer:
+    """Отрисовка уровня через камеры (см. LevelView).
+       Фон экрана составляется из участков фона уровня только при перемещении камер,
+       а в каждом кадре поверх фона рисуются только видимые динамические спрайты."""
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.level_background: Optional[LevelBackground] = None
+        self.background: Optional[pygame.Surface] = None
+        # Положения камер, для которых составлен фон экрана
+        self.background_state = None
+        self.view = LevelView(screen.get_rect())
+        # Видимые динамические спрайты в порядке отрисовки
+        self.dynamic_sprites = []
+        # Поверхность, которая рисуется поверх кадра в левом верхнем углу (None - без наложения)
+        self.overlay: Optional[pygame.Surface] = None
+
+        # Счётчики кадров и пикселей, переданных на экран
+        self.frame_count = 0
+        self.pixels_pushed = 0
+        self.last_frame_pixels = 0
+
+    def count_pixels(self, rects):
+        """Учёт пикселей, переданных на экран за кадр"""
+        self.frame_count += 1
+        self.last_frame_pixels = sum(rect.width * rect.height for rect in rects)
+        self.pixels_pushed += self.last_frame_pixels
+
+    def get_stats(self):
+        """Статистика отрисовки"""
+        return {"frames": self.frame_count, "pixels": self.pixels_pushed,
+                "last_frame_pixels": self.last_frame_pixels}
+
+    def set_level(self, level):
+        """Задание уровня, фон которого рисуется под спрайтами"""
+        self.level_background = LevelBackground(level)
+        self.background = pygame.Surface(self.screen.get_size()).convert()
+        self.background_state = None
+        self.view.set_bounds(self.level_background.get_rect())
+        self.dynamic_sprites = []
+
+    def set_sprites(self, sprites):
+        """Задание видимых динамических спрайтов"""
+        self.dynamic_sprites = sprites
+
+    def update_background(self):
+        """Составление фона экрана из участков фона уровня, если камеры переместились.
+           Возвращает True, если фон изменился."""
+        state = self.view.get_state()
+        if self.level_background is None or state == self.background_state:
+            return False
+        self.background.fill(COLOR_BLACK)
+        for camera in self.view.cameras:
+            self.level_background.draw(self.background, camera)
+        self.background_state = state
+        return True
+
+    def get_screen_sprites(self):
+        """Видимые спрайты с положением на экране: (ключ, изображение, положение, область камеры).
+           При разделённом экране спрайт может быть виден обеими камерами."""
+        sprites = [sprite for sprite in self.dynamic_sprites if sprite.alive()]
+        for index, camera in enumerate(self.view.cameras):
+            for sprite in sprites:
+                if camera.rect.colliderect(sprite.rect):
+                    yield (sprite, index), sprite.image, camera.to_screen(sprite.rect), camera.viewport
+
+    def draw_sprites(self, dirty_rects=None):
+        """Отрисовка видимых спрайтов (только пересекающихся с dirty_rects, если они заданы)"""
+        clip = self.screen.get_clip()
+        for _, image, rect, viewport in self.get_screen_sprites():
+            if dirty_rects is None or rect.collidelist(dirty_rects) != -1:
+                self.screen.set_clip(viewport)
+                self.screen.blit(image, rect)
+        self.screen.set_clip(clip)
+
+    def set_overlay(self, overlay):
+        """Задание поверхности, которая рисуется поверх кадра"""
+        self.overlay = overlay
+
+    def reset(self):
+        """Сброс фона уровня"""
+        self.level_background = None
+        self.background = None
+        self.background_state = None
+        self.dynamic_sprites = []
+
+    def draw(self):
+        """Отрисовка кадра"""
+        self.update_background()
+        if self.background is not None:
+            self.screen.blit(self.background, (0, 0))
+        else:
+            self.screen.fill(COLOR_BLACK)
+        self.draw_sprites()
+        if self.overlay is not None:
+            self.screen.blit(self.overlay, (0, 0))
+
+        pygame.display.flip()
+        self.count_pixels([self.screen.get_rect()])
+
+
+class DirtyRenderer(Renderer):
+    """Отрисовка уровня с обновлением только изменившихся областей экрана.
+       Спрайт считается изменившимся, если у него сменилось изображение или положение
+       (смена состояния элемента, анимация игрока, перемещение через портал).
+       После перемещения камер кадр рисуется полностью."""
+
+    def __init__(self, screen):
+        super().__init__(screen)
+        # Изображение и положение каждого спрайта в последнем отрисованном кадре
+        self.sprite_states = {}
+        # Наложение и его область в последнем отрисованном кадре
+        self.overlay_state = (None, None)
+        self.full_redraw = True
+
+    def set_level(self, level):
+        super().set_level(level)
+        self.sprite_states.clear()
+        self.full_redraw = True
+
+    def reset(self):
+        super().reset()
+        self.sprite_states.clear()
+        self.full_redraw = True
+
+    def get_overlay_rect(self):
+        """Область наложения на экране"""
+        return self.overlay.get_rect() if self.overlay is not None else None
+
+    def draw(self):
+        if self.update_background() or self.background is None or self.full_redraw:
+            # Первый кадр уровня и кадр после перемещения камер рисуются полностью
+            super().draw()
+            self.sprite_states = {key: (image, tuple(rect)) for key, image, rect, _ in self.get_screen_sprites()}
+            self.overlay_state = (self.overlay, self.get_overlay_rect())
+            self.full_redraw = self.background is None
+            return
+
+        # Поиск изменившихся областей: старое и новое положение изменившихся спрайтов
+        dirty_rects = []
+        sprite_states = {}
+        for key, image, rect, viewport in self.get_screen_sprites():
+            state = (image, tuple(rect))
+            old_state = self.sprite_states.pop(key, None)
+            if old_state is None or old_state[0] is not state[0] or old_state[1] != state[1]:
+                if old_state is not None:
+                    dirty_rects.append(pygame.Rect(old_state[1]).clip(viewport))
+                dirty_rects.append(rect.clip(viewport))
+            sprite_states[key] = state
+        # Области спрайтов, удалённых с уровня
+        for _, rect in self.sprite_states.values():
+            dirty_rects.append(pygame.Rect(rect))
+        self.sprite_states = sprite_states
+        # Область наложения, если оно изменилось или под ним изменились спрайты
+        overlay_rect = self.get_overlay_rect()
+        old_overlay, old_overlay_rect = self.overlay_state
+        if old_overlay is not self.overlay or old_overlay_rect != overlay_rect:
+            dirty_rects += [rect for rect in (old_overlay_rect, overlay_rect) if rect is not None]
+        elif overlay_rect is not None and overlay_rect.collidelist(dirty_rects) != -1:
+            dirty_rects.append(overlay_rect)
+        self.overlay_state = (self.overlay, overlay_rect)
+
+        if dirty_rects:
+            # Восстановление фона и перерисовка спрайтов в изменившихся областях
+            for rect in dirty_rects:
+                self.screen.blit(self.background, rect, rect)
+            self.draw_sprites(dirty_rects)
+            if self.overlay is not None:
+                self.screen.blit(self.overlay, (0, 0))
+            pygame.display.update(dirty_rects)
+        self.count_pixels(dirty_rects)
@@ -0,0 +1,259 @@
+import sys
+import json
+import zlib
+import glob
+import struct
+import argparse
+from datetime import datetime as dt
+import pygame
+from constants import *
+from level import get_level_hash
+from simulation import EVENT_MOVE, EVENT_INTERACT, EVENT_UNDO, MOVE_DIRECTIONS
+
+# Формат файла повтора: заголовок, имя файла уровня и сжатый список событий
+REPLAY_MAGIC = b"FWRP"
+REPLAY_VERSION = 1
+REPLAY_EXTENSION = ".fwr"
+# Сигнатура, версия, частота тактов, хэш текста уровня, длина имени уровня,
+# количество событий, такт окончания попытки, результат попытки, контрольная сумма состояния в конце
+REPLAY_HEADER = struct.Struct("<4sHH32sHIIbI")
+# Такт симуляции, код события
+REPLAY_EVENT = struct.Struct("<IB")
+
+# Результаты попытки
+RESULT_ABORTED = -1
+RESULT_LOST = 0
+RESULT_WON = 1
+RESULT_NAMES = {RESULT_ABORTED: "aborted", RESULT_LOST: "lost", RESULT_WON: "won"}
+
+
+def get_state_checksum(simulation):
+    """Контрольная сумма состояния симуляции: положения игроков и состояния элементов"""
+    state = [(player.col, player.row, player.is_alive) for player in simulation.players]
+    state += [(element.is_active, element.is_removed, element.is_paused) for element in simulation.elements]
+    return zlib.crc32(repr(state).encode())
+
+
+class Replay:
+    """Повтор попытки прохождения уровня: ввод игроков по тактам симуляции.
+       Время события - номер такта, поэтому повтор не зависит от частоты кадров."""
+
+    def __init__(self, levelname, level_hash=None):
+        self.levelname = levelname
+        self.level_hash = level_hash if level_hash is not None else get_level_hash(levelname)
+        # События (такт, код) в порядке записи
+        self.events = []
+        self.end_tick = 0
+        self.result = RESULT_ABORTED
+        self.checksum = 0
+
+    def get_duration(self):
+        """Длительность попытки в секундах игрового времени"""
+        return self.end_tick / SIMULATION_FPS
+
+    def save(self, filename):
+        """Сохранение повтора через временный файл"""
+        name = self.levelname.encode()
+        header = REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, SIMULATION_FPS, self.level_hash,
+                                    len(name), len(self.events), self.end_tick, self.result, self.checksum)
+        events = b"".join(REPLAY_EVENT.pack(tick, code) for tick, code in self.events)
+        temp_filename = filename + ".tmp"
+        with open(temp_filename, "wb") as f:
+            f.write(header + name + zlib.compress(events, 9))
+        os.replace(temp_filename, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """Загрузка повтора из файла. При неверном формате выбрасывается ValueError."""
+        with open(filename, "rb") as f:
+            data = f.read()
+        try:
+            magic, version, fps, level_hash, name_length, event_count, end_tick, result, checksum = \
+                REPLAY_HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError("replay file is too short")
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError("unsupported replay format")
+        if fps != SIMULATION_FPS:
+            raise ValueError(f"replay is recorded at {fps} ticks per second, game runs at {SIMULATION_FPS}")
+        offset = REPLAY_HEADER.size
+        replay = cls(data[offset:offset + name_length].decode(), level_hash)
+        try:
+            events = zlib.decompress(data[offset + name_length:])
+        except zlib.error as error:
+            raise ValueError(f"damaged replay events: {error}")
+        if len(events) != event_count * REPLAY_EVENT.size:
+            raise ValueError("damaged replay events")
+        replay.events = list(REPLAY_EVENT.iter_unpack(events))
+        replay.end_tick = end_tick
+        replay.result = result
+        replay.checksum = checksum
+        return replay
+
+
+class ReplayRecorder:
+    """Запись ввода игроков во время попытки"""
+
+    def __init__(self, levelname):
+        self.replay = Replay(levelname)
+        self.interaction_mask = 0
+
+    def record(self, tick, players, pending_moves, interacting_players):
+        """Запись ввода, который применяется на такте tick.
+           players - игроки 'Огонь' и 'Вода' в порядке номеров в событиях."""
+        for player, col, row in pending_moves:
+            if player is not None and (col, row) in MOVE_DIRECTIONS:
+                code = EVENT_MOVE + players.index(player) * len(MOVE_DIRECTIONS) + MOVE_DIRECTIONS.index((col, row))
+                self.replay.events.append((tick, code))
+        mask = 0
+        for player in interacting_players:
+            if player is not None:
+                mask |= 1 << players.index(player)
+        # Состояние взаимодействия записывается только при изменении
+        if mask != self.interaction_mask:
+            self.interaction_mask = mask
+            self.replay.events.append((tick, EVENT_INTERACT + mask))
+
+    def record_undo(self, tick):
+        """Запись отмены хода. После отмены номер такта уменьшается, и следующие события
+           записываются с меньшими номерами тактов, поэтому события воспроизводятся строго по порядку."""
+        self.replay.events.append((tick, EVENT_UNDO))
+
+    def finish(self, simulation):
+        """Завершение записи: такт и результат окончания попытки"""
+        self.replay.end_tick = simulation.tick_count
+        self.replay.checksum = get_state_checksum(simulation)
+        if simulation.game_over:
+            self.replay.result = RESULT_WON if simulation.win_game else RESULT_LOST
+
+    def save(self, directory=REPLAYS_DIR):
+        """Сохранение повтора в папку повторов. Старые повторы сверх REPLAY_MAX_FILES удаляются."""
+        name = os.path.splitext(os.path.basename(self.replay.levelname))[0]
+        filename = os.path.join(directory, f"{name}_{dt.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]}{REPLAY_EXTENSION}")
+        os.makedirs(directory, exist_ok=True)
+        self.replay.save(filename)
+
+        filenames = sorted(glob.glob(os.path.join(directory, "*" + REPLAY_EXTENSION)), key=os.path.getmtime)
+        for old_filename in filenames[:-REPLAY_MAX_FILES]:
+            os.remove(old_filename)
+        return filename
+
+
+class ReplayPlayer:
+    """Воспроизведение записанного ввода вместо ввода с клавиатуры.
+       Через каждые REPLAY_KEYFRAME_STEPS шагов воспроизведения сохраняется ключевой кадр
+       (снимок состояния игры), с которого продолжается воспроизведение при перемотке."""
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.position = 0
+        self.interaction_mask = 0
+        # Количество выполненных шагов (тактов) воспроизведения. В отличие от номера такта
+        # симуляции не уменьшается при отмене хода.
+        self.step = 0
+        # Ключевые кадры: (шаг, состояние игры, позиция в событиях, маска взаимодействия)
+        self.keyframes = []
+
+    def apply(self, game):
+        """Замена ввода игры на ввод, записанный для текущего такта.
+           Ввод с клавиатуры во время воспроизведения не учитывается."""
+        if self.step % REPLAY_KEYFRAME_STEPS == 0 and (not self.keyframes or self.keyframes[-1][0] < self.step):
+            previous = self.keyframes[-1][1][0] if self.keyframes else None
+            self.keyframes.append((self.step, game.get_state(previous), self.position, self.interaction_mask))
+        self.step += 1
+
+        players = (game.fire_player, game.water_player)
+        game.pending_moves.clear()
+        events = self.replay.events
+        while self.position < len(events) and events[self.position][0] <= game.simulation.tick_count:
+            code = events[self.position][1]
+            self.position += 1
+            if code == EVENT_UNDO:
+                game.undo()
+            elif code >= EVENT_INTERACT:
+                self.interaction_mask = code - EVENT_INTERACT
+            else:
+                player_index, direction = divmod(code - EVENT_MOVE, len(MOVE_DIRECTIONS))
+                game.pending_moves.append((players[player_index], *MOVE_DIRECTIONS[direction]))
+        game.interacting_players[:] = [player for index, player in enumerate(players)
+                                       if self.interaction_mask & (1 << index)]
+
+    def seek(self, game, steps):
+        """Перемотка на steps шагов вперёд или назад: восстановление ближайшего
+           предшествующего ключевого кадра и воспроизведение до нужного шага без отрисовки"""
+        target = max(0, self.step + steps)
+        keyframes = [keyframe for keyframe in self.keyframes if keyframe[0] <= target]
+        if not keyframes:
+            return
+        step, state, position, interaction_mask = keyframes[-1]
+        if step < self.step <= target:
+            # Вперёд от текущего шага быстрее, чем от ключевого кадра
+            step, position, interaction_mask = self.step, self.position, self.interaction_mask
+        else:
+            game.set_state(state)
+        self.step, self.position, self.interaction_mask = step, position, interaction_mask
+        while self.step < target and not game.game_over:
+            game.update()
+
+    def is_finished(self, tick):
+        """Проверка, что повтор дошёл до такта окончания попытки"""
+        return self.position >= len(self.replay.events) and tick >= self.replay.end_tick
+
+    def check(self, simulation):
+        """Сравнение результата воспроизведения с записанным. Возвращает список расхождений."""
+        errors = []
+        if simulation.tick_count != self.replay.end_tick:
+            errors.append(f"ended at tick {simulation.tick_count}, recorded {self.replay.end_tick}")
+        result = (RESULT_WON if simulation.win_game else RESULT_LOST) if simulation.game_over else RESULT_ABORTED
+        if result != self.replay.result:
+            errors.append(f"result {RESULT_NAMES[result]}, recorded {RESULT_NAMES[self.replay.result]}")
+        if get_state_checksum(simulation) != self.replay.checksum:
+            errors.append("final state differs from the recorded one")
+        return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанной попытки прохождения уровня")
+    parser.add_argument("replay", help="файл повтора")
+    parser.add_argument("--fast", action="store_true", help="воспроизведение без ограничения скорости")
+    parser.add_argument("--headless", action="store_true",
+                        help="воспроизведение без окна (без ограничения скорости)")
+    parser.add_argument("--profile", action="store_true", help="вывод статистики времени кадров в формате JSON")
+    args = parser.parse_args()
+
+    try:
+        replay = Replay.load(args.replay)
+    except (OSError, ValueError) as error:
+        print(f"cannot load replay: {error}")
+        sys.exit(2)
+    try:
+        level_hash = get_level_hash(replay.levelname)
+    except OSError as error:
+        print(f"cannot load level: {error}")
+        sys.exit(2)
+    if level_hash != replay.level_hash:
+        print(f"level {replay.levelname} has changed since the replay was recorded")
+        sys.exit(2)
+
+    if args.headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    from game import Game
+
+    game = Game()
+    game.new_game(replay.levelname, replay)
+    game.unthrottled = args.fast or args.headless
+    game.run()
+
+    errors = game.replay_player.check(game.simulation)
+    print(f"{replay.levelname}: {len(replay.events)} events, {replay.get_duration():.1f} s, "
+          f"{RESULT_NAMES[replay.result]}, {'desync' if errors else 'OK'}")
+    for error in errors:
+        print(f"    {error}")
+    if args.profile:
+        print(json.dumps(game.profiler.get_report(), indent=1))
+    pygame.quit()
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
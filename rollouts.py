@@ -0,0 +1,253 @@
+import sys
+import argparse
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+from time import perf_counter
+from constants import *
+from environments import BatchEnvironment, load_levels, numpy, ACTION_COUNT, ENV_MAX_STEPS, OBS_SIZE
+
+# Команды процессам
+COMMAND_RESET = "reset"
+COMMAND_STEP = "step"
+COMMAND_CLOSE = "close"
+
+# Ожидание завершения процесса при закрытии (в секундах)
+WORKER_JOIN_TIMEOUT = 5
+
+
+def get_buffer_fields(count):
+    """Массивы общего буфера: имя -> (форма, тип)"""
+    return {
+        "actions": ((count, 2), numpy.int8),
+        "observations": ((count, OBS_SIZE), numpy.int64),
+        "final_observations": ((count, OBS_SIZE), numpy.int64),
+        "rewards": ((count,), numpy.float32),
+        "dones": ((count,), bool),
+        "won": ((count,), bool),
+        "died": ((count,), bool),
+        "truncated": ((count,), bool),
+    }
+
+
+class SharedBuffers:
+    """Массивы NumPy в одном блоке общей памяти.
+       Основной процесс создаёт блок, процессы среды подключаются к нему по имени.
+       Каждый процесс пишет только в свои строки массивов, поэтому блокировки не нужны."""
+
+    def __init__(self, count, name=None):
+        fields = get_buffer_fields(count)
+        offsets = dict()
+        size = 0
+        for field, (shape, dtype) in fields.items():
+            # Выравнивание начала массива по 8 байтам
+            size = -(-size // 8) * 8
+            offsets[field] = size
+            size += int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize
+
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.arrays = {field: numpy.ndarray(shape, dtype, buffer=self.memory.buf, offset=offsets[field])
+                       for field, (shape, dtype) in fields.items()}
+
+    def __getitem__(self, field):
+        return self.arrays[field]
+
+    def close(self):
+        """Отключение от блока. Блок удаляется процессом, который его создал."""
+        self.arrays.clear()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def run_worker(filenames, count, first_index, last_index, max_steps, buffer_name, connection):
+    """Процесс среды: шаги попыток first_index..last_index-1 по командам основного процесса.
+       Действия читаются из общего буфера, результаты записываются в него же.
+       Ответ на команду - None или текст ошибки."""
+    buffers = SharedBuffers(count, buffer_name)
+    rows = slice(first_index, last_index)
+    try:
+        env = BatchEnvironment(load_levels(filenames, output=lambda line: None),
+                               last_index - first_index, max_steps, first_index)
+        connection.send(None)
+    except Exception:
+        connection.send(traceback.format_exc())
+        buffers.close()
+        return
+
+    while True:
+        try:
+            command = connection.recv()
+        except EOFError:
+            break
+        if command == COMMAND_CLOSE:
+            break
+        try:
+            if command == COMMAND_RESET:
+                observations = env.reset()
+                buffers["final_observations"][rows] = observations
+                for field in ["rewards", "dones", "won", "died", "truncated"]:
+                    buffers[field][rows] = 0
+            else:
+                observations, rewards, dones, info = env.step(buffers["actions"][rows])
+                buffers["final_observations"][rows] = info.get("final_observations", observations)
+                buffers["rewards"][rows] = rewards
+                buffers["dones"][rows] = dones
+                for field in ["won", "died", "truncated"]:
+                    buffers[field][rows] = info[field]
+            buffers["observations"][rows] = observations
+            connection.send(None)
+        except Exception:
+            connection.send(traceback.format_exc())
+    buffers.close()
+
+
+class RolloutRunner:
+    """Пакетная среда (см. BatchEnvironment), попытки которой разделены между процессами.
+       Каждый процесс выполняет шаги своей части попыток. Действия и результаты передаются
+       через общую память, а по каналам процессам передаются только короткие команды.
+       Попытка с номером i в любом случае проходит уровень i % len(levels),
+       поэтому результаты совпадают с результатами BatchEnvironment в одном процессе."""
+
+    def __init__(self, filenames, count, workers=None, max_steps=ENV_MAX_STEPS):
+        if numpy is None:
+            raise RuntimeError("rollout runner requires numpy")
+        if not load_levels(filenames, output=lambda line: None):
+            raise ValueError("no levels")
+        self.count = count
+        workers = max(1, min(workers or os.cpu_count() or 1, count))
+        self.buffers = SharedBuffers(count)
+        self.connections = []
+        self.processes = []
+        # Попытки делятся на части почти равного размера
+        bounds = [count * index // workers for index in range(workers + 1)]
+        try:
+            for first_index, last_index in zip(bounds, bounds[1:]):
+                connection, worker_connection = multiprocessing.Pipe()
+                process = multiprocessing.Process(
+                    target=run_worker, daemon=True,
+                    args=(filenames, count, first_index, last_index, max_steps,
+                          self.buffers.memory.name, worker_connection))
+                process.start()
+                worker_connection.close()
+                self.connections.append(connection)
+                self.processes.append(process)
+            self.wait()
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_value):
+        self.close()
+
+    def wait(self):
+        """Ожидание ответов всех процессов. При ошибке в процессе выбрасывается RuntimeError."""
+        errors = []
+        for connection in self.connections:
+            try:
+                error = connection.recv()
+            except EOFError:
+                error = "worker process exited"
+            if error is not None:
+                errors.append(error)
+        if errors:
+            raise RuntimeError("rollout worker failed:\n" + errors[0])
+
+    def send(self, command):
+        for connection in self.connections:
+            connection.send(command)
+        self.wait()
+
+    def get_results(self):
+        """Копии результатов из общего буфера (следующий шаг их перезапишет)"""
+        buffers = self.buffers
+        info = {field: buffers[field].copy() for field in ["won", "died", "truncated", "final_observations"]}
+        return buffers["observations"].copy(), buffers["rewards"].copy(), buffers["dones"].copy(), info
+
+    def reset(self):
+        """Начало всех попыток заново. Возвращает наблюдения."""
+        self.send(COMMAND_RESET)
+        return self.buffers["observations"].copy()
+
+    def step(self, actions):
+        """Шаг всех попыток. Аргументы и результаты - как у BatchEnvironment.step(),
+           но в словаре подробностей наблюдения перед началом заново есть всегда."""
+        actions = numpy.asarray(actions)
+        if actions.shape != (self.count, 2):
+            raise ValueError(f"actions must have shape ({self.count}, 2)")
+        self.buffers["actions"][:] = actions
+        self.send(COMMAND_STEP)
+        return self.get_results()
+
+    def close(self):
+        """Завершение процессов и удаление общей памяти"""
+        if self.buffers is None:
+            return
+        for connection in self.connections:
+            try:
+                connection.send(COMMAND_CLOSE)
+            except (OSError, ValueError):
+                pass
+        for process in self.processes:
+            process.join(WORKER_JOIN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+        for connection in self.connections:
+            connection.close()
+        self.connections.clear()
+        self.processes.clear()
+        self.buffers.close()
+        self.buffers = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер скорости пакетной среды в нескольких процессах")
+    parser.add_argument("levels", nargs="*", help="файлы уровней (по умолчанию - все уровни игры)")
+    parser.add_argument("--envs", type=int, default=65536, help="количество одновременных попыток")
+    parser.add_argument("--steps", type=int, default=500, help="количество шагов")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="количество процессов (по умолчанию - по числу ядер)")
+    parser.add_argument("--max-steps", type=int, default=ENV_MAX_STEPS,
+                        help="ограничение количества шагов одной попытки")
+    parser.add_argument("--seed", type=int, default=0, help="начальное значение генератора действий")
+    args = parser.parse_args()
+
+    if numpy is None:
+        print("numpy is required")
+        sys.exit(2)
+    if args.levels:
+        filenames = [os.path.abspath(filename) for filename in args.levels]
+    else:
+        from validate import get_level_files
+        filenames = get_level_files()
+
+    generator = numpy.random.default_rng(args.seed)
+    try:
+        with RolloutRunner(filenames, args.envs, args.workers, args.max_steps) as runner:
+            actions = [generator.integers(0, ACTION_COUNT, size=(args.envs, 2), dtype=numpy.int8)
+                       for _ in range(min(args.steps, 16))]
+            runner.reset()
+            episodes = 0
+            start_time = perf_counter()
+            for step in range(args.steps):
+                _, _, dones, _ = runner.step(actions[step % len(actions)])
+                episodes += int(dones.sum())
+            duration = perf_counter() - start_time
+            workers = len(runner.processes)
+    except (OSError, ValueError, RuntimeError) as error:
+        print(f"cannot run environments: {error}")
+        sys.exit(2)
+
+    print(f"{workers} workers, {args.envs} environments, {args.steps} steps: {duration:.3f} s, "
+          f"{args.envs * args.steps / duration:,.0f} steps/s, {episodes} episodes")
+
+
+if __name__ == "__main__":
+    main()
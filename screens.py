@@ -3,8 +3,10 @@ import csv
 from typing import Optional
 import pygame
 from constants import *
-from functions import display_text_with_shadow
+from functions import display_text_with_shadow, get_level_numbers
 from sprites import BaseSprite, LevelSprite
+from spritesheets import AssetCache
+from thumbnails import ThumbnailWorker, EVENT_THUMBNAIL_READY
 
 
 class SaveFile:
@@ -42,8 +44,14 @@ class SaveFile:
 class Screen:
     """Общий класс для экранов"""
 
+    # Таймаут ожидания событий в миллисекундах для обновления анимаций (0 - без таймаута)
+    event_timeout = 0
+    # Общий фон экранов, составляется один раз
+    background: Optional[pygame.Surface] = None
+
     def __init__(self):
         self.screen_sprites = pygame.sprite.Group()
+        self.surface: Optional[pygame.Surface] = None
 
         self.shadow_cell_rect = pygame.Rect(2, 3, 21, 1)
         self.text_cell_rect = pygame.Rect(2, 4, 21, 20)
@@ -61,30 +69,50 @@ class Screen:
         BaseSprite.reset_offset()
         self.screen_sprites.empty()
 
+    def get_background(self):
+        """Получение общего фона для экранов"""
+        if Screen.background is None:
+            background = pygame.Surface(pygame.display.get_surface().get_size()).convert()
+            background.fill(SCREEN_COLORS_DICT[SCREEN_BG_COLOR1])
+            pygame.draw.rect(background, SCREEN_COLORS_DICT[SCREEN_BG_COLOR2], self.text_rect)
+            pygame.draw.rect(background, SCREEN_COLORS_DICT[SCREEN_SHADOW_COLOR], self.shadow_rect)
+            image = AssetCache.get_sheet(os.path.join(IMG_DIR, IMG_FILE_TITLE))
+            background.blit(image, image.get_rect())
+            Screen.background = background
+        return Screen.background
+
     def prepare(self, surface):
         """Прорисовка общего фона для экранов"""
-        surface.fill(SCREEN_COLORS_DICT[SCREEN_BG_COLOR1])
-        pygame.draw.rect(surface, SCREEN_COLORS_DICT[SCREEN_BG_COLOR2], self.text_rect)
-        pygame.draw.rect(surface, SCREEN_COLORS_DICT[SCREEN_SHADOW_COLOR], self.shadow_rect)
-        image = pygame.image.load(os.path.join(IMG_DIR, IMG_FILE_TITLE)).convert_alpha()
-        rect = image.get_rect()
-        surface.blit(image, rect)
+        surface.blit(self.get_background(), (0, 0))
 
     def render(self, surface):
         """Отрисовка всех элементов экрана"""
         # Метод реализован в дочерних классах
         pass
 
+    def animate(self):
+        """Обновление анимаций экрана по истечении таймаута ожидания событий"""
+        # Метод реализован в дочерних классах
+        pass
+
+    def wait_events(self):
+        """Ожидание событий без постоянной загрузки процессора.
+           По истечении таймаута обновляются анимации и возвращается пустой список."""
+        event = pygame.event.wait(self.event_timeout)
+        if event.type == pygame.NOEVENT:
+            self.animate()
+            return []
+        return [event] + pygame.event.get()
+
     def process_events(self):
         """Обработка событий экрана"""
         self.pause()
 
-    @staticmethod
-    def pause():
+    def pause(self):
         """Пауза"""
         waiting = True
         while waiting:
-            for event in pygame.event.get():
+            for event in self.wait_events():
                 if event.type == pygame.QUIT:
                     sys.exit()
                 # Ожидание нажатия на Escape, Enter или пробел
@@ -94,50 +122,112 @@ class Screen:
 
     def show(self, surface):
         """Переключение на текущий экран"""
+        self.surface = surface
         self.reset_screen()
         self.render(surface)
         self.process_events()
 
 
 class StartScreen(Screen):
-    """Стартовый экран для выбора уровня"""
+    """Стартовый экран для выбора уровня.
+       Уровни показываются по страницам, спрайты создаются только для показанных страниц
+       и перерисовываются, только если изменилось их состояние.
+       Рядом со значками уровней показываются миниатюры, которые подготавливаются в фоновом потоке."""
+
+    # Расстояние между значком уровня и миниатюрой
+    THUMBNAIL_OFFSET = 8
 
     def __init__(self):
         super().__init__()
         self.level_sprites = pygame.sprite.Group()
         self.save_file = SaveFile()
-        self.create_levels()
+        self.level_numbers = get_level_numbers()
+        self.page_size = LEVEL_PAGE_ROWS * LEVEL_PAGE_COLS
+        self.page = 0
+        # Созданные спрайты уровней по номеру уровня
+        self.level_sprite_cache = dict()
+        # Готовые миниатюры уровней по номеру уровня
+        self.thumbnails = dict()
+        self.thumbnail_worker = ThumbnailWorker()
+
+        # Составленное изображение страницы и состояние, для которого оно составлено
+        self.page_image: Optional[pygame.Surface] = None
+        self.page_image_key = None
 
         self.level_sprite: Optional[LevelSprite] = None
 
     def reset_screen(self):
         super().reset_screen()
-        self.level_sprites.empty()
+        self.level_numbers = get_level_numbers()
+        # Показ страницы со следующим непройденным уровнем
+        next_level = self.save_file.levels_done + 1
+        self.page = sum(1 for number in self.level_numbers if number < next_level) // self.page_size
+        self.page = min(self.page, self.get_page_count() - 1)
         self.create_levels()
         self.level_sprite = None
 
+    def get_page_count(self):
+        """Количество страниц уровней"""
+        return max((len(self.level_numbers) + self.page_size - 1) // self.page_size, 1)
+
+    def get_level_state(self, number):
+        """Состояние уровня: (разблокирован, пройден)"""
+        if number <= self.save_file.levels_done:
+            return True, True
+        return number == self.save_file.levels_done + 1, False
+
+    def get_page_numbers(self, page):
+        """Номера уровней на странице"""
+        return self.level_numbers[page * self.page_size:(page + 1) * self.page_size]
+
+    def request_thumbnails(self):
+        """Запрос миниатюр текущей страницы, а также следующей страницы заранее"""
+        for page in [self.page + 1, self.page]:
+            for num in reversed(self.get_page_numbers(page)):
+                if num not in self.thumbnails:
+                    self.thumbnail_worker.request(num, os.path.join(LEVELS_DIR, f"level{num}.txt"))
+
+    def collect_thumbnails(self):
+        """Получение готовых миниатюр. Возвращает True, если готова миниатюра уровня на текущей странице."""
+        thumbnails = self.thumbnail_worker.get_thumbnails()
+        self.thumbnails.update(thumbnails)
+        return any(num in thumbnails for num in self.get_page_numbers(self.page))
+
     def create_levels(self):
-        """Создание спрайтов уровней"""
-        for row in range(3):
-            for col in range(3):
-                num = row * 3 + col + 1
-                is_unlocked, is_done = False, False
-                if num <= self.save_file.levels_done:
-                    is_unlocked, is_done = True, True
-                elif num == self.save_file.levels_done + 1:
-                    is_unlocked = True
-
-                level = LevelSprite(self.shadow_cell_rect.left + col * 7 + 3,
-                                    self.shadow_cell_rect.top + row * 7 + 4,
-                                    num, is_unlocked, is_done)
-
-                self.screen_sprites.add(level)
-                self.level_sprites.add(level)
+        """Подготовка спрайтов уровней текущей страницы"""
+        self.screen_sprites.empty()
+        self.level_sprites.empty()
+        page_numbers = self.get_page_numbers(self.page)
+        for index, num in enumerate(page_numbers):
+            row, col = divmod(index, LEVEL_PAGE_COLS)
+            is_unlocked, is_done = self.get_level_state(num)
+            cell_col = self.shadow_cell_rect.left + col * 7 + 3
+            cell_row = self.shadow_cell_rect.top + row * 7 + 4
+            level = self.level_sprite_cache.get(num)
+            if level is None:
+                level = LevelSprite(cell_col, cell_row, num, is_unlocked, is_done)
+                self.level_sprite_cache[num] = level
+            else:
+                level.set_state(is_unlocked, is_done)
+                level.set_cell_pos(cell_col, cell_row)
+
+            self.screen_sprites.add(level)
+            self.level_sprites.add(level)
+        self.request_thumbnails()
+
+    def change_page(self, offset):
+        """Переход на другую страницу уровней. Возвращает True, если страница изменилась."""
+        page = min(max(self.page + offset, 0), self.get_page_count() - 1)
+        if page == self.page:
+            return False
+        self.page = page
+        self.create_levels()
+        return True
 
     def process_events(self):
         waiting = True
         while waiting:
-            for event in pygame.event.get():
+            for event in self.wait_events():
                 if event.type == pygame.QUIT:
                     sys.exit()
                 if event.type == pygame.MOUSEBUTTONDOWN and event.button == pygame.BUTTON_LEFT:
@@ -146,14 +236,49 @@ class StartScreen(Screen):
                         if level.is_unlocked and level.rect.collidepoint(*event.pos):
                             self.level_sprite = level
                             waiting = False
+                # Переключение страниц клавишами и колесом мыши
+                page_offset = 0
+                if event.type == pygame.KEYDOWN:
+                    if event.key in [pygame.K_LEFT, pygame.K_PAGEUP]:
+                        page_offset = -1
+                    elif event.key in [pygame.K_RIGHT, pygame.K_PAGEDOWN]:
+                        page_offset = 1
+                elif event.type == pygame.MOUSEWHEEL:
+                    page_offset = -event.y
+                if page_offset and self.change_page(page_offset):
+                    self.render(self.surface)
+                if event.type == EVENT_THUMBNAIL_READY and self.collect_thumbnails():
+                    self.render(self.surface)
+
+    def get_page_image(self, surface):
+        """Получение изображения страницы.
+           Изображение составляется заново при смене страницы или состояния уровней."""
+        key = (self.page, surface.get_size(),
+               tuple((level.number, level.is_unlocked, level.is_done, self.thumbnails.get(level.number) is not None)
+                     for level in self.level_sprites))
+        if self.page_image is None or key != self.page_image_key:
+            self.page_image = pygame.Surface(surface.get_size()).convert()
+            self.prepare(self.page_image)
+            display_text_with_shadow(self.page_image, 'ВЫБЕРИТЕ УРОВЕНЬ:', 50,
+                                     SCREEN_COLORS_DICT[SCREEN_TEXT_COLOR],
+                                     SCREEN_COLORS_DICT[SCREEN_SHADOW_COLOR],
+                                     SCREEN_WIDTH // 2, SCREEN_WIDTH // 5, 4)
+            if self.get_page_count() > 1:
+                display_text_with_shadow(self.page_image, f"< {self.page + 1} / {self.get_page_count()} >", 30,
+                                         SCREEN_COLORS_DICT[SCREEN_TEXT_COLOR],
+                                         SCREEN_COLORS_DICT[SCREEN_SHADOW_COLOR],
+                                         SCREEN_WIDTH // 2, self.text_rect.bottom - SPRITE_SIZE // 2, 2)
+            self.screen_sprites.draw(self.page_image)
+            for level in self.level_sprites:
+                thumbnail = self.thumbnails.get(level.number)
+                if thumbnail is not None:
+                    self.page_image.blit(thumbnail, (level.rect.right + self.THUMBNAIL_OFFSET, level.rect.top))
+            self.page_image_key = key
+        return self.page_image
 
     def render(self, surface):
-        self.prepare(surface)
-        display_text_with_shadow(surface, 'ВЫБЕРИТЕ УРОВЕНЬ:', 50,
-                                 SCREEN_COLORS_DICT[SCREEN_TEXT_COLOR],
-                                 SCREEN_COLORS_DICT[SCREEN_SHADOW_COLOR],
-                                 SCREEN_WIDTH // 2, SCREEN_WIDTH // 5, 4)
-        self.screen_sprites.draw(surface)
+        self.collect_thumbnails()
+        surface.blit(self.get_page_image(surface), (0, 0))
         pygame.display.flip()
 
     def unlock_new_level(self):
@@ -0,0 +1,641 @@
+import sys
+import json
+import random
+import struct
+import asyncio
+import argparse
+from time import perf_counter
+from typing import Optional
+from collections import deque
+from constants import *
+from level import Level, get_level_hash
+from simulation import Simulation, EVENT_MOVE, EVENT_INTERACT, EVENT_UNDO, MOVE_DIRECTIONS
+from snapshots import UndoHistory, SNAPSHOT_CHUNK_SIZE
+from stats import get_percentile
+
+# Адрес сервера по умолчанию
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 7654
+# Ограничение времени такта одной сессии (в миллисекундах) и количество превышений подряд,
+# после которого сессия закрывается
+SESSION_TICK_BUDGET = 2.0
+SESSION_MAX_OVERRUNS = 30
+# Обновления не отправляются клиенту, пока в буфере записи больше данных.
+# Следующее обновление содержит все изменения с последнего отправленного.
+SESSION_MAX_WRITE_BUFFER = 64 * 1024
+# Количество последних тактов сервера для статистики
+SERVER_STATS_WINDOW = 300
+
+# Сообщение: тип и длина данных. Сообщения длиннее MESSAGE_MAX_SIZE считаются ошибкой.
+MESSAGE_HEADER = struct.Struct("<BI")
+MESSAGE_MAX_SIZE = 1 << 20
+
+# Сообщения клиента: вход в сессию, ввод, перезапуск уровня и выход из сессии
+MSG_JOIN = 1
+MSG_INPUT = 2
+MSG_RESTART = 3
+MSG_LEAVE = 4
+# Сообщения сервера: начало сессии, изменения состояния, ошибка (текст, после неё соединение закрывается)
+MSG_WELCOME = 16
+MSG_UPDATE = 17
+MSG_ERROR = 18
+
+# Роли клиентов: управление обоими игроками или одним из них
+ROLE_BOTH = 0
+ROLE_FIRE = 1
+ROLE_WATER = 2
+ROLE_NAMES = {ROLE_BOTH: "both", ROLE_FIRE: "fire", ROLE_WATER: "water"}
+# Маски игроков, которыми управляет клиент с ролью
+ROLE_PLAYER_MASKS = {ROLE_BOTH: 3, ROLE_FIRE: 1, ROLE_WATER: 2}
+
+# Вход в сессию: роль и длина имени комнаты, затем имя комнаты и имя файла уровня.
+# Клиенты с одинаковым именем комнаты попадают в одну сессию, пустое имя - отдельная сессия.
+JOIN_HEADER = struct.Struct("<BB")
+# Ввод: номер ввода клиента, затем коды событий повтора (см. replays.py)
+INPUT_HEADER = struct.Struct("<I")
+# Номер сессии, хэш текста уровня, ширина и высота уровня, количество игроков и элементов, такт, роль
+WELCOME_HEADER = struct.Struct("<I32sIIBIIB")
+# Такт сервера, после которого отправлены изменения, номер последнего применённого ввода клиента
+# и такт его применения, признаки окончания и победы, взаимодействующие игроки,
+# количество изменившихся игроков и элементов
+UPDATE_HEADER = struct.Struct("<IIIBBBI")
+# Номер игрока и его состояние (см. Player.get_state): клетка, направление, кадр анимации,
+# признак жизни, блок гибели, направление и ход перемещения, задержка шага
+UPDATE_PLAYER = struct.Struct("<BiibbbBBbbBBB")
+# Номер элемента, состояние (битовые признаки, см. Element.get_state)
+UPDATE_ELEMENT = struct.Struct("<IB")
+
+UPDATE_GAME_OVER = 1
+UPDATE_WIN_GAME = 2
+
+
+def pack_message(message_type, payload=b""):
+    return MESSAGE_HEADER.pack(message_type, len(payload)) + payload
+
+
+async def read_message(reader):
+    """Чтение сообщения: (тип, данные). При закрытии соединения выбрасывается IncompleteReadError."""
+    message_type, length = MESSAGE_HEADER.unpack(await reader.readexactly(MESSAGE_HEADER.size))
+    if length > MESSAGE_MAX_SIZE:
+        raise ValueError("message is too long")
+    return message_type, await reader.readexactly(length) if length else b""
+
+
+def pack_join(levelname, role=ROLE_BOTH, room=""):
+    room = room.encode()
+    return pack_message(MSG_JOIN, JOIN_HEADER.pack(role, len(room)) + room + levelname.encode())
+
+
+def unpack_join(payload):
+    """Роль, имя комнаты и имя файла уровня из сообщения входа"""
+    role, room_length = JOIN_HEADER.unpack_from(payload)
+    if role not in ROLE_NAMES:
+        raise ValueError(f"unknown role {role}")
+    offset = JOIN_HEADER.size
+    return role, payload[offset:offset + room_length].decode(errors="replace"), \
+        payload[offset + room_length:].decode(errors="replace")
+
+
+def pack_player_state(index, state):
+    """Состояние игрока для клиента"""
+    col, row, direction, anim_frame, is_alive, death_tile, walk_direction, walk_progress, step_delay = state
+    return UPDATE_PLAYER.pack(index, col, row, *direction, anim_frame, is_alive,
+                              ord(death_tile) if death_tile else 0, *(walk_direction or (0, 0)),
+                              walk_direction is not None, walk_progress, step_delay)
+
+
+def unpack_player_state(data, offset=0):
+    """Номер игрока и его состояние в формате Player.get_state"""
+    index, col, row, direction_x, direction_y, anim_frame, is_alive, death_tile, \
+        walk_x, walk_y, walking, walk_progress, step_delay = UPDATE_PLAYER.unpack_from(data, offset)
+    return index, (col, row, (direction_x, direction_y), anim_frame, bool(is_alive),
+                   chr(death_tile) if death_tile else None, (walk_x, walk_y) if walking else None,
+                   walk_progress, step_delay)
+
+
+class SessionMirror:
+    """Копия состояния сессии на стороне клиента, которая обновляется по изменениям от сервера"""
+
+    def __init__(self, welcome):
+        self.session_number, self.level_hash, self.width, self.height, _, element_count, \
+            self.tick_count, self.role = WELCOME_HEADER.unpack(welcome)
+        self.game_over = False
+        self.win_game = False
+        self.interaction_mask = 0
+        # Последний применённый сервером ввод клиента и такт его применения
+        self.ack_sequence = 0
+        self.ack_tick = 0
+        # Состояния игроков по номерам (0 - 'Огонь', 1 - 'Вода') и состояния элементов
+        self.players = dict()
+        self.elements = [0] * element_count
+
+    def apply_update(self, payload):
+        self.tick_count, self.ack_sequence, self.ack_tick, flags, self.interaction_mask, \
+            player_count, element_count = UPDATE_HEADER.unpack_from(payload)
+        self.game_over = bool(flags & UPDATE_GAME_OVER)
+        self.win_game = bool(flags & UPDATE_WIN_GAME)
+        offset = UPDATE_HEADER.size
+        for _ in range(player_count):
+            index, state = unpack_player_state(payload, offset)
+            self.players[index] = state
+            offset += UPDATE_PLAYER.size
+        for _ in range(element_count):
+            index, state = UPDATE_ELEMENT.unpack_from(payload, offset)
+            self.elements[index] = state
+            offset += UPDATE_ELEMENT.size
+
+
+class Connection:
+    """Клиент сессии: роль, ввод и состояние, которое последним отправлено клиенту"""
+
+    def __init__(self, writer, role):
+        self.writer = writer
+        self.role = role
+        self.player_mask = ROLE_PLAYER_MASKS[role]
+        self.interaction_mask = 0
+        # Номер последнего полученного ввода и подтверждение его применения: номер ввода и такт
+        self.received_sequence = 0
+        self.ack_sequence = 0
+        self.ack_tick = 0
+        # Отправленное состояние: снимок, состояния игроков для клиента и подтверждение
+        self.sent_snapshot = None
+        self.sent_players = dict()
+        self.sent_ack = None
+        # Признак изменения состояния после последней отправки
+        self.changed = True
+
+
+class Session:
+    """Попытка прохождения уровня на сервере: симуляция, ввод игроков и отмена ходов (как в Game).
+       К сессии могут быть подключены несколько клиентов, каждый управляет своими игроками.
+       Номер такта не уменьшается при отмене хода и перезапуске и увеличивается после окончания попытки,
+       чтобы такты клиентов оставались согласованными с тактами сервера."""
+
+    def __init__(self, number, levelname, level, level_hash, room=""):
+        self.number = number
+        self.levelname = levelname
+        self.level = level
+        self.level_hash = level_hash
+        self.room = room
+        self.simulation = Simulation(level)
+        self.players = (self.simulation.fire_player, self.simulation.water_player)
+        self.connections = []
+        self.overruns = 0
+
+        self.pending_moves = []
+        self.interaction_mask = 0
+        self.previous_interaction_mask = 0
+        self.initial_snapshot = self.simulation.get_snapshot()
+        self.undo_history = UndoHistory()
+
+    def add_connection(self, writer, role):
+        """Подключение клиента. Если игрок уже управляется другим клиентом, выбрасывается ValueError."""
+        used_mask = 0
+        for connection in self.connections:
+            used_mask |= connection.player_mask
+        if used_mask & ROLE_PLAYER_MASKS[role]:
+            raise ValueError(f"role {ROLE_NAMES[role]} is taken")
+        connection = Connection(writer, role)
+        self.connections.append(connection)
+        return connection
+
+    def remove_connection(self, connection):
+        if connection in self.connections:
+            self.connections.remove(connection)
+        self.update_interaction_mask()
+
+    def update_interaction_mask(self):
+        self.interaction_mask = 0
+        for connection in self.connections:
+            self.interaction_mask |= connection.interaction_mask
+
+    def set_changed(self):
+        for connection in self.connections:
+            connection.changed = True
+
+    def apply_input(self, connection, sequence, codes):
+        """Ввод клиента (коды событий повтора), который применяется на следующем такте.
+           Ходы и взаимодействие других игроков не учитываются."""
+        connection.received_sequence = sequence
+        for code in codes:
+            if code == EVENT_UNDO:
+                self.undo()
+            elif code >= EVENT_INTERACT:
+                connection.interaction_mask = (code - EVENT_INTERACT) & connection.player_mask
+                self.update_interaction_mask()
+            else:
+                player_index, direction = divmod(code - EVENT_MOVE, len(MOVE_DIRECTIONS))
+                if connection.player_mask & (1 << player_index) and self.players[player_index] is not None:
+                    self.pending_moves.append((self.players[player_index], *MOVE_DIRECTIONS[direction]))
+
+    def restore_snapshot(self, snapshot):
+        tick_count = self.simulation.tick_count
+        self.simulation.restore_snapshot(snapshot)
+        self.simulation.tick_count = tick_count
+        self.set_changed()
+        self.pending_moves.clear()
+        self.previous_interaction_mask = 0
+        for connection in self.connections:
+            connection.interaction_mask = 0
+        self.interaction_mask = 0
+
+    def undo(self):
+        snapshot = self.undo_history.pop()
+        if snapshot is not None:
+            self.restore_snapshot(snapshot)
+
+    def restart(self):
+        self.restore_snapshot(self.initial_snapshot)
+        self.undo_history.clear()
+
+    def is_idle(self):
+        """Проверка, что такт ничего не изменит, кроме номера такта"""
+        return self.simulation.game_over or \
+            (not self.pending_moves and not self.interaction_mask and self.simulation.is_idle())
+
+    def update(self):
+        """Один такт: применение ввода и симуляция (см. Game.update_simulation).
+           Снимок для отмены сохраняется перед ходом игрока или началом взаимодействия.
+           Если такт ничего не изменит, симуляция не выполняется, увеличивается только номер такта."""
+        if self.is_idle():
+            self.pending_moves.clear()
+            self.simulation.tick_count += 1
+        else:
+            self.set_changed()
+            if UNDO_ENABLED and (any(not player.is_walking() for player, _, _ in self.pending_moves) or
+                                 self.interaction_mask and self.interaction_mask != self.previous_interaction_mask):
+                top = self.undo_history.top()
+                snapshot = self.simulation.get_snapshot(top or self.initial_snapshot)
+                if not snapshot.is_same_state(top):
+                    self.undo_history.push(snapshot)
+            self.previous_interaction_mask = self.interaction_mask
+
+            for player, col, row in self.pending_moves:
+                self.simulation.move_player(player, col, row)
+            self.pending_moves.clear()
+            for index, player in enumerate(self.players):
+                if self.interaction_mask & (1 << index):
+                    self.simulation.interact(player)
+            self.simulation.update()
+            if self.simulation.game_over:
+                self.simulation.tick_count += 1
+
+        # Ввод, полученный до такта, применён на этом такте
+        for connection in self.connections:
+            if connection.ack_sequence != connection.received_sequence:
+                connection.ack_sequence = connection.received_sequence
+                connection.ack_tick = self.simulation.tick_count
+
+    def get_welcome(self, connection):
+        simulation = self.simulation
+        return pack_message(MSG_WELCOME, WELCOME_HEADER.pack(
+            self.number, self.level_hash, simulation.width, simulation.height,
+            len(simulation.players), len(simulation.elements), simulation.tick_count, connection.role))
+
+    def get_update(self, connection):
+        """Сообщение клиенту с изменениями с последнего отправленного ему состояния
+           (None - изменений нет). Неизменившиеся части снимка общие с предыдущим снимком,
+           поэтому сравниваются только изменившиеся части."""
+        ack = (connection.ack_sequence, connection.ack_tick)
+        if not connection.changed and connection.sent_ack == ack:
+            return None
+        connection.changed = False
+        connection.sent_ack = ack
+        simulation = self.simulation
+        sent = connection.sent_snapshot
+        snapshot = simulation.get_snapshot(sent)
+
+        players = []
+        for index, player in enumerate(self.players):
+            if player is None:
+                continue
+            data = pack_player_state(index, player.get_state())
+            if connection.sent_players.get(index) != data:
+                connection.sent_players[index] = data
+                players.append(data)
+
+        elements = []
+        sent_chunks = sent.chunks if sent is not None else ()
+        for chunk_index, chunk in enumerate(snapshot.chunks):
+            sent_chunk = sent_chunks[chunk_index] if chunk_index < len(sent_chunks) else None
+            if chunk is sent_chunk:
+                continue
+            start = chunk_index * SNAPSHOT_CHUNK_SIZE
+            for offset, state in enumerate(chunk):
+                if sent_chunk is None or sent_chunk[offset] != state:
+                    elements.append(UPDATE_ELEMENT.pack(start + offset, state))
+
+        connection.sent_snapshot = snapshot
+        flags = UPDATE_GAME_OVER * simulation.game_over | UPDATE_WIN_GAME * simulation.win_game
+        header = UPDATE_HEADER.pack(simulation.tick_count, *ack, flags, self.interaction_mask,
+                                    len(players), len(elements))
+        return pack_message(MSG_UPDATE, header + b"".join(players) + b"".join(elements))
+
+
+class GameServer:
+    """Сервер для множества одновременных сессий игры в одном цикле событий asyncio.
+       Все сессии выполняют такты с частотой SIMULATION_FPS в одной задаче,
+       после такта каждому клиенту отправляются только изменения состояния.
+       Сессии без ввода, в которых ничего не происходит, симуляцию не выполняют.
+       Сессия, такт которой SESSION_MAX_OVERRUNS раз подряд длится дольше SESSION_TICK_BUDGET, закрывается.
+       Клиенты, вошедшие в комнату с одним именем, играют в одной сессии (например, по игроку на клиента)."""
+
+    def __init__(self):
+        self.sessions = dict()
+        self.rooms = dict()
+        self.session_count = 0
+        self.levels = dict()
+        self.server = None
+        self.tick_task = None
+
+        # Статистика: время тактов сервера, отправленные байты, превышения времени тактов сессий
+        self.tick_times = deque(maxlen=SERVER_STATS_WINDOW)
+        self.tick_count = 0
+        self.dropped_ticks = 0
+        self.bytes_sent = 0
+        self.overruns = 0
+        self.closed_sessions = 0
+
+    def get_level(self, levelname):
+        """Уровень и хэш его текста. Загружаются только файлы из папки уровней."""
+        if levelname not in self.levels:
+            if os.path.basename(levelname) != levelname or not levelname.endswith(".txt") or \
+                    not os.path.isfile(os.path.join(LEVELS_DIR, levelname)):
+                raise ValueError(f"unknown level {levelname}")
+            self.levels[levelname] = Level(levelname), get_level_hash(levelname)
+        return self.levels[levelname]
+
+    def get_session(self, levelname, room):
+        """Сессия комнаты room или новая сессия"""
+        session = self.rooms.get(room) if room else None
+        if session is not None:
+            if session.levelname != levelname:
+                raise ValueError(f"room {room} plays {session.levelname}")
+            return session
+        level, level_hash = self.get_level(levelname)
+        self.session_count += 1
+        session = Session(self.session_count, levelname, level, level_hash, room)
+        self.sessions[session.number] = session
+        if room:
+            self.rooms[room] = session
+        return session
+
+    def remove_session(self, session):
+        self.sessions.pop(session.number, None)
+        if session.room and self.rooms.get(session.room) is session:
+            del self.rooms[session.room]
+
+    async def start(self, host=SERVER_HOST, port=SERVER_PORT, path=None):
+        """Запуск сервера на TCP-порту или Unix-сокете (path)"""
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_client, path)
+        else:
+            self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.tick_task = asyncio.create_task(self.run_ticks())
+        return self.server
+
+    async def stop(self):
+        if self.tick_task is not None:
+            self.tick_task.cancel()
+        for session in list(self.sessions.values()):
+            for connection in session.connections:
+                connection.writer.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def get_port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle_client(self, reader, writer):
+        """Соединение с клиентом: первое сообщение - вход в сессию, затем ввод"""
+        session = connection = None
+        try:
+            message_type, payload = await read_message(reader)
+            if message_type != MSG_JOIN:
+                raise ValueError("expected join message")
+            role, room, levelname = unpack_join(payload)
+            session = self.get_session(levelname, room)
+            connection = session.add_connection(writer, role)
+            writer.write(session.get_welcome(connection))
+
+            while True:
+                message_type, payload = await read_message(reader)
+                if connection not in session.connections:
+                    break
+                if message_type == MSG_INPUT:
+                    sequence, = INPUT_HEADER.unpack_from(payload)
+                    session.apply_input(connection, sequence, payload[INPUT_HEADER.size:])
+                elif message_type == MSG_RESTART:
+                    session.restart()
+                elif message_type == MSG_LEAVE:
+                    break
+                else:
+                    raise ValueError(f"unknown message {message_type}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, OSError, struct.error) as error:
+            writer.write(pack_message(MSG_ERROR, str(error).encode()))
+        finally:
+            if connection is not None:
+                session.remove_connection(connection)
+            if session is not None and not session.connections:
+                self.remove_session(session)
+            writer.close()
+
+    def close_session(self, session, message):
+        """Закрытие сессии сервером с сообщением об ошибке"""
+        self.remove_session(session)
+        self.closed_sessions += 1
+        for connection in session.connections:
+            connection.writer.write(pack_message(MSG_ERROR, message.encode()))
+            connection.writer.close()
+        session.connections.clear()
+
+    def tick(self):
+        """Такт всех сессий и отправка изменений"""
+        start_time = perf_counter()
+        for session in list(self.sessions.values()):
+            session_start = perf_counter()
+            session.update()
+            for connection in session.connections:
+                # Медленному клиенту изменения отправляются, когда освободится буфер
+                if connection.writer.transport.get_write_buffer_size() > SESSION_MAX_WRITE_BUFFER:
+                    continue
+                message = session.get_update(connection)
+                if message is not None:
+                    connection.writer.write(message)
+                    self.bytes_sent += len(message)
+
+            if (perf_counter() - session_start) * 1000 > SESSION_TICK_BUDGET:
+                session.overruns += 1
+                self.overruns += 1
+                if session.overruns >= SESSION_MAX_OVERRUNS:
+                    self.close_session(session, "tick budget exceeded")
+            else:
+                session.overruns = 0
+        self.tick_count += 1
+        self.tick_times.append((perf_counter() - start_time) * 1000)
+
+    async def run_ticks(self):
+        """Такты с фиксированной частотой. Если сервер не успевает, лишние такты отбрасываются."""
+        loop = asyncio.get_running_loop()
+        tick_duration = SIMULATION_TICK_DURATION / 1000
+        next_time = loop.time()
+        while True:
+            next_time += tick_duration
+            delay = next_time - loop.time()
+            if delay < -tick_duration * MAX_TICKS_PER_FRAME:
+                self.dropped_ticks += int(-delay / tick_duration)
+                next_time = loop.time()
+            # Между тактами обрабатывается ввод клиентов, даже если сервер отстаёт
+            await asyncio.sleep(max(delay, 0))
+            self.tick()
+
+    def get_stats(self):
+        """Статистика сервера: процентили времени такта всех сессий (мс) и счётчики"""
+        times = sorted(self.tick_times)
+        return {"sessions": len(self.sessions), "ticks": self.tick_count, "dropped_ticks": self.dropped_ticks,
+                "tick_ms": {f"p{percentile}": round(get_percentile(times, percentile), 3)
+                            for percentile in (50, 95, 99)},
+                "tick_budget_ms": round(SIMULATION_TICK_DURATION, 3), "session_overruns": self.overruns,
+                "closed_sessions": self.closed_sessions, "bytes_sent": self.bytes_sent}
+
+
+class GameClient:
+    """Клиент сервера на asyncio: отправка ввода и применение изменений к копии состояния сессии"""
+
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.mirror: Optional[SessionMirror] = None
+        self.sequence = 0
+        self.bytes_received = 0
+
+    async def connect(self, levelname, host=SERVER_HOST, port=SERVER_PORT, path=None, role=ROLE_BOTH, room=""):
+        """Подключение и вход в сессию. При отказе сервера выбрасывается ConnectionError."""
+        if path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(pack_join(levelname, role, room))
+        message_type, payload = await read_message(self.reader)
+        if message_type == MSG_ERROR:
+            raise ConnectionError(payload.decode(errors="replace"))
+        self.mirror = SessionMirror(payload)
+
+    def send_input(self, codes):
+        """Отправка ввода. Возвращает номер ввода."""
+        self.sequence += 1
+        self.writer.write(pack_message(MSG_INPUT, INPUT_HEADER.pack(self.sequence) + bytes(codes)))
+        return self.sequence
+
+    def move(self, player_index, col, row):
+        return self.send_input([EVENT_MOVE + player_index * len(MOVE_DIRECTIONS) +
+                                MOVE_DIRECTIONS.index((col, row))])
+
+    def interact(self, mask):
+        return self.send_input([EVENT_INTERACT + mask])
+
+    def undo(self):
+        return self.send_input([EVENT_UNDO])
+
+    def restart(self):
+        self.writer.write(pack_message(MSG_RESTART))
+
+    async def receive(self):
+        """Получение и применение одного сообщения. При ошибке сервера выбрасывается ConnectionError."""
+        message_type, payload = await read_message(self.reader)
+        self.bytes_received += MESSAGE_HEADER.size + len(payload)
+        if message_type == MSG_ERROR:
+            raise ConnectionError(payload.decode(errors="replace"))
+        if message_type == MSG_UPDATE:
+            self.mirror.apply_update(payload)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.write(pack_message(MSG_LEAVE))
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def run_client(client, levelname, duration, rnd, port=None, path=None):
+    """Клиент нагрузочной проверки: случайные ходы и взаимодействия в течение duration секунд"""
+    await client.connect(levelname, port=port, path=path)
+    loop = asyncio.get_running_loop()
+    end_time = loop.time() + duration
+
+    async def receive_updates():
+        while True:
+            await client.receive()
+
+    receiver = asyncio.create_task(receive_updates())
+    try:
+        while loop.time() < end_time and not receiver.done():
+            if not client.mirror.game_over:
+                client.move(rnd.randrange(2), *rnd.choice(MOVE_DIRECTIONS))
+                client.interact(rnd.randrange(4))
+            elif rnd.random() < 0.5:
+                client.undo()
+            else:
+                client.restart()
+            await asyncio.sleep(rnd.uniform(0.1, 0.5))
+        if receiver.done():
+            # Ошибка сервера или закрытие соединения
+            receiver.result()
+    finally:
+        receiver.cancel()
+        await client.close()
+
+
+async def run_load_test(clients, levelnames, duration, path=None, seed=0):
+    """Нагрузочная проверка: сервер и клиенты в одном процессе через локальные соединения"""
+    server = GameServer()
+    await server.start(port=0, path=path)
+    port = None if path is not None else server.get_port()
+    rnd = random.Random(seed)
+    tasks = [run_client(GameClient(), levelnames[index % len(levelnames)], duration,
+                        random.Random(rnd.random()), port, path) for index in range(clients)]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    stats = server.get_stats()
+    stats["client_errors"] = sum(1 for result in results if isinstance(result, Exception))
+    await server.stop()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервер для одновременных сессий игры без окна")
+    parser.add_argument("--host", default=SERVER_HOST, help="адрес сервера")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="порт сервера")
+    parser.add_argument("--unix", metavar="PATH", help="Unix-сокет вместо TCP-порта")
+    parser.add_argument("--load-test", type=int, metavar="CLIENTS",
+                        help="нагрузочная проверка с заданным количеством локальных клиентов")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность нагрузочной проверки (с)")
+    parser.add_argument("--levels", nargs="+", default=["level1.txt"], help="уровни для нагрузочной проверки")
+    args = parser.parse_args()
+
+    if args.load_test:
+        stats = asyncio.run(run_load_test(args.load_test, args.levels, args.duration, args.unix))
+        print(json.dumps(stats, indent=1))
+        sys.exit(1 if stats["client_errors"] or stats["closed_sessions"] else 0)
+
+    async def serve():
+        server = GameServer()
+        await server.start(args.host, args.port, args.unix)
+        print(f"serving on {args.unix or f'{args.host}:{args.port}'}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
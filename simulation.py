@@ -0,0 +1,611 @@
+from typing import Optional
+from constants import *
+from cellmap import CellMap
+from snapshots import Snapshot
+
+# Коды ввода игроков в повторах и сетевой игре: ход игрока (номер игрока * 4 + направление),
+# новое состояние взаимодействия (маска игроков, нажавших CTRL) и отмена хода
+EVENT_MOVE = 0
+EVENT_INTERACT = 8
+EVENT_UNDO = 12
+MOVE_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+
+class Element:
+    """Общий класс для элементов, с которыми могут взаимодействовать игроки"""
+
+    def __init__(self, col, row, symbol):
+        self.col, self.row = col, row
+        self.symbol = symbol
+
+        self.is_active = False
+        self.is_interacted = False
+        self.is_paused = False
+        self.is_removed = False
+
+    def set_active(self, active):
+        """Изменение состояния активности объекта"""
+        self.is_active = active
+
+    def interact_with(self, subject):
+        """Взаимодействие текущего элемента с игроком"""
+        # Метод реализован в дочерних классах
+        pass
+
+    def update(self):
+        """Обновление состояния элемента за один такт"""
+        # Метод реализован в дочерних классах
+        pass
+
+    def get_linked_elements(self):
+        """Элементы, признак взаимодействия которых меняется вместе с текущим"""
+        return []
+
+    def is_idle(self):
+        """Проверка, что без взаимодействия update() не изменит состояние элемента"""
+        return True
+
+    def reset_interaction(self):
+        """Сброс признака взаимодействия"""
+        self.is_interacted = False
+
+    def get_state(self):
+        """Изменяемое состояние элемента в виде числа (битовые признаки)"""
+        return self.is_active | self.is_interacted << 1 | self.is_paused << 2 | self.is_removed << 3
+
+    def set_state(self, state):
+        """Восстановление состояния элемента"""
+        self.is_active = bool(state & 1)
+        self.is_interacted = bool(state & 2)
+        self.is_paused = bool(state & 4)
+        self.is_removed = bool(state & 8)
+
+
+class Stone(Element):
+    """Общий класс для камней, которые собирает один из игроков"""
+
+    def __init__(self, col, row, symbol):
+        super().__init__(col, row, symbol)
+        self.set_active(True)
+        self.player = None
+
+    def connect_player(self, player):
+        """Соединение с игроком, который может взаимодействовать с объектом"""
+        self.player = player
+
+    def interact_with(self, subject):
+        if subject == self.player:
+            self.is_interacted = True
+            self.set_active(False)
+            self.is_removed = True
+
+
+class Ruby(Stone):
+    """Камень 'Рубин'"""
+
+
+class Aquamarine(Stone):
+    """Камень 'Аквамарин'"""
+
+
+class Exit(Element):
+    """Общий класс для выходов из уровня"""
+
+    def __init__(self, col, row, symbol):
+        super().__init__(col, row, symbol)
+        self.stones = []
+        self.player = None
+
+    def connect_player(self, player):
+        """Соединение с игроком, который может взаимодействовать с объектом"""
+        self.player = player
+
+    def connect_stone(self, stone):
+        """Добавление камней, которые необходимы для активации выхода"""
+        self.stones.append(stone)
+
+    def get_stone_count(self):
+        """Количество несобранных камней"""
+        return sum(1 for stone in self.stones if not stone.is_removed)
+
+    def interact_with(self, subject):
+        if self.is_active and subject == self.player:
+            self.is_interacted = True
+
+    def is_idle(self):
+        return self.is_active or self.get_stone_count() > 0
+
+    def update(self):
+        if not self.is_active:
+            if not self.get_stone_count():
+                # Если камней на уровне не осталось, то выход активируется
+                self.set_active(True)
+
+
+class FireExit(Exit):
+    """Выход из уровня для игрока 'Огонь'"""
+
+
+class WaterExit(Exit):
+    """Выход из уровня для игрока 'Вода'"""
+
+
+class DoorButton(Element):
+    """Кнопка открытия двери"""
+
+    def __init__(self, col, row, symbol, kind):
+        super().__init__(col, row, symbol)
+        self.kind = kind
+        self.doors = []
+
+    def connect_doors(self, doors):
+        """Подключение дверей, которые эта кнопка открывает.
+           Список дверей общий для всех кнопок одного вида."""
+        self.doors = doors
+
+    def get_linked_elements(self):
+        return self.doors
+
+    def interact_with(self, subject):
+        self.set_active(True)
+        # Взаимодействие кнопки с каждой подключенной дверью
+        for door in self.doors:
+            door.interact_with(self)
+        self.is_interacted = True
+
+    def is_idle(self):
+        return not self.is_active
+
+    def update(self):
+        if not self.is_interacted and self.is_active:
+            self.set_active(False)
+
+
+class Door(Element):
+    """Дверь (активная дверь закрыта)"""
+
+    def __init__(self, col, row, symbol, kind):
+        super().__init__(col, row, symbol)
+        self.kind = kind
+        self.set_active(True)
+        self.buttons = []
+        self.players = []
+
+    def connect_players(self, *players):
+        """Добавление игроков, с которыми взаимодействует дверь"""
+        self.players = [player for player in players if player is not None]
+
+    def connect_buttons(self, buttons):
+        """Подключение кнопок, которые могут открывать эту дверь.
+           Список кнопок общий для всех дверей одного вида."""
+        self.buttons = buttons
+
+    def interact_with(self, subject):
+        # Дверь открывают только кнопки её вида (без поиска в списке кнопок)
+        if isinstance(subject, DoorButton) and subject.kind == self.kind:
+            self.set_active(False)
+            self.is_interacted = True
+
+    def is_standing_player(self):
+        """Проверка, что в двери стоит игрок"""
+        return any((self.col, self.row) in player.get_cells() for player in self.players)
+
+    def is_idle(self):
+        return self.is_active or self.is_standing_player()
+
+    def update(self):
+        if not self.is_interacted and not self.is_active:
+            # Если дверь открыта кнопкой, но в ней стоит игрок, то она не закроется до его ухода
+            if not self.is_standing_player():
+                self.set_active(True)
+
+
+class PortalSwitch(Element):
+    """Рычаг для переключения направления порталов"""
+
+    def __init__(self, col, row, symbol, kind):
+        super().__init__(col, row, symbol)
+        self.kind = kind
+        self.portals = []
+        self.switches = []
+
+    def connect_portals(self, input_portal, output_portal):
+        """Подключение входного и выходного портала к рычагу"""
+        self.portals = [input_portal, output_portal]
+
+    def connect_switches(self, switches):
+        """Подключение рычагов того же вида (для одновременной смены состояний).
+           Список рычагов общий для всех рычагов вида и включает текущий рычаг."""
+        self.switches = switches
+
+    def interact_with(self, subject):
+        if not self.is_paused:
+            self.set_active(not self.is_active)
+            # Смена состояний других рычагов
+            for switch in self.switches:
+                switch.set_active(self.is_active)
+            # Смена направления подключенных порталов
+            for portal in self.portals:
+                portal.reverse_direction()
+            self.is_paused = True
+
+        self.is_interacted = True
+
+    def is_idle(self):
+        return not self.is_paused
+
+    def update(self):
+        if self.is_paused and not self.is_interacted:
+            self.is_paused = False
+
+
+class Portal(Element):
+    """Портал (активный портал является входным)"""
+
+    def __init__(self, col, row, symbol, kind, is_input):
+        super().__init__(col, row, symbol)
+        self.kind = kind
+        self.set_active(is_input)
+        self.other_portal = None
+
+    def is_input(self):
+        return self.is_active
+
+    def reverse_direction(self):
+        """Смена направления портала"""
+        self.set_active(not self.is_active)
+
+    def connect_portal(self, portal):
+        """Подключение другого портала в пару к текущему"""
+        self.other_portal = portal
+
+    def interact_with(self, subject):
+        if self.is_input() and \
+                self.other_portal is not None:
+            subject.teleport(self.other_portal.col, self.other_portal.row)
+
+
+class Player:
+    """Общий класс для игроков.
+       Во время перемещения игрок находится в исходной клетке,
+       а смещение к соседней клетке хранится в пикселях."""
+
+    # Типы блоков, при попадании на которые игрок погибает
+    DEATH_TILES = set()
+
+    def __init__(self, col, row):
+        self.col, self.row = col, row
+        self.direction = (0, 1)
+        self.anim_frame = -1
+
+        self.is_alive = True
+        self.death_tile = None
+
+        self.walk_direction = None
+        self.walk_progress = 0
+        self.step_delay = 0
+
+    def is_walking(self):
+        return self.walk_direction is not None
+
+    def get_state(self):
+        """Изменяемое состояние игрока"""
+        return (self.col, self.row, self.direction, self.anim_frame, self.is_alive, self.death_tile,
+                self.walk_direction, self.walk_progress, self.step_delay)
+
+    def set_state(self, state):
+        """Восстановление состояния игрока"""
+        (self.col, self.row, self.direction, self.anim_frame, self.is_alive, self.death_tile,
+         self.walk_direction, self.walk_progress, self.step_delay) = state
+
+    def get_offset(self):
+        """Смещение игрока относительно исходной клетки (в пикселях)"""
+        if self.walk_direction is None:
+            return 0, 0
+        return self.walk_direction[0] * self.walk_progress, self.walk_direction[1] * self.walk_progress
+
+    def get_cells(self):
+        """Клетки, которые занимает игрок (во время перемещения - две клетки)"""
+        if self.walk_direction is None or not self.walk_progress:
+            return [(self.col, self.row)]
+        cells = [(self.col, self.row),
+                 (self.col + self.walk_direction[0], self.row + self.walk_direction[1])]
+        # Порядок клеток совпадает с порядком обхода слева направо и сверху вниз
+        return sorted(cells, key=lambda cell: (cell[1], cell[0]))
+
+    def start_walking(self, col, row):
+        """Начало перемещения в соседнюю клетку"""
+        self.direction = (col, row)
+        self.walk_direction = (col, row)
+        self.walk_progress = 0
+        self.step_delay = 0
+
+    def turn(self, col, row):
+        """Поворот в сторону клетки, в которую переместиться нельзя"""
+        self.direction = (col, row)
+        self.anim_frame = -1
+
+    def reset_walking(self):
+        """Сброс перемещения игрока"""
+        self.walk_direction = None
+        self.walk_progress = 0
+        self.step_delay = 0
+
+    def teleport(self, col, row):
+        """Мгновенное перемещение в клетку"""
+        self.reset_walking()
+        self.col, self.row = col, row
+
+    def update(self):
+        """Шаг перемещения игрока. Возвращает True, если игрок пришёл в соседнюю клетку."""
+        if self.walk_direction is None:
+            return False
+        if self.step_delay > 0:
+            self.step_delay -= 1
+            return False
+
+        self.step_delay = PLAYER_STEP_TICKS - 1
+        self.anim_frame = 0 if self.walk_progress == 0 else (self.anim_frame + 1) % 4
+        self.walk_progress = min(self.walk_progress + PLAYER_STEP, SPRITE_SIZE)
+        if self.walk_progress < SPRITE_SIZE:
+            return False
+
+        self.col += self.walk_direction[0]
+        self.row += self.walk_direction[1]
+        self.reset_walking()
+        return True
+
+
+class FirePlayer(Player):
+    """Игрок 'Огонь'"""
+    DEATH_TILES = {LEVEL_BLOCK_RIVER, LEVEL_BLOCK_ACID}
+
+
+class WaterPlayer(Player):
+    """Игрок 'Вода'"""
+    DEATH_TILES = {LEVEL_BLOCK_LAVA, LEVEL_BLOCK_ACID}
+
+
+class Simulation:
+    """Симуляция правил игры без отрисовки и без зависимости от pygame.
+       Один вызов update() соответствует одному такту (кадру) игры."""
+
+    def __init__(self, level):
+        self.width, self.height = level.width, level.height
+        self.cell_map = CellMap(level.width, level.height)
+        for row in range(level.height):
+            for col in range(level.width):
+                self.cell_map.set_tile(col, row, level.blocks[row][col])
+
+        # Элементы уровня в порядке их создания и словарь для их соединения
+        self.elements = []
+        self.connection_dict = {}
+        self.fire_exit: Optional[FireExit] = None
+        self.water_exit: Optional[WaterExit] = None
+        self.create_elements(level)
+
+        self.fire_player: Optional[FirePlayer] = None
+        self.water_player: Optional[WaterPlayer] = None
+        if level.fire_player_pos is not None:
+            self.fire_player = FirePlayer(*level.fire_player_pos)
+        if level.water_player_pos is not None:
+            self.water_player = WaterPlayer(*level.water_player_pos)
+        self.players = [player for player in [self.fire_player, self.water_player]
+                        if player is not None]
+
+        self.connect_elements()
+
+        # Элементы, состояние которых меняется при обновлении,
+        # и элементы, с которыми взаимодействовали на текущем такте
+        self.updated_elements = [element for element in self.elements
+                                 if type(element).update is not Element.update]
+        self.interacted_elements = []
+
+        self.tick_count = 0
+        self.game_over = False
+        self.win_game = False
+
+    @staticmethod
+    def get_kind(elem):
+        """Определение вида элемента по его обозначению"""
+        return 1 if elem.isupper() else 0
+
+    def create_elements(self, level):
+        """Создание элементов уровня"""
+        for elem in level.elem_pos_dict:
+            for col, row in level.elem_pos_dict[elem]:
+                if elem == LEVEL_ELEM_RUBY:
+                    element = Ruby(col, row, elem)
+                elif elem == LEVEL_ELEM_AQUAMARINE:
+                    element = Aquamarine(col, row, elem)
+                elif elem == LEVEL_ELEM_FIRE_EXIT:
+                    element = FireExit(col, row, elem)
+                    self.fire_exit = element
+                elif elem == LEVEL_ELEM_WATER_EXIT:
+                    element = WaterExit(col, row, elem)
+                    self.water_exit = element
+                elif elem in (LEVEL_ELEM_DOORBUTTON_1, LEVEL_ELEM_DOORBUTTON_2):
+                    element = DoorButton(col, row, elem, self.get_kind(elem))
+                elif elem in (LEVEL_ELEM_DOOR_1, LEVEL_ELEM_DOOR_2):
+                    element = Door(col, row, elem, self.get_kind(elem))
+                elif elem in (LEVEL_ELEM_INPUT_PORTAL_1, LEVEL_ELEM_INPUT_PORTAL_2):
+                    element = Portal(col, row, elem, self.get_kind(elem), True)
+                elif elem in (LEVEL_ELEM_OUTPUT_PORTAL_1, LEVEL_ELEM_OUTPUT_PORTAL_2):
+                    element = Portal(col, row, elem, self.get_kind(elem), False)
+                elif elem in (LEVEL_ELEM_PORTAL_SWITCH_1, LEVEL_ELEM_PORTAL_SWITCH_2):
+                    element = PortalSwitch(col, row, elem, self.get_kind(elem))
+                else:
+                    continue
+
+                if elem not in self.connection_dict:
+                    self.connection_dict[elem] = []
+                self.connection_dict[elem].append(element)
+
+                self.cell_map.add_element(col, row, element)
+                self.elements.append(element)
+
+    def connect_elements(self):
+        """Соединение элементов для корректной обработки взаимодействий"""
+        # Соединение камней, выходов из уровня и игроков
+        for level_elem_stone, level_elem_exit, player in \
+                [(LEVEL_ELEM_RUBY, LEVEL_ELEM_FIRE_EXIT, self.fire_player),
+                 (LEVEL_ELEM_AQUAMARINE, LEVEL_ELEM_WATER_EXIT, self.water_player)]:
+
+            if level_elem_exit in self.connection_dict:
+                level_exit = self.connection_dict[level_elem_exit][0]
+                if player is not None:
+                    level_exit.connect_player(player)
+                if level_elem_stone in self.connection_dict:
+                    for stone in self.connection_dict[level_elem_stone]:
+                        if player is not None:
+                            stone.connect_player(player)
+                        level_exit.connect_stone(stone)
+
+        # Соединение кнопок, дверей и игроков
+        for level_elem_doorbutton, level_elem_door in \
+                [(LEVEL_ELEM_DOORBUTTON_1, LEVEL_ELEM_DOOR_1),
+                 (LEVEL_ELEM_DOORBUTTON_2, LEVEL_ELEM_DOOR_2)]:
+
+            if level_elem_doorbutton in self.connection_dict and \
+                    level_elem_door in self.connection_dict:
+                # Кнопки и двери одного вида соединены все со всеми,
+                # поэтому им передаются общие списки (без связей для каждой пары)
+                buttons = self.connection_dict[level_elem_doorbutton]
+                doors = self.connection_dict[level_elem_door]
+                for button in buttons:
+                    button.connect_doors(doors)
+                for door in doors:
+                    door.connect_buttons(buttons)
+                    door.connect_players(self.fire_player, self.water_player)
+
+        # Соединение рычагов и порталов
+        for level_elem_input_portal, level_elem_output_portal, level_elem_portal_switch in \
+                [(LEVEL_ELEM_INPUT_PORTAL_1, LEVEL_ELEM_OUTPUT_PORTAL_1, LEVEL_ELEM_PORTAL_SWITCH_1),
+                 (LEVEL_ELEM_INPUT_PORTAL_2, LEVEL_ELEM_OUTPUT_PORTAL_2, LEVEL_ELEM_PORTAL_SWITCH_2)
+                 ]:
+
+            if level_elem_input_portal in self.connection_dict and \
+                    level_elem_output_portal in self.connection_dict:
+                input_portal = self.connection_dict[level_elem_input_portal][0]
+                output_portal = self.connection_dict[level_elem_output_portal][0]
+                input_portal.connect_portal(output_portal)
+                output_portal.connect_portal(input_portal)
+                if level_elem_portal_switch in self.connection_dict:
+                    switches = self.connection_dict[level_elem_portal_switch]
+                    for switch in switches:
+                        switch.connect_portals(input_portal, output_portal)
+                        switch.connect_switches(switches)
+
+    def move_player(self, player, col, row):
+        """Перемещение игрока в соседнюю клетку"""
+        # Пока игрок двигается, задать новое движение нельзя
+        if player is None or player.is_walking() or (col, row) == (0, 0):
+            return
+
+        target_col, target_row = player.col + col, player.row + row
+        can_walk = self.cell_map.get_tile(target_col, target_row) != LEVEL_BLOCK_WALL
+        if can_walk:
+            # В соседней клекте дверь. Туда можно переместиться, если она открыта.
+            for door in self.cell_map.get_elements(target_col, target_row):
+                if isinstance(door, Door) and door.is_active:
+                    can_walk = False
+
+        if can_walk:
+            player.start_walking(col, row)
+        else:
+            player.turn(col, row)
+
+    def get_player_element(self, player):
+        """Поиск элемента, с которым пересекается игрок"""
+        for col, row in player.get_cells():
+            for element in self.cell_map.get_elements(col, row):
+                if not element.is_removed:
+                    return element
+        return None
+
+    def interact(self, player):
+        """Взаимодействие игрока с элементом, с которым он пересекается"""
+        if player is None:
+            return
+        element = self.get_player_element(player)
+        if element is not None:
+            element.interact_with(player)
+            self.interacted_elements.append(element)
+            self.interacted_elements.extend(element.get_linked_elements())
+            # Собранные камни удаляются с карты клеток
+            if element.is_removed:
+                self.cell_map.remove_element(element.col, element.row, element)
+
+    def get_stone_count(self):
+        """Количество несобранных рубинов и аквамаринов"""
+        ruby_count = self.fire_exit.get_stone_count() if self.fire_exit is not None else 0
+        aquamarine_count = self.water_exit.get_stone_count() if self.water_exit is not None else 0
+        return ruby_count, aquamarine_count
+
+    def is_idle(self):
+        """Проверка, что без ввода игроков следующие такты ничего не изменят"""
+        return not any(player.is_walking() for player in self.players) and \
+            all(element.is_idle() for element in self.updated_elements)
+
+    def get_snapshot(self, previous=None):
+        """Снимок изменяемого состояния. Неизменившиеся части берутся из предыдущего снимка."""
+        players = tuple(player.get_state() for player in self.players)
+        if previous is not None and previous.players == players:
+            players = previous.players
+        chunks = Snapshot.share_chunks([element.get_state() for element in self.elements], previous)
+        element_indexes = {element: index for index, element in enumerate(self.elements)}
+        interacted = tuple(element_indexes[element] for element in self.interacted_elements)
+        return Snapshot(self.tick_count, self.game_over, self.win_game, players, chunks, interacted)
+
+    def restore_snapshot(self, snapshot):
+        """Восстановление состояния из снимка"""
+        self.tick_count = snapshot.tick_count
+        self.game_over = snapshot.game_over
+        self.win_game = snapshot.win_game
+        for player, state in zip(self.players, snapshot.players):
+            player.set_state(state)
+        for element, state in zip(self.elements, snapshot.get_element_states()):
+            element.set_state(state)
+        self.interacted_elements = [self.elements[index] for index in snapshot.interacted]
+
+        # Карта клеток заполняется заново: собранные камни удаляются, возвращённые - добавляются.
+        # Элементы добавляются в порядке создания, как при загрузке уровня.
+        self.cell_map.elements.clear()
+        for element in self.elements:
+            if not element.is_removed:
+                self.cell_map.add_element(element.col, element.row, element)
+
+    def update(self):
+        """Один такт симуляции"""
+        if self.game_over:
+            return
+        self.tick_count += 1
+
+        for element in self.updated_elements:
+            element.update()
+
+        for player in self.players:
+            if player.update():
+                # Проверка после перемещения персонажа в соседнюю клетку
+                tile = self.cell_map.get_tile(player.col, player.row)
+                if tile in player.DEATH_TILES:
+                    player.death_tile = tile
+                    player.is_alive = False
+
+        # Уровень не пройден, если один из игроков не выжил
+        if any(not player.is_alive for player in self.players):
+            self.game_over = True
+            self.win_game = False
+            return
+
+        # Уровень пройден, если произошло взаимодейтвие игроков с обоими выходами одновременно
+        if self.fire_exit is not None and self.fire_exit.is_interacted and \
+                self.water_exit is not None and self.water_exit.is_interacted:
+            self.game_over = True
+            self.win_game = True
+            return
+
+        # Сброс признака взаимодействия с элементов уровня
+        for element in self.interacted_elements:
+            element.reset_interaction()
+        self.interacted_elements.clear()
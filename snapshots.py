@@ -0,0 +1,80 @@
+# Количество элементов в одной части снимка. Неизменившиеся части
+# используются соседними снимками совместно.
+SNAPSHOT_CHUNK_SIZE = 32
+
+
+class Snapshot:
+    """Неизменяемый снимок изменяемого состояния симуляции.
+       Состояния элементов хранятся частями по SNAPSHOT_CHUNK_SIZE элементов,
+       и части, которые не изменились с предыдущего снимка, не копируются, а берутся из него."""
+
+    __slots__ = ("tick_count", "game_over", "win_game", "players", "chunks", "interacted", "game_info")
+
+    def __init__(self, tick_count, game_over, win_game, players, chunks, interacted, game_info=None):
+        self.tick_count = tick_count
+        self.game_over = game_over
+        self.win_game = win_game
+        # Состояния игроков и части с состояниями элементов
+        self.players = players
+        self.chunks = chunks
+        # Номера элементов, с которыми взаимодействовали на текущем такте
+        self.interacted = interacted
+        # Состояние информации об игре (заполняется игрой)
+        self.game_info = game_info
+
+    @staticmethod
+    def share_chunks(states, previous=None):
+        """Разбиение состояний элементов на части с использованием частей предыдущего снимка"""
+        chunks = []
+        previous_chunks = previous.chunks if previous is not None else ()
+        for index, start in enumerate(range(0, len(states), SNAPSHOT_CHUNK_SIZE)):
+            chunk = tuple(states[start:start + SNAPSHOT_CHUNK_SIZE])
+            if index < len(previous_chunks) and previous_chunks[index] == chunk:
+                chunk = previous_chunks[index]
+            chunks.append(chunk)
+        chunks = tuple(chunks)
+        return previous_chunks if chunks == previous_chunks else chunks
+
+    def get_element_states(self):
+        """Состояния всех элементов по порядку"""
+        return [state for chunk in self.chunks for state in chunk]
+
+    def is_same_state(self, other):
+        """Проверка, что снимки отличаются только номером такта"""
+        return other is not None and self.players == other.players and self.chunks == other.chunks and \
+            (self.game_over, self.win_game, self.interacted) == (other.game_over, other.win_game, other.interacted)
+
+
+class UndoHistory:
+    """История снимков для отмены ходов. Количество снимков не ограничено."""
+
+    def __init__(self):
+        self.snapshots = []
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def push(self, snapshot):
+        self.snapshots.append(snapshot)
+
+    def pop(self):
+        """Последний снимок (None, если история пуста)"""
+        return self.snapshots.pop() if self.snapshots else None
+
+    def top(self):
+        return self.snapshots[-1] if self.snapshots else None
+
+    def clear(self):
+        self.snapshots.clear()
+
+    def copy(self):
+        """Копия истории. Снимки неизменяемые, поэтому копируется только список."""
+        history = UndoHistory()
+        history.snapshots = list(self.snapshots)
+        return history
+
+    def get_stats(self):
+        """Количество снимков и частей: всего и уникальных (остальные используются совместно)"""
+        chunks = [chunk for snapshot in self.snapshots for chunk in snapshot.chunks]
+        return {"snapshots": len(self.snapshots), "chunks": len(chunks),
+                "unique_chunks": len({id(chunk) for chunk in chunks})}
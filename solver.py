@@ -0,0 +1,635 @@
+import sys
+import heapq
+import argparse
+from time import perf_counter
+from collections import deque
+from constants import *
+from level import Level
+from simulation import Simulation, Stone, DoorButton, Exit
+
+# Действия игрока: перемещения в соседние клетки и взаимодействие с элементом
+ACTION_UP = 0
+ACTION_RIGHT = 1
+ACTION_DOWN = 2
+ACTION_LEFT = 3
+ACTION_USE = 4
+
+ACTION_DIRECTIONS = [(0, -1), (1, 0), (0, 1), (-1, 0)]
+ACTION_NAMES = ["up", "right", "down", "left", "use"]
+PLAYER_NAMES = ["F", "W"]
+
+# Состояния поиска
+SOLVER_SOLVED = "solved"
+SOLVER_UNSOLVABLE = "unsolvable"
+SOLVER_LIMIT = "limit"
+
+SOLVER_MAX_STATES = 500_000
+# Ограничение количества состояний для всех попыток поиска, кроме последней:
+# попытки с малым весом оценки на сложных уровнях расходуют всё ограничение и не находят решения
+SOLVER_ATTEMPT_STATES = 120_000
+# Веса оценки для последовательных попыток поиска
+SOLVER_WEIGHTS = (1, 2, 5)
+# Оценка количества ходов, за которое рычаг может переключить другой игрок
+SOLVER_REMOTE_TOGGLE_COST = 20
+
+
+class SolverModel:
+    """Упрощённая модель уровня для поиска решения.
+       Ход - перемещение одного игрока в соседнюю клетку или взаимодействие с порталом или рычагом.
+       Игрок, стоящий на кнопке, может сойти с неё одновременно с ходом другого игрока (два хода).
+       Камни собираются при входе в клетку, кнопка нажата, пока на ней стоит любой игрок,
+       дверь пропускает игрока, если нажата её кнопка или в двери уже стоит другой игрок.
+       Выходить за пределы уровня и наступать на смертельные блоки нельзя.
+       Состояние упаковано в целое число: признак порядка ходов, клетки игроков,
+       состояния рычагов и несобранные камни.
+
+       Перемещение игрока, не затрагивающее кнопки и двери, перестановочно с любым действием
+       другого игрока, поэтому такое перемещение 'Огня' сразу после действия 'Воды'
+       не рассматривается: такой же результат даёт обратный порядок действий.
+       Состояния, из которых уровень заведомо нельзя пройти, отбрасываются (см. is_deadlock)."""
+
+    def __init__(self, level):
+        self.width, self.height = level.width, level.height
+        self.cell_count = max(self.width * self.height, 1)
+        self.cell_bits = (self.cell_count - 1).bit_length() or 1
+        self.cell_mask = (1 << self.cell_bits) - 1
+        self.switch_shift = self.cell_bits * 2 + 1
+        self.stone_shift = self.switch_shift + 2
+
+        # Соседние клетки для каждого игрока (-1 - переместиться нельзя)
+        self.neighbours = []
+        for death_tiles in [{LEVEL_BLOCK_RIVER, LEVEL_BLOCK_ACID},
+                            {LEVEL_BLOCK_LAVA, LEVEL_BLOCK_ACID}]:
+            neighbours = []
+            for cell in range(self.cell_count):
+                col, row = self.get_col_row(cell)
+                for col_offset, row_offset in ACTION_DIRECTIONS:
+                    near_col, near_row = col + col_offset, row + row_offset
+                    if 0 <= near_col < self.width and 0 <= near_row < self.height and \
+                            level.blocks[near_row][near_col] != LEVEL_BLOCK_WALL and \
+                            level.blocks[near_row][near_col] not in death_tiles:
+                        neighbours.append(self.get_cell(near_col, near_row))
+                    else:
+                        neighbours.append(-1)
+            self.neighbours.append(neighbours)
+
+        elems = level.elem_pos_dict
+        # Двери и кнопки по видам
+        self.door_kinds = [-1] * self.cell_count
+        self.button_kinds = [-1] * self.cell_count
+        for kind, (button_elem, door_elem) in enumerate(
+                [(LEVEL_ELEM_DOORBUTTON_1, LEVEL_ELEM_DOOR_1),
+                 (LEVEL_ELEM_DOORBUTTON_2, LEVEL_ELEM_DOOR_2)]):
+            if button_elem in elems and door_elem in elems:
+                for col, row in elems[button_elem]:
+                    self.button_kinds[self.get_cell(col, row)] = kind
+            for col, row in elems.get(door_elem, []):
+                self.door_kinds[self.get_cell(col, row)] = kind
+
+        # Порталы и рычаги по видам
+        self.portals = [None, None]
+        self.switch_kinds = [-1] * self.cell_count
+        for kind, (input_elem, output_elem, switch_elem) in enumerate(
+                [(LEVEL_ELEM_INPUT_PORTAL_1, LEVEL_ELEM_OUTPUT_PORTAL_1, LEVEL_ELEM_PORTAL_SWITCH_1),
+                 (LEVEL_ELEM_INPUT_PORTAL_2, LEVEL_ELEM_OUTPUT_PORTAL_2, LEVEL_ELEM_PORTAL_SWITCH_2)]):
+            if input_elem in elems and output_elem in elems:
+                self.portals[kind] = (self.get_cell(*elems[input_elem][0]),
+                                      self.get_cell(*elems[output_elem][0]))
+                for col, row in elems.get(switch_elem, []):
+                    self.switch_kinds[self.get_cell(col, row)] = kind
+
+        # Камни: сначала рубины (собирает 'Огонь'), затем аквамарины (собирает 'Вода')
+        self.stone_cells = [self.get_cell(col, row)
+                            for elem in [LEVEL_ELEM_RUBY, LEVEL_ELEM_AQUAMARINE]
+                            for col, row in elems.get(elem, [])]
+        self.ruby_count = len(elems.get(LEVEL_ELEM_RUBY, []))
+        self.stone_bits = [{}, {}]
+        for index, cell in enumerate(self.stone_cells):
+            owner = 0 if index < self.ruby_count else 1
+            self.stone_bits[owner][cell] = 1 << index
+        self.player_stone_masks = [(1 << self.ruby_count) - 1,
+                                   ((1 << len(self.stone_cells)) - 1) ^ ((1 << self.ruby_count) - 1)]
+
+        self.exits = [None, None]
+        for owner, elem in enumerate([LEVEL_ELEM_FIRE_EXIT, LEVEL_ELEM_WATER_EXIT]):
+            if elem in elems:
+                self.exits[owner] = self.get_cell(*elems[elem][0])
+
+        self.start_cells = [None, None]
+        for owner, pos in enumerate([level.fire_player_pos, level.water_player_pos]):
+            if pos is not None:
+                self.start_cells[owner] = self.get_cell(*pos)
+
+        # Битовые маски вершин графа с учётом рычагов (см. get_switch_graph) для проверки тупиков.
+        # Маска вершин клетки cell при всех состояниях рычагов - layer_repeat << cell
+        # (маски клеток не хранятся: каждая из них длиной 4 * cell_count бит).
+        self.layer_repeat = sum(1 << (switches * self.cell_count) for switches in range(4))
+        self.button_masks = [0, 0]
+        self.door_masks = [0, 0]
+        self.switch_masks = [[0] * 4, [0] * 4]
+        for cell in range(self.cell_count):
+            for kinds, masks in [(self.button_kinds, self.button_masks), (self.door_kinds, self.door_masks)]:
+                if kinds[cell] >= 0:
+                    masks[kinds[cell]] |= self.layer_repeat << cell
+            if self.switch_kinds[cell] >= 0:
+                for switches in range(4):
+                    self.switch_masks[self.switch_kinds[cell]][switches] |= 1 << (switches * self.cell_count + cell)
+
+        self.distances = None
+        self.estimate_cache = [[{}, {}], [{}, {}]]
+        self.reachable_cache = [{}, {}]
+        self.deadlock_cache = {}
+
+    def get_cell(self, col, row):
+        return row * self.width + col
+
+    def get_col_row(self, cell):
+        return cell % self.width, cell // self.width
+
+    def is_complete(self):
+        """Проверка наличия игроков и выходов, без которых уровень пройти нельзя"""
+        return None not in self.start_cells and None not in self.exits
+
+    def pack(self, cells, switches, stones, after_water=0):
+        """Упаковка состояния в целое число"""
+        return after_water | (cells[0] << 1) | (cells[1] << (self.cell_bits + 1)) | \
+            (switches << self.switch_shift) | (stones << self.stone_shift)
+
+    def unpack(self, state):
+        """Распаковка состояния"""
+        return ([(state >> 1) & self.cell_mask, (state >> (self.cell_bits + 1)) & self.cell_mask],
+                (state >> self.switch_shift) & 3,
+                state >> self.stone_shift)
+
+    def is_independent(self, cell, near_cell):
+        """Проверка, что перемещение не затрагивает кнопки и двери"""
+        return self.button_kinds[cell] < 0 and self.door_kinds[cell] < 0 and \
+            self.button_kinds[near_cell] < 0 and self.door_kinds[near_cell] < 0
+
+    def get_start_state(self):
+        cells = list(self.start_cells)
+        stones = (1 << len(self.stone_cells)) - 1
+        for owner in range(2):
+            stones &= ~self.stone_bits[owner].get(cells[owner], 0)
+        return self.pack(cells, 0, stones)
+
+    def is_goal(self, state):
+        cells, _, stones = self.unpack(state)
+        return not stones and cells[0] == self.exits[0] and cells[1] == self.exits[1]
+
+    def get_input_portal(self, kind, switches):
+        """Входной и выходной порталы вида kind с учётом состояния рычагов"""
+        input_cell, output_cell = self.portals[kind]
+        if switches & (1 << kind):
+            return output_cell, input_cell
+        return input_cell, output_cell
+
+    def get_move(self, owner, cells, action, pressed_kinds):
+        """Клетка после перемещения игрока (-1 - переместиться нельзя)"""
+        near_cell = self.neighbours[owner][cells[owner] * 4 + action]
+        if near_cell < 0:
+            return -1
+        door_kind = self.door_kinds[near_cell]
+        if door_kind >= 0 and door_kind not in pressed_kinds and near_cell != cells[1 - owner]:
+            return -1
+        return near_cell
+
+    def get_successors(self, state):
+        """Состояния, достижимые за один ход: (действие, стоимость, состояние).
+           Действие - кортеж пар (игрок, действие)."""
+        cells, switches, stones = self.unpack(state)
+        after_water = state & 1
+        pressed_kinds = {self.button_kinds[cell] for cell in cells}
+        for owner in range(2):
+            cell = cells[owner]
+            for action in range(4):
+                near_cell = self.get_move(owner, cells, action, pressed_kinds)
+                if near_cell < 0:
+                    continue
+                independent = self.is_independent(cell, near_cell)
+                if owner == 0 and after_water and independent:
+                    continue
+                new_cells = list(cells)
+                new_cells[owner] = near_cell
+                new_stones = stones & ~self.stone_bits[owner].get(near_cell, 0)
+                yield ((owner, action),), 1, self.pack(new_cells, switches, new_stones, owner)
+
+            # Взаимодействие с рычагом или входным порталом
+            switch_kind = self.switch_kinds[cell]
+            if switch_kind >= 0:
+                yield ((owner, ACTION_USE),), 1, self.pack(cells, switches ^ (1 << switch_kind), stones, owner)
+                continue
+            for kind in range(2):
+                if self.portals[kind] is None:
+                    continue
+                input_cell, output_cell = self.get_input_portal(kind, switches)
+                if cell == input_cell:
+                    new_cells = list(cells)
+                    new_cells[owner] = output_cell
+                    new_stones = stones & ~self.stone_bits[owner].get(output_cell, 0)
+                    yield ((owner, ACTION_USE),), 1, self.pack(new_cells, switches, new_stones, owner)
+
+        # Одновременное перемещение обоих игроков: игрок уходит с кнопки,
+        # а дверь остаётся открытой, пока он на ней стоит. Имеет смысл только для игрока на кнопке.
+        if pressed_kinds == {-1}:
+            return
+        for fire_action in range(4):
+            fire_cell = self.get_move(0, cells, fire_action, pressed_kinds)
+            if fire_cell < 0:
+                continue
+            for water_action in range(4):
+                water_cell = self.get_move(1, cells, water_action, pressed_kinds)
+                if water_cell < 0:
+                    continue
+                new_stones = stones & ~self.stone_bits[0].get(fire_cell, 0) & \
+                    ~self.stone_bits[1].get(water_cell, 0)
+                yield ((0, fire_action), (1, water_action)), 2, \
+                    self.pack([fire_cell, water_cell], switches, new_stones)
+
+    def get_switch_graph(self, owner, remote_toggle_cost):
+        """Рёбра графа перемещений игрока с учётом направления порталов: пары (вершина, стоимость).
+           Вершина - пара (состояния рычагов, клетка), упакованная в switches * cell_count + cell.
+           Рычаг можно переключить, стоя на нём (1 ход), или в любой клетке за remote_toggle_cost ходов:
+           так учитывается, что рычаг может переключить другой игрок. Двери не учитываются."""
+        cell_count = self.cell_count
+        neighbours = self.neighbours[owner]
+        edges = []
+        for switches in range(4):
+            offset = switches * cell_count
+            input_cells = {}
+            for kind in range(2):
+                if self.portals[kind] is not None:
+                    input_cell, output_cell = self.get_input_portal(kind, switches)
+                    input_cells[input_cell] = output_cell
+            for cell in range(cell_count):
+                cell_edges = [(offset + near_cell, 1)
+                              for near_cell in neighbours[cell * 4:cell * 4 + 4] if near_cell >= 0]
+                if cell in input_cells:
+                    cell_edges.append((offset + input_cells[cell], 1))
+                for kind in range(2):
+                    if self.portals[kind] is None:
+                        continue
+                    cost = 1 if self.switch_kinds[cell] == kind else remote_toggle_cost
+                    cell_edges.append(((switches ^ (1 << kind)) * cell_count + cell, cost))
+                edges.append(cell_edges)
+        return edges
+
+    def calculate_distances(self):
+        """Расстояния до выходов и камней без учёта дверей (для оценки в A*).
+           Допустимая оценка считает, что другой игрок переключает рычаги мгновенно
+           (порталы фактически двусторонние), поэтому не превышает реальную длину пути.
+           Уточнённая оценка для взвешенного поиска учитывает направление порталов."""
+
+        def get_reverse_edges(edges):
+            reverse_edges = [[] for _ in edges]
+            for node, node_edges in enumerate(edges):
+                for near_node, cost in node_edges:
+                    reverse_edges[near_node].append((node, cost))
+            return reverse_edges
+
+        def dijkstra(reverse_edges, target):
+            # Поиск от цели по обратным рёбрам, для каждого состояния рычагов
+            dist = [-1] * len(reverse_edges)
+            queue = [(0, switches * self.cell_count + target) for switches in range(4)]
+            while queue:
+                node_dist, node = heapq.heappop(queue)
+                if dist[node] >= 0:
+                    continue
+                dist[node] = node_dist
+                for prev_node, cost in reverse_edges[node]:
+                    if dist[prev_node] < 0:
+                        heapq.heappush(queue, (node_dist + cost, prev_node))
+            return dist
+
+        targets = [(owner, self.exits[owner]) for owner in range(2)] + \
+            [(0 if index < self.ruby_count else 1, cell) for index, cell in enumerate(self.stone_cells)]
+        self.distances = []
+        for remote_toggle_cost in [0, SOLVER_REMOTE_TOGGLE_COST]:
+            graphs = [get_reverse_edges(self.get_switch_graph(owner, remote_toggle_cost)) for owner in range(2)]
+            distances = [dijkstra(graphs[owner], cell) for owner, cell in targets]
+            self.distances.append({"exits": distances[:2], "stones": distances[2:]})
+
+    def estimate_player(self, owner, cell, own_stones, distances):
+        """Оценка пути игрока через все его камни до выхода (None - путь невозможен).
+           Используется максимум из двух оценок: вес минимального остовного дерева
+           на клетке игрока, камнях и выходе (любой такой путь сам является остовным деревом)
+           и наибольшая длина пути до одного камня и от него до выхода.
+           Клетки заданы вершинами графа с учётом состояния рычагов."""
+        offset = cell - cell % self.cell_count
+        exit_distances = distances["exits"][owner]
+        if exit_distances[cell] < 0:
+            return None
+        # Вершины дерева: камни и выход, расстояния до них от текущей клетки игрока
+        stone_indexes = []
+        while own_stones:
+            bit = own_stones & -own_stones
+            stone_indexes.append(bit.bit_length() - 1)
+            own_stones ^= bit
+        node_cells = [offset + self.stone_cells[index] for index in stone_indexes] + \
+            [offset + self.exits[owner]]
+        node_distances = [distances["stones"][index] for index in stone_indexes] + [exit_distances]
+
+        # Алгоритм Прима, начиная с клетки игрока
+        best = [node_dist[cell] for node_dist in node_distances]
+        if min(best) < 0:
+            return None
+        detour = max(best[node] + exit_distances[node_cells[node]] for node in range(len(node_cells)))
+        total = 0
+        remaining = list(range(len(node_cells)))
+        while remaining:
+            nearest = min(remaining, key=lambda node: best[node])
+            total += best[nearest]
+            remaining.remove(nearest)
+            node_dist = node_distances[nearest]
+            for node in remaining:
+                dist = node_dist[node_cells[node]]
+                if dist < best[node]:
+                    best[node] = dist
+        return max(total, detour)
+
+    def get_reachable(self, owner, node, permissions):
+        """Битовая маска вершин графа с учётом рычагов, достижимых игроком из вершины node.
+           permissions - битовая маска помощи другого игрока: биты 0-1 - он может открыть двери вида,
+           биты 2 + switches * 2 + kind - он может переключить рычаг вида kind при состоянии switches.
+           Дверь, соседнюю со своей кнопкой, игрок может открыть сам."""
+        key = (node, permissions)
+        mask = self.reachable_cache[owner].get(key)
+        if mask is not None:
+            return mask
+        cell_count = self.cell_count
+        neighbours = self.neighbours[owner]
+        mask = 1 << node
+        queue = deque([node])
+        while queue:
+            node = queue.popleft()
+            switches, cell = divmod(node, cell_count)
+            offset = switches * cell_count
+            next_nodes = []
+            for near_cell in neighbours[cell * 4:cell * 4 + 4]:
+                if near_cell < 0:
+                    continue
+                door_kind = self.door_kinds[near_cell]
+                if door_kind < 0 or permissions >> door_kind & 1 or self.button_kinds[cell] == door_kind:
+                    next_nodes.append(offset + near_cell)
+            for kind in range(2):
+                if self.portals[kind] is None:
+                    continue
+                input_cell, output_cell = self.get_input_portal(kind, switches)
+                if cell == input_cell:
+                    next_nodes.append(offset + output_cell)
+                if self.switch_kinds[cell] == kind or permissions >> (2 + switches * 2 + kind) & 1:
+                    next_nodes.append((switches ^ (1 << kind)) * cell_count + cell)
+            for near_node in next_nodes:
+                if not mask >> near_node & 1:
+                    mask |= 1 << near_node
+                    queue.append(near_node)
+        self.reachable_cache[owner][key] = mask
+        return mask
+
+    def get_permissions(self, mask):
+        """Помощь, которую может оказать игрок с множеством достижимых вершин mask"""
+        permissions = 0
+        for kind in range(2):
+            if mask & self.button_masks[kind] or mask & self.door_masks[kind]:
+                permissions |= 1 << kind
+            for switches in range(4):
+                if mask & self.switch_masks[kind][switches]:
+                    permissions |= 1 << (2 + switches * 2 + kind)
+        return permissions
+
+    def is_deadlock(self, cells, switches, stones):
+        """Проверка тупика: кто-то из игроков не может дойти до выхода или своего камня
+           даже с помощью другого игрока. Проверка приближённая (множества достижимых вершин
+           вычисляются с запасом), поэтому состояние, из которого уровень можно пройти, тупиком не считается."""
+        key = (cells[0], cells[1], switches)
+        # Камни, которые нельзя собрать из положения key (все камни - если нельзя дойти до выхода)
+        blocked_stones = self.deadlock_cache.get(key)
+        if blocked_stones is None:
+            blocked_stones = self.get_blocked_stones(cells, switches)
+            self.deadlock_cache[key] = blocked_stones
+        return blocked_stones < 0 or stones & blocked_stones != 0
+
+    def get_blocked_stones(self, cells, switches):
+        """Битовая маска камней, до которых владелец не может дойти из клеток cells даже с помощью
+           другого игрока (-1 - кто-то из игроков не может дойти до выхода)"""
+        nodes = [switches * self.cell_count + cell for cell in cells]
+        permissions = [0, 0]
+        while True:
+            masks = [self.get_reachable(owner, nodes[owner], permissions[owner]) for owner in range(2)]
+            new_permissions = [self.get_permissions(masks[1 - owner]) for owner in range(2)]
+            if new_permissions == permissions:
+                break
+            permissions = new_permissions
+        blocked_stones = 0
+        for owner in range(2):
+            if not masks[owner] & self.layer_repeat << self.exits[owner]:
+                return -1
+            for cell, bit in self.stone_bits[owner].items():
+                if not masks[owner] & self.layer_repeat << cell:
+                    blocked_stones |= bit
+        return blocked_stones
+
+    def estimate(self, state, informed=False):
+        """Оценка количества оставшихся ходов (None - цель недостижима).
+           Без informed оценка допустима, иначе учитывает направление порталов и может её превышать.
+           Оценки игроков кэшируются, так как они не зависят от положения другого игрока."""
+        cells, switches, stones = self.unpack(state)
+        distances = self.distances[informed]
+        offset = switches * self.cell_count if informed else 0
+        total = 0
+        for owner in range(2):
+            key = (offset + cells[owner], stones & self.player_stone_masks[owner])
+            cache = self.estimate_cache[informed][owner]
+            estimate = cache.get(key, -1)
+            if estimate == -1:
+                estimate = self.estimate_player(owner, *key, distances)
+                cache[key] = estimate
+            if estimate is None:
+                return None
+            total += estimate
+        if self.is_deadlock(cells, switches, stones):
+            return None
+        return total
+
+
+class SolverResult:
+    """Результат поиска решения уровня"""
+
+    def __init__(self, status, actions=None, states=0, duration=0.0, optimal=False):
+        self.status = status
+        self.actions = actions if actions is not None else []
+        self.states = states
+        self.duration = duration
+        # Признак того, что решение кратчайшее
+        self.optimal = optimal
+
+    def is_solved(self):
+        return self.status == SOLVER_SOLVED
+
+    def get_moves(self):
+        """Количество ходов решения (эталонное количество ходов уровня)"""
+        return sum(len(step) for step in self.actions) if self.is_solved() else None
+
+    def format_actions(self):
+        """Представление решения в текстовом формате.
+           Одновременные ходы обоих игроков объединяются знаком '+'."""
+        return " ".join("+".join(f"{PLAYER_NAMES[owner]}:{ACTION_NAMES[action]}" for owner, action in step)
+                        for step in self.actions)
+
+
+class Solver:
+    """Поиск кратчайшей последовательности ходов, проходящей уровень.
+       Сначала выполняется A* с допустимой оценкой (решение оптимально).
+       Если количество состояний превышает ограничение (attempt_states, для последней попытки -
+       max_states), поиск повторяется с увеличенным весом оценки: решение находится быстрее,
+       но может быть длиннее. Вес 0 соответствует поиску в ширину."""
+
+    def __init__(self, level, max_states=SOLVER_MAX_STATES, weights=SOLVER_WEIGHTS,
+                 attempt_states=SOLVER_ATTEMPT_STATES):
+        self.level = level
+        self.model = SolverModel(level)
+        self.max_states = max_states
+        self.weights = weights
+        self.attempt_states = attempt_states
+
+    def solve(self):
+        start_time = perf_counter()
+        model = self.model
+        if not model.is_complete():
+            return SolverResult(SOLVER_UNSOLVABLE, duration=perf_counter() - start_time)
+
+        model.calculate_distances()
+        result = SolverResult(SOLVER_UNSOLVABLE)
+        for index, weight in enumerate(self.weights):
+            last = index == len(self.weights) - 1
+            result = self.search(weight, self.max_states if last else min(self.attempt_states, self.max_states))
+            if result.status != SOLVER_LIMIT:
+                break
+        result.duration = perf_counter() - start_time
+        return result
+
+    def search(self, weight, max_states):
+        """Поиск A* с весом оценки weight и ограничением количества состояний max_states"""
+        model = self.model
+        start = model.get_start_state()
+        # При весе больше 1 решение не оптимально, поэтому используется уточнённая оценка
+        informed = weight > 1
+        start_estimate = model.estimate(start, informed)
+        if start_estimate is None:
+            return SolverResult(SOLVER_UNSOLVABLE)
+
+        # Посещённые состояния: состояние -> (предыдущее состояние, действие, длина пути)
+        visited = {start: (None, None, 0)}
+        # При равной оценке первыми раскрываются более длинные пути
+        queue = [(start_estimate * weight, 0, 0, 0, start)]
+        counter = 0
+        while queue:
+            _, _, _, moves, state = heapq.heappop(queue)
+            if visited[state][2] < moves:
+                continue
+            if model.is_goal(state):
+                return SolverResult(SOLVER_SOLVED, self.get_actions(visited, state),
+                                    len(visited), optimal=weight <= 1)
+
+            for actions, cost, next_state in model.get_successors(state):
+                next_moves = moves + cost
+                old = visited.get(next_state)
+                if old is not None and old[2] <= next_moves:
+                    continue
+                next_estimate = model.estimate(next_state, informed)
+                if next_estimate is None:
+                    continue
+                visited[next_state] = (state, actions, next_moves)
+                if len(visited) > max_states:
+                    return SolverResult(SOLVER_LIMIT, states=len(visited))
+                counter += 1
+                heapq.heappush(queue, (next_moves + next_estimate * weight, -next_moves, counter,
+                                       next_moves, next_state))
+
+        return SolverResult(SOLVER_UNSOLVABLE, states=len(visited))
+
+    @staticmethod
+    def get_actions(visited, state):
+        """Восстановление последовательности шагов по посещённым состояниям.
+           Шаг - кортеж одновременных действий игроков."""
+        actions = []
+        while True:
+            prev_state, action, _ = visited[state]
+            if prev_state is None:
+                break
+            actions.append(action)
+            state = prev_state
+        actions.reverse()
+        return actions
+
+
+def verify_solution(level, actions, max_ticks_per_action=100):
+    """Проверка решения на симуляции игры.
+       Игрок удерживает CTRL, пока стоит на камне, кнопке или выходе,
+       а с порталами и рычагами взаимодействует только по действию 'use'."""
+    simulation = Simulation(level)
+    players = [simulation.fire_player, simulation.water_player]
+
+    def tick(use_player=None):
+        for player in players:
+            element = simulation.get_player_element(player)
+            if player is use_player or isinstance(element, (Stone, DoorButton, Exit)):
+                simulation.interact(player)
+        simulation.update()
+
+    for step in actions:
+        use_player = None
+        for owner, action in step:
+            if action == ACTION_USE:
+                use_player = players[owner]
+            else:
+                simulation.move_player(players[owner], *ACTION_DIRECTIONS[action])
+        ticks = 0
+        tick(use_player)
+        while any(player.is_walking() for player in players) and ticks < max_ticks_per_action:
+            tick()
+            ticks += 1
+        # Дополнительный такт, чтобы игроки успели взаимодействовать с элементами в новой клетке
+        tick()
+        if simulation.game_over:
+            break
+
+    for _ in range(3):
+        if simulation.game_over:
+            break
+        tick()
+    return simulation.win_game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск решения уровней игры")
+    parser.add_argument("levels", nargs="+", help="файлы уровней")
+    parser.add_argument("--bfs", action="store_true", help="поиск в ширину без оценки расстояния")
+    parser.add_argument("--optimal", action="store_true",
+                        help="искать только кратчайшее решение (без попыток с увеличенным весом оценки); "
+                             "на сложных уровнях занимает десятки секунд или упирается в --max-states")
+    parser.add_argument("--max-states", type=int, default=SOLVER_MAX_STATES,
+                        help="ограничение количества хранимых состояний")
+    parser.add_argument("--show", action="store_true", help="вывести последовательность ходов")
+    parser.add_argument("--verify", action="store_true", help="проверить решение на симуляции игры")
+    args = parser.parse_args()
+
+    all_solved = True
+    for filename in args.levels:
+        level = Level(os.path.abspath(filename))
+        weights = (0,) if args.bfs else (1,) if args.optimal else SOLVER_WEIGHTS
+        result = Solver(level, args.max_states, weights).solve()
+        line = f"{filename}: {result.status}, moves: {result.get_moves()}, optimal: {result.optimal}, " \
+               f"states: {result.states}, time: {result.duration:.3f} s"
+        if args.verify and result.is_solved():
+            line += f", verified: {verify_solution(level, result.actions)}"
+        print(line)
+        if args.show and result.is_solved():
+            print(result.format_actions())
+        all_solved = all_solved and result.is_solved()
+
+    sys.exit(0 if all_solved else 1)
+
+
+if __name__ == "__main__":
+    main()
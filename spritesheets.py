@@ -1,19 +1,280 @@
+import json
+import hashlib
 import pygame
+from typing import Optional
 from constants import *
 from functions import get_empty_image
 
+# Версия формата атласа в кэше
+ATLAS_VERSION = 1
+
+# Виды фрагментов по прозрачности
+TILE_KIND_OPAQUE = "opaque"
+TILE_KIND_COLORKEY = "colorkey"
+TILE_KIND_ALPHA = "alpha"
+# Цвета, из которых выбирается прозрачный цвет (colorkey) фрагмента
+COLORKEY_CANDIDATES = [(255, 0, 255), (0, 255, 255), (255, 255, 0), (1, 2, 3)]
+
+
+def get_tile_kind(tile):
+    """Определение вида фрагмента по альфа-каналу: полностью непрозрачный,
+       с полностью прозрачными и непрозрачными пикселями или с полупрозрачностью"""
+    alphas = set(pygame.image.tostring(tile, "RGBA")[3::4])
+    if alphas <= {255}:
+        return TILE_KIND_OPAQUE
+    if alphas <= {0, 255}:
+        return TILE_KIND_COLORKEY
+    return TILE_KIND_ALPHA
+
+
+def get_colorkey(tile):
+    """Цвет, которого нет среди непрозрачных пикселей фрагмента, или None"""
+    data = pygame.image.tostring(tile, "RGBA")
+    colors = {data[i:i + 3] for i in range(0, len(data), 4) if data[i + 3]}
+    for color in COLORKEY_CANDIDATES:
+        if bytes(color) not in colors:
+            return color
+    return None
+
+
+def optimize_tile(tile):
+    """Перевод фрагмента в формат экрана для быстрого вывода.
+       Непрозрачный фрагмент выводится без смешивания, фрагмент без полупрозрачности -
+       с прозрачным цветом и RLE-сжатием. Возвращает поверхность и вид фрагмента."""
+    kind = get_tile_kind(tile)
+    if kind == TILE_KIND_OPAQUE:
+        return tile.convert(), kind
+    if kind == TILE_KIND_COLORKEY:
+        colorkey = get_colorkey(tile)
+        if colorkey is not None:
+            image = pygame.Surface(tile.get_size()).convert()
+            image.fill(colorkey)
+            image.blit(tile, (0, 0))
+            image.set_colorkey(colorkey, pygame.RLEACCEL)
+            return image, kind
+    return tile, TILE_KIND_ALPHA
+
+
+class TextureAtlas:
+    """Общая текстура, в которую упакованы наборы спрайтов.
+       Наборы и их фрагменты выдаются как подповерхности атласа без копирования пикселей.
+       Собранный атлас сохраняется в кэше и при неизменных файлах загружается одним файлом."""
+
+    def __init__(self, file_names):
+        self.file_names = list(file_names)
+        self.surface: Optional[pygame.Surface] = None
+        # Положение набора спрайтов в атласе по имени файла
+        self.index = dict()
+        self.load_time = 0.0
+
+        start_time = pygame.time.get_ticks()
+        key = self.get_key()
+        if not self.load(key):
+            self.build()
+            self.save(key)
+        self.load_time = pygame.time.get_ticks() - start_time
+
+    def get_key(self):
+        """Хэш содержимого файлов наборов спрайтов"""
+        key = hashlib.sha256(f"{ATLAS_VERSION}:{ATLAS_WIDTH}".encode())
+        for file_name in self.file_names:
+            with open(os.path.join(IMG_DIR, file_name), "rb") as f:
+                key.update(file_name.encode() + b"\0" + f.read())
+        return key.hexdigest()
+
+    def build(self):
+        """Упаковка наборов спрайтов по полкам: наборы сортируются по высоте
+           и размещаются слева направо, пока помещаются по ширине атласа"""
+        images = {file_name: pygame.image.load(os.path.join(IMG_DIR, file_name))
+                  for file_name in self.file_names}
+        order = sorted(self.file_names, key=lambda name: (-images[name].get_height(), -images[name].get_width()))
+        x, y, shelf_height, width = 0, 0, 0, 0
+        for file_name in order:
+            image_width, image_height = images[file_name].get_size()
+            if x + image_width > ATLAS_WIDTH and x > 0:
+                x, y, shelf_height = 0, y + shelf_height, 0
+            self.index[file_name] = pygame.Rect(x, y, image_width, image_height)
+            x += image_width
+            width = max(width, x)
+            shelf_height = max(shelf_height, image_height)
+
+        self.surface = get_empty_image(max(width, 1), max(y + shelf_height, 1))
+        for file_name, rect in self.index.items():
+            self.surface.blit(images[file_name], rect)
+        self.surface = self.surface.convert_alpha()
+
+    def get_filenames(self, key):
+        return os.path.join(ATLAS_CACHE_DIR, key + ".png"), os.path.join(ATLAS_CACHE_DIR, key + ".json")
+
+    def load(self, key):
+        """Загрузка собранного атласа из кэша"""
+        image_filename, index_filename = self.get_filenames(key)
+        try:
+            with open(index_filename) as f:
+                index = {file_name: pygame.Rect(rect) for file_name, rect in json.load(f).items()}
+            surface = pygame.image.load(image_filename).convert_alpha()
+        except (OSError, ValueError, TypeError, pygame.error):
+            return False
+        if set(index) != set(self.file_names) or \
+                any(not surface.get_rect().contains(rect) for rect in index.values()):
+            return False
+        self.surface = surface
+        self.index = index
+        return True
+
+    def save(self, key):
+        """Сохранение атласа в кэше. Ошибки записи не мешают игре."""
+        image_filename, index_filename = self.get_filenames(key)
+        try:
+            os.makedirs(ATLAS_CACHE_DIR, exist_ok=True)
+            pygame.image.save(self.surface, image_filename)
+            with open(index_filename, "w") as f:
+                json.dump({file_name: list(rect) for file_name, rect in self.index.items()}, f)
+        except (OSError, pygame.error):
+            pass
+
+    def contains(self, file_name, rect=None):
+        """Проверка, что набор спрайтов (или его фрагмент целиком) есть в атласе"""
+        sheet_rect = self.index.get(os.path.basename(file_name))
+        if sheet_rect is None:
+            return False
+        return rect is None or sheet_rect.contains(self.get_rect(file_name, rect))
+
+    def get_rect(self, file_name, rect=None):
+        """Положение набора спрайтов или его фрагмента в атласе"""
+        sheet_rect = self.index[os.path.basename(file_name)]
+        if rect is None:
+            return sheet_rect.copy()
+        return pygame.Rect(rect).move(sheet_rect.topleft)
+
+    def get_image(self, file_name, rect=None):
+        """Подповерхность атласа с набором спрайтов или его фрагментом"""
+        return self.surface.subsurface(self.get_rect(file_name, rect))
+
+
+class AssetCache:
+    """Общий для всего процесса кэш декодированных изображений.
+       Каждый файл декодируется один раз, а фрагменты (тайлы) выдаются
+       всем спрайтам как общие поверхности, которые нельзя изменять."""
+
+    # Атлас с наборами спрайтов из ATLAS_SPRITE_FILES (создаётся при первом обращении)
+    atlas: Optional[TextureAtlas] = None
+    # Декодированные наборы спрайтов по пути к файлу
+    sheets = {}
+    # Фрагменты наборов по ключу (путь к файлу, x, y, ширина, высота)
+    tiles = {}
+    # Количество фрагментов каждого вида по категории (имени набора спрайтов)
+    tile_kinds = {}
+
+    # Счётчики обращений к кэшу и объёма декодированных данных
+    hits = 0
+    misses = 0
+    bytes_used = 0
+
+    @staticmethod
+    def get_surface_size(surface):
+        """Объём памяти, занимаемый пикселями поверхности"""
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    @classmethod
+    def get_atlas(cls):
+        """Получение атласа наборов спрайтов"""
+        if cls.atlas is None:
+            cls.atlas = TextureAtlas(ATLAS_SPRITE_FILES)
+            cls.bytes_used += cls.get_surface_size(cls.atlas.surface)
+        return cls.atlas
+
+    @classmethod
+    def is_in_atlas(cls, file_name, rect=None):
+        """Проверка, что набор спрайтов (или его фрагмент) упакован в атлас"""
+        return os.path.dirname(os.path.abspath(file_name)) == os.path.abspath(IMG_DIR) and \
+            os.path.basename(file_name) in ATLAS_SPRITE_FILES and cls.get_atlas().contains(file_name, rect)
+
+    @classmethod
+    def get_sheet(cls, file_name):
+        """Получение декодированного набора спрайтов по имени файла.
+           Наборы из атласа выдаются как его подповерхности."""
+        sheet = cls.sheets.get(file_name)
+        if sheet is not None:
+            cls.hits += 1
+            return sheet
+        cls.misses += 1
+        if cls.is_in_atlas(file_name):
+            sheet = cls.get_atlas().get_image(file_name)
+        else:
+            sheet = pygame.image.load(file_name).convert_alpha()
+            cls.bytes_used += cls.get_surface_size(sheet)
+        cls.sheets[file_name] = sheet
+        return sheet
+
+    @classmethod
+    def get_tile(cls, file_name, x, y, width, height):
+        """Получение общего фрагмента набора спрайтов"""
+        key = (file_name, x, y, width, height)
+        tile = cls.tiles.get(key)
+        if tile is not None:
+            cls.hits += 1
+            return tile
+        cls.misses += 1
+        if cls.is_in_atlas(file_name, (x, y, width, height)):
+            # Фрагмент атласа без копирования пикселей
+            tile = cls.get_atlas().get_image(file_name, (x, y, width, height))
+        else:
+            tile = get_empty_image(width, height)
+            tile.blit(cls.get_sheet(file_name), (0, 0), pygame.Rect(x, y, width, height))
+            cls.bytes_used += cls.get_surface_size(tile)
+        if OPAQUE_FAST_PATH:
+            optimized_tile, kind = optimize_tile(tile)
+            if optimized_tile is not tile:
+                cls.bytes_used += cls.get_surface_size(optimized_tile)
+                tile = optimized_tile
+        else:
+            kind = TILE_KIND_ALPHA
+        category = os.path.splitext(os.path.basename(file_name))[0]
+        kinds = cls.tile_kinds.setdefault(category, dict.fromkeys(
+            [TILE_KIND_OPAQUE, TILE_KIND_COLORKEY, TILE_KIND_ALPHA], 0))
+        kinds[kind] += 1
+        cls.tiles[key] = tile
+        return tile
+
+    @classmethod
+    def get_stats(cls):
+        """Статистика использования кэша"""
+        return {"hits": cls.hits, "misses": cls.misses, "bytes": cls.bytes_used,
+                "sheets": len(cls.sheets), "tiles": len(cls.tiles),
+                "atlas_size": cls.atlas.surface.get_size() if cls.atlas is not None else None,
+                "atlas_load_ms": cls.atlas.load_time if cls.atlas is not None else None}
+
+    @classmethod
+    def get_tile_report(cls):
+        """Отчёт по категориям: сколько фрагментов выводится без смешивания (opaque),
+           с прозрачным цветом (colorkey) и с альфа-смешиванием (alpha)"""
+        report = {category: dict(kinds) for category, kinds in sorted(cls.tile_kinds.items())}
+        report["total"] = {kind: sum(kinds[kind] for kinds in cls.tile_kinds.values())
+                           for kind in [TILE_KIND_OPAQUE, TILE_KIND_COLORKEY, TILE_KIND_ALPHA]}
+        return report
+
+    @classmethod
+    def clear(cls):
+        """Очистка кэша и сброс счётчиков"""
+        cls.atlas = None
+        cls.sheets.clear()
+        cls.tiles.clear()
+        cls.tile_kinds.clear()
+        cls.hits, cls.misses, cls.bytes_used = 0, 0, 0
+
 
 class SpriteSheet:
     """Набор спрайтов"""
 
     def __init__(self, file_name):
-        self.sprite_sheet = pygame.image.load(file_name).convert_alpha()
+        self.file_name = file_name
+        self.sprite_sheet = AssetCache.get_sheet(file_name)
 
     def get_image(self, x, y, width, height):
-        """Получение фрагмента из набора спрайтов, заданного координатами и размерами"""
-        image = get_empty_image(width, height)
-        image.blit(self.sprite_sheet, (0, 0), pygame.Rect(x, y, width, height))
-        return pygame.transform.scale(image, (width, height))
+        """Получение фрагмента из набора спрайтов, заданного координатами и размерами.
+           Фрагмент общий для всех спрайтов, поэтому изменять его нельзя."""
+        return AssetCache.get_tile(self.file_name, x, y, width, height)
 
     def get_cell_image(self, col, row, width=SPRITE_SIZE, height=SPRITE_SIZE):
         """Получение фрагмента, заданного столбцом и строкой"""
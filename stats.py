@@ -0,0 +1,6 @@
+def get_percentile(sorted_values, percentile):
+    """Процентиль по методу ближайшего ранга для отсортированного списка"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * percentile // 100))
+    return sorted_values[int(rank) - 1]
@@ -0,0 +1,129 @@
+import queue
+import hashlib
+import threading
+import pygame
+from constants import *
+from level import Level
+
+# Версия изображения миниатюр. Увеличивается при изменении отрисовки, чтобы кэш не использовался.
+THUMBNAIL_VERSION = 2
+THUMBNAIL_SIZE = (VIEW_SIZE * THUMBNAIL_TILE_SIZE, VIEW_SIZE * THUMBNAIL_TILE_SIZE)
+
+# Событие, которое рабочий поток отправляет, когда готова очередная миниатюра
+EVENT_THUMBNAIL_READY = pygame.USEREVENT + 1
+
+
+def render_thumbnail(level):
+    """Отрисовка миниатюры уровня в байты RGB (без pygame).
+       Каждая клетка уровня - квадрат THUMBNAIL_TILE_SIZE пикселей одного цвета.
+       Уровень больше видимой области уменьшается: клетка миниатюры показывает квадрат
+       scale x scale клеток уровня (его левую верхнюю клетку или элемент внутри квадрата)."""
+    width, height = THUMBNAIL_SIZE
+    tile_size = THUMBNAIL_TILE_SIZE
+    data = bytearray(bytes(THUMBNAIL_COLORS_DICT[LEVEL_BLOCK_EMPTY]) * (width * height))
+    scale = -(-max(level.width, level.height, 1) // VIEW_SIZE)
+    col_offset = max((VIEW_SIZE - -(-level.width // scale)) // 2, 0)
+    row_offset = max((VIEW_SIZE - -(-level.height // scale)) // 2, 0)
+
+    cells = dict()
+    for row in range(0, level.height, scale):
+        line = level.blocks[row]
+        for col in range(0, level.width, scale):
+            cells[col // scale, row // scale] = line[col]
+    for elem, positions in level.elem_pos_dict.items():
+        for col, row in positions:
+            cells[col // scale, row // scale] = elem
+    for elem, pos in [(LEVEL_PLAYER_FIRE, level.fire_player_pos), (LEVEL_PLAYER_WATER, level.water_player_pos)]:
+        if pos is not None:
+            cells[pos[0] // scale, pos[1] // scale] = elem
+
+    for (col, row), symbol in cells.items():
+        line = bytes(THUMBNAIL_COLORS_DICT.get(symbol, THUMBNAIL_COLORS_DICT[LEVEL_BLOCK_FLOOR])) * tile_size
+        x = (col + col_offset) * tile_size
+        y = (row + row_offset) * tile_size
+        for pixel_row in range(y, y + tile_size):
+            start = (pixel_row * width + x) * 3
+            data[start:start + len(line)] = line
+    return bytes(data)
+
+
+def get_thumbnail_filename(source):
+    """Имя файла миниатюры в кэше по хэшу текста уровня"""
+    key = f"{THUMBNAIL_VERSION}:{THUMBNAIL_TILE_SIZE}:{VIEW_SIZE}:".encode() + source
+    return os.path.join(THUMBNAIL_CACHE_DIR, hashlib.sha256(key).hexdigest() + ".rgb")
+
+
+def load_thumbnail(filename):
+    """Получение миниатюры уровня в байтах RGB: из кэша на диске или отрисовкой уровня"""
+    with open(filename, "rb") as f:
+        source = f.read()
+    thumbnail_filename = get_thumbnail_filename(source)
+    size = THUMBNAIL_SIZE[0] * THUMBNAIL_SIZE[1] * 3
+    try:
+        with open(thumbnail_filename, "rb") as f:
+            data = f.read()
+        if len(data) == size:
+            return data
+    except OSError:
+        pass
+
+    data = render_thumbnail(Level(os.path.abspath(filename)))
+    # Запись через временный файл, чтобы не оставить в кэше неполную миниатюру
+    temp_filename = f"{thumbnail_filename}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+        with open(temp_filename, "wb") as f:
+            f.write(data)
+        os.replace(temp_filename, thumbnail_filename)
+    except OSError:
+        pass
+    return data
+
+
+class ThumbnailWorker:
+    """Фоновый поток, подготавливающий миниатюры уровней.
+       Последние запрошенные миниатюры подготавливаются первыми.
+       Поверхности pygame создаются в основном потоке в get_thumbnails()."""
+
+    def __init__(self):
+        self.requests = queue.LifoQueue()
+        self.results = queue.Queue()
+        self.requested = set()
+        self.thread = None
+
+    def request(self, number, filename):
+        """Запрос миниатюры уровня с номером number"""
+        if number in self.requested:
+            return
+        self.requested.add(number)
+        self.requests.put((number, filename))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            number, filename = self.requests.get()
+            try:
+                data = load_thumbnail(filename)
+            except (OSError, ValueError):
+                data = None
+            self.results.put((number, data))
+            try:
+                pygame.event.post(pygame.event.Event(EVENT_THUMBNAIL_READY))
+            except pygame.error:
+                pass
+
+    def get_thumbnails(self):
+        """Получение готовых миниатюр: словарь номер уровня -> поверхность (None - уровень не загружен)"""
+        thumbnails = dict()
+        while True:
+            try:
+                number, data = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if data is not None:
+                thumbnails[number] = pygame.image.frombuffer(data, THUMBNAIL_SIZE, "RGB").convert()
+            else:
+                thumbnails[number] = None
+        return thumbnails
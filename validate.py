@@ -0,0 +1,232 @@
+import sys
+import json
+import glob
+import hashlib
+import argparse
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from constants import *
+from level import Level
+from solver import Solver, SOLVER_MAX_STATES
+
+# Версия формата результатов проверки. Увеличивается при изменении проверок или решателя,
+# чтобы результаты из кэша не использовались.
+VALIDATE_VERSION = 2
+# Наибольшая ширина и высота уровня, при которой ищется решение. Поиск на больших уровнях
+# может занимать минуты и гигабайты памяти, поэтому для них проверяется только текст уровня.
+VALIDATE_MAX_SOLVE_SIZE = 100
+# Состояние проверки уровня, решение которого не искалось из-за размера
+VALIDATE_SOLVE_SKIPPED = "skipped"
+
+# Элементы, которые должны присутствовать на уровне ровно в одном экземпляре
+REQUIRED_SINGLE_ELEMS = [LEVEL_PLAYER_FIRE, LEVEL_PLAYER_WATER,
+                         LEVEL_ELEM_FIRE_EXIT, LEVEL_ELEM_WATER_EXIT]
+# Пары порталов: входной и выходной
+PORTAL_PAIRS = [(LEVEL_ELEM_INPUT_PORTAL_1, LEVEL_ELEM_OUTPUT_PORTAL_1),
+                (LEVEL_ELEM_INPUT_PORTAL_2, LEVEL_ELEM_OUTPUT_PORTAL_2)]
+# Двери и открывающие их кнопки
+DOOR_BUTTONS = [(LEVEL_ELEM_DOOR_1, LEVEL_ELEM_DOORBUTTON_1),
+                (LEVEL_ELEM_DOOR_2, LEVEL_ELEM_DOORBUTTON_2)]
+
+
+def get_content_hash(data):
+    """Хэш содержимого файла уровня"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def check_level_text(lines):
+    """Проверка условий, которые игра предполагает выполненными при загрузке уровня.
+       Проверяется исходный текст, так как Level оставляет только последний из повторяющихся элементов."""
+    errors = []
+    counts = {}
+    for line in lines:
+        for elem in line:
+            counts[elem] = counts.get(elem, 0) + 1
+
+    for elem in REQUIRED_SINGLE_ELEMS:
+        if counts.get(elem, 0) != 1:
+            errors.append(f"'{elem}' must appear exactly once, found {counts.get(elem, 0)}")
+    for input_elem, output_elem in PORTAL_PAIRS:
+        input_count, output_count = counts.get(input_elem, 0), counts.get(output_elem, 0)
+        if input_count > 1 or output_count > 1 or input_count != output_count:
+            errors.append(f"portals '{input_elem}'/'{output_elem}' must form a pair, "
+                          f"found {input_count}/{output_count}")
+    for door_elem, button_elem in DOOR_BUTTONS:
+        if counts.get(door_elem, 0) and not counts.get(button_elem, 0):
+            errors.append(f"doors '{door_elem}' have no button '{button_elem}'")
+    return errors
+
+
+def create_result(filename):
+    """Результат проверки уровня до выполнения проверок"""
+    return {"filename": filename, "errors": [], "status": None, "moves": None, "optimal": False,
+            "size": None, "load_time": 0.0, "solve_time": 0.0}
+
+
+def validate_level(filename, max_states=SOLVER_MAX_STATES, solve=True, max_solve_size=VALIDATE_MAX_SOLVE_SIZE):
+    """Проверка одного уровня. Выполняется в отдельном процессе,
+       поэтому результат - словарь, который также сохраняется в кэше.
+       Решение уровня шире или выше max_solve_size клеток не ищется."""
+    result = create_result(filename)
+    start_time = perf_counter()
+    try:
+        with open(filename, "rb") as f:
+            data = f.read()
+        result["hash"] = get_content_hash(data)
+        lines = [line.rstrip() for line in data.decode().splitlines()]
+        result["errors"] = check_level_text(lines)
+        level = Level(os.path.abspath(filename))
+    except (OSError, UnicodeDecodeError) as error:
+        result["errors"].append(f"cannot load level: {error}")
+        return result
+    result["load_time"] = perf_counter() - start_time
+    result["size"] = [level.width, level.height]
+
+    if solve and not result["errors"] and max(level.width, level.height) > max_solve_size:
+        result["status"] = VALIDATE_SOLVE_SKIPPED
+    elif solve and not result["errors"]:
+        try:
+            solution = Solver(level, max_states).solve()
+        except MemoryError:
+            result["errors"].append("not enough memory to solve the level")
+            return result
+        result["status"] = solution.status
+        result["moves"] = solution.get_moves()
+        result["optimal"] = solution.optimal
+        result["solve_time"] = solution.duration
+        if not solution.is_solved():
+            result["errors"].append(f"level is not solvable ({solution.status})")
+    return result
+
+
+class ValidateCache:
+    """Кэш результатов проверки уровней по хэшу содержимого файла"""
+
+    def __init__(self, filename=os.path.join(CACHE_DIR, JSON_FILE_VALIDATE_CACHE)):
+        self.filename = filename
+        self.results = dict()
+        self.load()
+
+    @staticmethod
+    def get_key(content_hash, max_states, solve, max_solve_size):
+        options = f"{max_states}:{max_solve_size}" if solve else "nosolve"
+        return f"{VALIDATE_VERSION}:{content_hash}:{options}"
+
+    def load(self):
+        """Загрузка кэша из файла. Повреждённый кэш игнорируется."""
+        try:
+            with open(self.filename) as f:
+                self.results = json.load(f)
+        except (OSError, ValueError):
+            self.results = dict()
+
+    def save(self):
+        """Сохранение кэша через временный файл, чтобы не повредить его при прерывании"""
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, "w") as f:
+            json.dump(self.results, f, indent=1)
+        os.replace(temp_filename, self.filename)
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def set(self, key, result):
+        self.results[key] = result
+
+
+def get_level_files():
+    """Файлы уровней в папке уровней в порядке номеров"""
+    def get_number(filename):
+        name = os.path.splitext(os.path.basename(filename))[0]
+        digits = "".join(ch for ch in name if ch.isdigit())
+        return int(digits) if digits else 0, name
+
+    return sorted(glob.glob(os.path.join(LEVELS_DIR, "*.txt")), key=get_number)
+
+
+def format_result(result, cached=False):
+    """Строка с результатом проверки уровня"""
+    line = f"{result['filename']}: {'ERROR' if result['errors'] else 'OK'}"
+    if result["moves"] is not None:
+        line += f", moves: {result['moves']}{'' if result['optimal'] else ' (not optimal)'}"
+    elif result["status"] == VALIDATE_SOLVE_SKIPPED:
+        line += f", solve skipped ({result['size'][0]}x{result['size'][1]} level)"
+    line += f", load: {result['load_time']:.3f} s, solve: {result['solve_time']:.3f} s"
+    if cached:
+        line += ", cached"
+    for error in result["errors"]:
+        line += f"\n    {error}"
+    return line
+
+
+def validate(filenames, jobs=None, max_states=SOLVER_MAX_STATES, solve=True, use_cache=True, output=print,
+             max_solve_size=VALIDATE_MAX_SOLVE_SIZE):
+    """Проверка уровней в пуле процессов.
+       Результаты выводятся по мере готовности, неизменённые уровни берутся из кэша.
+       Если процесс проверки аварийно завершился (например, из-за нехватки памяти),
+       незавершённые уровни отмечаются ошибкой."""
+    cache = ValidateCache() if use_cache else None
+    results = []
+    pending = []
+    for filename in filenames:
+        try:
+            with open(filename, "rb") as f:
+                key = ValidateCache.get_key(get_content_hash(f.read()), max_states, solve, max_solve_size)
+        except OSError:
+            key = None
+        result = cache.get(key) if cache is not None and key is not None else None
+        if result is not None:
+            result = dict(result, filename=filename)
+            output(format_result(result, cached=True))
+            results.append(result)
+        else:
+            pending.append(filename)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(validate_level, filename, max_states, solve, max_solve_size): filename
+                       for filename in pending}
+            try:
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        result = create_result(futures[future])
+                        result["errors"].append("validation process terminated")
+                    output(format_result(result))
+                    results.append(result)
+                    if cache is not None and "hash" in result:
+                        key = ValidateCache.get_key(result["hash"], max_states, solve, max_solve_size)
+                        cache.set(key, result)
+            finally:
+                # Кэш сохраняется один раз, в том числе при прерывании проверки
+                if cache is not None:
+                    cache.save()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка набора уровней игры")
+    parser.add_argument("levels", nargs="*", help="файлы уровней (по умолчанию все уровни игры)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="количество процессов")
+    parser.add_argument("--max-states", type=int, default=SOLVER_MAX_STATES,
+                        help="ограничение количества хранимых состояний при поиске решения")
+    parser.add_argument("--max-solve-size", type=int, default=VALIDATE_MAX_SOLVE_SIZE,
+                        help="наибольшая ширина и высота уровня, при которой ищется решение")
+    parser.add_argument("--no-solve", action="store_true", help="не проверять проходимость уровней")
+    parser.add_argument("--no-cache", action="store_true", help="не использовать кэш результатов")
+    args = parser.parse_args()
+
+    filenames = args.levels or get_level_files()
+    start_time = perf_counter()
+    results = validate(filenames, args.jobs, args.max_states, not args.no_solve, not args.no_cache,
+                       max_solve_size=args.max_solve_size)
+    failed = sum(1 for result in results if result["errors"])
+    print(f"{len(results)} levels, {failed} with errors, {perf_counter() - start_time:.3f} s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()